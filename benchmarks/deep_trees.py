@@ -0,0 +1,72 @@
+from typing import Callable, Dict
+import sys
+import time
+
+import click
+
+from mathgap.generation_util import *
+from mathgap.mathwordproblems import MathWordProblem
+from mathgap.natlang.templates.template import WHITESPACE
+from mathgap.trees.generators import GeneralGenerator
+
+# ruleset-name => (ruleset, start-types) of the rulesets that produce linear trees
+RULESETS = {
+    "COMP_RULESET": (COMP_RULESET, CONT_START_TYPE),
+    "TRANSFER_RULESET": (TRANSFER_RULESET, CONT_START_TYPE),
+}
+
+def timed(stage: str, fn: Callable, times: Dict[str, float]):
+    start = time.perf_counter()
+    result = fn()
+    times[stage] = time.perf_counter() - start
+    print(f"{stage:>16}: {times[stage]:8.2f}s", flush=True)
+    return result
+
+@click.command()
+@click.option("--depth", default=1000, help="Depth of the linear tree")
+@click.option("--ruleset", default="COMP_RULESET", type=click.Choice(list(RULESETS.keys())), help="Which ruleset the linear tree is built from")
+@click.option("--budget", default=60.0, help="Maximum total time (in seconds) of all stages")
+@click.option("-s", "--seed", default=140499, help="The seed to be used")
+def main(depth: int, ruleset: str, budget: float, seed: int):
+    """
+        Generates, instantiates and renders a single very deep linear tree and exits with a non-zero code
+        if any stage hits the recursion limit or all stages together exceed the budget
+    """
+    inference_rules, start_types = RULESETS[ruleset]
+    # NOTE: time-ordered bookkeeping rebuilds the time-dag after each expansion, which is too slow for trees of this depth
+    generator = GeneralGenerator(start_types=start_types, inference_rules=inference_rules, rule_sampling_policy=UNIFORM_POLICY,
+                                 stopping_criterion=BranchDepthCriterion(depth), comp_same_entity_prob=1.0, time_ordered_bookkeeping=False)
+    # NOTE: the default vocabulary doesn't have enough agents for one per level, the inner values grow with the depth
+    instantiator = default_instantiator(leaf_min_value=2, leaf_max_value=10, inner_min_value=2, inner_max_value=10**9, strategy="constructive",
+                                        agents=[f"Person{i}" for i in range(depth + 1)])
+    ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer = default_templates_and_samplers(end_of_deduction_step_separator=WHITESPACE)
+
+    times = {}
+    try:
+        tree = timed("generate", lambda: generator.generate(seed=seed), times)
+        instantiation = timed("instantiate", lambda: instantiator.instantiate(tree, seed=seed), times)
+
+        answer = tree.root_node.logicalform.get_quantities()[0]
+        parameters = list(answer.free_variables)
+        timed("eval", lambda: answer.eval(instantiation.copy()), times)
+        timed("grad", lambda: answer.grad(parameters, instantiation.copy()), times)
+        timed("str", lambda: answer.to_str(instantiation.copy(), depth=depth), times)
+
+        mwp = MathWordProblem(tree=tree, instantiation=instantiation, ps_template_sampler=ps_template_sampler, answers_template_sampler=ps_answers_template_sampler,
+                              ps_renderer=ps_renderer, rt_template_sampler=rt_template_sampler, rt_renderer=rt_renderer)
+        timed("order", lambda: mwp.sample_problem_order(CANONICAL_ORDER_SAMPLER), times)
+        timed("problem", lambda: mwp.problem_as_nl(), times)
+        timed("answers", lambda: mwp.answers_as_nl(), times)
+        timed("reasoning_trace", lambda: mwp.reasoning_trace_as_nl(), times)
+    except RecursionError:
+        print(f"FAIL: hit the recursion limit after {', '.join(times.keys()) or 'no stage'}")
+        sys.exit(1)
+
+    total = sum(times.values())
+    print(f"depth {tree.depth}, {len(tree.node_by_id)} nodes: total {total:.2f}s (budget {budget:.0f}s)")
+    if total > budget:
+        print(f"FAIL: exceeded the budget by {total - budget:.2f}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from typing import Callable, List, Tuple
+import statistics
+import time
+
+import click
+
+from mathgap.expressions import Expr, Variable, Sum, topological_order, weighted_grad
+from mathgap.instantiate.instantiation import Instantiation
+
+def wide_sum_tree(nr_parameters: int, fan_out: int) -> Tuple[List[str], List[Expr]]:
+    """
+        Builds nested sums over nr_parameters variables (as in part-whole-heavy trees, where each whole is the sum of its parts)
+        Returns the parameters and the inner expressions (i.e. all sums)
+    """
+    parameters = [f"x{i}" for i in range(nr_parameters)]
+    level: List[Expr] = [Variable(p) for p in parameters]
+    inner = []
+    while len(level) > 1:
+        level = [Sum(level[i:i+fan_out]) if len(level[i:i+fan_out]) > 1 else level[i] for i in range(0, len(level), fan_out)]
+        inner.extend(e for e in level if isinstance(e, Sum))
+    return parameters, inner
+
+def measure(fn: Callable[[Instantiation], None], instantiation: Instantiation, repeats: int) -> float:
+    """ Median wall-time (in seconds) of fn on a fresh copy of the instantiation (s.t. no memoized gradients are reused) """
+    times = []
+    for _ in range(repeats):
+        fresh = instantiation.copy()
+        start = time.perf_counter()
+        fn(fresh)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+@click.command()
+@click.option("--sizes", default="10,100,1000", help="Comma-separated numbers of parameters")
+@click.option("--fan-out", default=4, help="How many parts each sum has")
+@click.option("--repeats", default=5, help="How many times each measurement is repeated (the median is reported)")
+def main(sizes: str, fan_out: int, repeats: int):
+    """ Compares dense and sparse gradients (per quantity) as well as the reverse-mode sweep over all quantities (as used by cpga) """
+    print(f"{'params':>8} {'quantities':>10} {'dense [ms]':>12} {'sparse [ms]':>12} {'reverse [ms]':>13}")
+    for nr_parameters in map(int, sizes.split(",")):
+        parameters, quantities = wide_sum_tree(nr_parameters, fan_out)
+        instantiation = Instantiation({p: i % 7 + 2 for i,p in enumerate(parameters)})
+        order = topological_order(quantities)
+        weights = [1.0 for _ in quantities]
+
+        def all_grads(sparse: bool) -> Callable[[Instantiation], None]:
+            def fn(inst: Instantiation):
+                for quantity in quantities: quantity.grad(parameters, inst, sparse=sparse)
+            return fn
+
+        dense = measure(all_grads(False), instantiation, repeats)
+        sparse = measure(all_grads(True), instantiation, repeats)
+        reverse = measure(lambda inst: weighted_grad(quantities, weights, parameters, inst, order=order), instantiation, repeats)
+        print(f"{nr_parameters:>8} {len(quantities):>10} {dense * 1000:>12.2f} {sparse * 1000:>12.2f} {reverse * 1000:>13.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from typing import Dict, List, Tuple
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+
+# modules that are not needed for generating mwps and must therefore not be imported eagerly
+HEAVY_MODULES = ["pandas", "networkx", "pyvis", "matplotlib"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module: str) -> Tuple[float, List[str], Dict[str, int]]:
+    """
+        Imports a module in a fresh interpreter
+        Returns the wall-time (in seconds), which of the HEAVY_MODULES have been imported and the cumulative import-time (in us) per module
+    """
+    probe = (
+        "import sys, time, json\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_ROOT, os.environ.get("PYTHONPATH", "")]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], capture_output=True, text=True, env=env, cwd=REPO_ROOT, check=True)
+    elapsed, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # stderr lines look like "import time:  self [us] | cumulative | imported package"
+    cumulative_by_module = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_by_module[name.strip()] = int(cumulative)
+    return elapsed, heavy, cumulative_by_module
+
+@click.command()
+@click.option("--module", default="mathgap.generation_util", help="Module whose import should be measured")
+@click.option("--repeats", default=5, help="How many fresh interpreters to measure (the median is compared against the budget)")
+@click.option("--budget", default=1.0, help="Maximum median import-time (in seconds)")
+@click.option("--top", default=15, help="How many of the slowest top-level imports should be listed")
+def main(module: str, repeats: int, budget: float, top: int):
+    """ Measures the time to import a module of mathgap and exits with a non-zero code if it exceeds the budget or imports heavy modules """
+    times = []
+    for _ in range(repeats):
+        elapsed, heavy, cumulative_by_module = measure_import(module)
+        times.append(elapsed)
+
+    median = statistics.median(times)
+    print(f"import {module}: median {median * 1000:.1f}ms (min {min(times) * 1000:.1f}ms, max {max(times) * 1000:.1f}ms, budget {budget * 1000:.0f}ms)")
+    print(f"slowest imports (cumulative, last run):")
+    for name, cumulative in sorted(cumulative_by_module.items(), key=lambda x: -x[1])[:top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    failed = False
+    if len(heavy) > 0:
+        print(f"FAIL: imported {', '.join(heavy)} which should only be imported lazily")
+        failed = True
+    if median > budget:
+        print(f"FAIL: exceeded the budget by {(median - budget) * 1000:.1f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
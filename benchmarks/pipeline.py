@@ -0,0 +1,311 @@
+from typing import Any, Callable, Dict, List, Tuple
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import click
+
+from mathgap.generation_util import *
+from mathgap.trees.generators.stoppingcriteria import TreeWidthCriterion
+from mathgap.instantiate import PositiveRandIntInstantiator
+from mathgap.trees import ProofTree
+
+# ruleset-name => (ruleset, start-types, rule-sampling-policy)
+RULESETS = {
+    "NONLINEAR_RULESET": (NONLINEAR_RULESET, [Container], NONLINEAR_POLICY),
+    "FULL_NONLINEAR_RULESET": (FULL_NONLINEAR_RULESET, [Container], UNIFORM_POLICY),
+    "TRANSFER_PARTWHOLE_RULESET": (TRANSFER_PARTWHOLE_RULESET, [Container], UNIFORM_POLICY),
+    "COMP_RULESET": (COMP_RULESET, CONT_START_TYPE, UNIFORM_POLICY),
+    "TRANSFER_RULESET": (TRANSFER_RULESET, CONT_START_TYPE, UNIFORM_POLICY),
+    "PARTWHOLE_RULESET": (PARTWHOLE_RULESET, PARTWHOLE_START_TYPE, UNIFORM_POLICY),
+    "COMP_PARTWHOLE_RULESET": (COMP_PARTWHOLE_RULESET, [Container], UNIFORM_POLICY),
+    "COMPEQ_PARTWHOLE_RULESET": (COMPEQ_PARTWHOLE_RULESET, [Container], UNIFORM_POLICY),
+}
+
+STRATEGIES = ["random", "cpga", "cpga_multistart", "local_search", "constructive"]
+
+class TimeMeasure:
+    """ Measures the wall-clock time of each stage """
+    def __init__(self) -> None:
+        self.results: Dict[str, float] = {}
+        self.current_stage: str = None
+
+    @contextmanager
+    def __call__(self, stage: str):
+        self.current_stage = stage
+        start = time.perf_counter()
+        yield
+        self.results[stage] = time.perf_counter() - start
+
+class AllocMeasure:
+    """ Measures the allocations (net and peak in bytes) of each stage through tracemalloc """
+    def __init__(self) -> None:
+        self.results: Dict[str, Tuple[int, int]] = {}
+        self.current_stage: str = None
+
+    @contextmanager
+    def __call__(self, stage: str):
+        self.current_stage = stage
+        tracemalloc.start()
+        try:
+            yield
+            current, peak = tracemalloc.get_traced_memory()
+            self.results[stage] = (current, peak)
+        finally:
+            tracemalloc.stop()
+
+def run_pipeline(generator: Generator, quantity_instantiators: Dict[str, PositiveRandIntInstantiator], instantiator: Instantiator,
+                 order_sampler: OrderSampler, samplers_and_renderers: Tuple, measure: Callable, seed: int) -> Dict[str, Any]:
+    """ 
+        Runs each stage of the generation pipeline once (measuring each stage individually)
+        and returns some statistics about the generated tree (or the stage at which the pipeline failed).
+    """
+    info = {"failed_stage": None}
+    try:
+        _run_pipeline(generator, quantity_instantiators, instantiator, order_sampler, samplers_and_renderers, measure, seed, info)
+    except Exception as e:
+        # NOTE: e.g. the word lists might run out of unique words or no template might fit for very large trees
+        info["failed_stage"] = measure.current_stage
+        info["error"] = f"{type(e).__name__}: {e}"
+    return info
+
+def _run_pipeline(generator: Generator, quantity_instantiators: Dict[str, PositiveRandIntInstantiator], instantiator: Instantiator,
+                  order_sampler: OrderSampler, samplers_and_renderers: Tuple, measure: Callable, seed: int, info: Dict[str, Any]):
+    ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer = samplers_and_renderers
+
+    with measure("generate"):
+        tree: ProofTree = generator.generate(seed=seed)
+    info["nr_nodes"] = len(tree.node_by_id)
+    info["nr_leaves"] = len(tree.leaf_nodes)
+    info["depth"] = tree.depth
+
+    # NOTE: generate already computes the tree symbolically, this measures it in isolation
+    with measure("compute_symbolically"):
+        tree.compute_symbolically()
+
+    quantity_instantiation = None
+    for strategy, quantity_instantiator in quantity_instantiators.items():
+        try:
+            with measure(f"instantiate_quantities[{strategy}]"):
+                inst = quantity_instantiator.instantiate(tree, seed=seed)
+            if quantity_instantiation is None: quantity_instantiation = inst
+        except ValueError:
+            info.setdefault("failed_strategies", []).append(strategy)
+    if quantity_instantiation is None:
+        info["failed_stage"] = "instantiate_quantities"
+        return
+
+    # the remaining properties (agents, entities, ...) on top of the already instantiated quantities
+    with measure("instantiate_properties"):
+        instantiation = instantiator.instantiate(tree, quantity_instantiation.copy(), skip_existing=True, seed=seed)
+
+    with measure("sample_problem_order"):
+        problem_order = order_sampler.sample_order(tree, seed)
+
+    with measure("sample_templates[problem]"):
+        ps_selection = ps_template_sampler.sample(tree, problem_order, seed=seed)
+    with measure("render[problem]"):
+        _, ps_meta = ps_renderer.render(tree, instantiation, ps_selection)
+
+    with measure("sample_templates[answers]"):
+        answers_selection = ps_answers_template_sampler.sample(tree, problem_order, seed=seed)
+    with measure("render[answers]"):
+        ps_renderer.render(tree, instantiation, answers_selection)
+
+    preselected_templates = [ts for ts in ps_meta.template_selections if tree.node_by_id[ts.primary_node_id].is_leaf]
+    with measure("sample_templates[reasoning_trace]"):
+        rt_selection = rt_template_sampler.sample(tree, problem_order, preselected_templates=preselected_templates, seed=seed)
+    with measure("render[reasoning_trace]"):
+        rt_renderer.render(tree, instantiation, rt_selection)
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": statistics.mean(values),
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+def run_case(ruleset_name: str, criterion_name: str, size: int, nr_samples: int, max_attempts: int, 
+             trace_allocations: bool, samplers_and_renderers: Tuple, instantiator: Instantiator, seed: int) -> Dict[str, Any]:
+    """ Benchmarks all stages for one configuration (ruleset x stopping-criterion x size) """
+    ruleset, start_types, policy = RULESETS[ruleset_name]
+    criterion = BranchDepthCriterion(size) if criterion_name == "depth" else TreeWidthCriterion(size)
+    generator = default_generator(start_types=start_types, inference_rules=ruleset, rule_sampling_policy=policy, stopping_criterion=criterion)
+    quantity_instantiators = {
+        # NOTE: same value-ranges as the default_instantiator
+        strategy: PositiveRandIntInstantiator(leaf_min_value=2, leaf_max_value=10, inner_min_value=2, inner_max_value=10_000, 
+                                              strategy=strategy, max_attempts=max_attempts)
+        for strategy in STRATEGIES
+    }
+    
+    times_by_stage: Dict[str, List[float]] = {}
+    allocs_by_stage: Dict[str, List[Tuple[int, int]]] = {}
+    infos = []
+    for i in range(nr_samples):
+        sample_seed = seed + i
+
+        time_measure = TimeMeasure()
+        infos.append(run_pipeline(generator, quantity_instantiators, instantiator, CANONICAL_ORDER_SAMPLER, samplers_and_renderers, time_measure, sample_seed))
+        for stage, t in time_measure.results.items():
+            times_by_stage.setdefault(stage, []).append(t)
+
+        if trace_allocations:
+            # NOTE: separate run s.t. the tracing overhead doesn't distort the timings (all stages are deterministic given the seed)
+            alloc_measure = AllocMeasure()
+            run_pipeline(generator, quantity_instantiators, instantiator, CANONICAL_ORDER_SAMPLER, samplers_and_renderers, alloc_measure, sample_seed)
+            for stage, a in alloc_measure.results.items():
+                allocs_by_stage.setdefault(stage, []).append(a)
+
+    stages = {}
+    for stage, times in times_by_stage.items():
+        stages[stage] = {"nr_runs": len(times), "time_s": summarize(times)}
+        if stage in allocs_by_stage:
+            stages[stage]["net_alloc_kib"] = summarize([a[0] / 1024 for a in allocs_by_stage[stage]])
+            stages[stage]["peak_alloc_kib"] = summarize([a[1] / 1024 for a in allocs_by_stage[stage]])
+
+    failures, errors = {}, []
+    for info in infos:
+        if info["failed_stage"] is not None: failures[info["failed_stage"]] = failures.get(info["failed_stage"], 0) + 1
+        if "error" in info: errors.append(info["error"])
+        for strategy in info.get("failed_strategies", []):
+            failures[f"instantiate_quantities[{strategy}]"] = failures.get(f"instantiate_quantities[{strategy}]", 0) + 1
+
+    return {
+        "ruleset": ruleset_name,
+        "criterion": criterion_name,
+        "size": size,
+        "nr_samples": nr_samples,
+        "nr_nodes": summarize([info["nr_nodes"] for info in infos if "nr_nodes" in info] or [0]),
+        "nr_leaves": summarize([info["nr_leaves"] for info in infos if "nr_leaves" in info] or [0]),
+        "failures": failures,
+        "errors": errors,
+        "stages": stages,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_sizes(sizes: str) -> List[int]:
+    """ Parses e.g. "1-3,5,10" into [1,2,3,5,10] """
+    result = []
+    for part in sizes.split(","):
+        if part.strip() == "": continue
+        if "-" in part:
+            start, end = part.split("-")
+            result.extend(range(int(start), int(end) + 1))
+        else:
+            result.append(int(part))
+    return result
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option("-o", "--out-path", default=None, help="Where the results (json) should be stored (default: stdout)")
+@click.option("--rulesets", default=",".join(RULESETS.keys()), help="Comma-separated list of the rulesets (see generation_util) to benchmark")
+@click.option("--depths", default="1-10", help="Depths that should be benchmarked (e.g. 1-3,5)")
+@click.option("--widths", default="2,5,10,20,50,100", help="Widths that should be benchmarked (e.g. 2,5,10)")
+@click.option("-n", "--nr-samples", default=3, help="How many trees should be generated per configuration")
+@click.option("--max-attempts", default=10_000, help="Max attempts/steps of the quantity instantiation strategies")
+@click.option("--trace-allocations/--no-trace-allocations", default=True, help="Whether allocations should be traced (in a separate run)")
+@click.option("--case-budget", default=120.0, help="If a configuration takes longer than this (in seconds), larger sizes of the same ruleset and criterion are skipped")
+@click.option("-s", "--seed", default=140499, help="The seed to be used")
+def run(out_path: str, rulesets: str, depths: str, widths: str, nr_samples: int, max_attempts: int, trace_allocations: bool, case_budget: float, seed: int):
+    # NOTE: the pipeline prints warnings to stdout, which would corrupt the json output
+    with redirect_stdout(sys.stderr):
+        report = run_benchmarks(rulesets, depths, widths, nr_samples, max_attempts, trace_allocations, case_budget, seed)
+
+    if out_path is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(out_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+def run_benchmarks(rulesets: str, depths: str, widths: str, nr_samples: int, max_attempts: int, trace_allocations: bool, case_budget: float, seed: int) -> Dict[str, Any]:
+    samplers_and_renderers = default_templates_and_samplers()
+    instantiator = default_instantiator()
+
+    results = []
+    for ruleset_name in [r.strip() for r in rulesets.split(",") if r.strip() != ""]:
+        assert ruleset_name in RULESETS, f"Unknown ruleset {ruleset_name}"
+        for criterion_name, sizes in [("depth", parse_sizes(depths)), ("width", parse_sizes(widths))]:
+            if criterion_name == "width" and RULESETS[ruleset_name][2] is NONLINEAR_POLICY: continue # NOTE: nonlinear policy requires a depth criterion
+            over_budget = False
+            for size in sorted(sizes):
+                if over_budget:
+                    # NOTE: larger trees will only take longer, so we don't even try
+                    results.append({"ruleset": ruleset_name, "criterion": criterion_name, "size": size, "skipped": True})
+                    continue
+
+                print(f"Benchmarking {ruleset_name} with {criterion_name}={size}", file=sys.stderr)
+                start = time.perf_counter()
+                results.append(run_case(ruleset_name, criterion_name, size, nr_samples, max_attempts, trace_allocations, 
+                                        samplers_and_renderers, instantiator, seed))
+                over_budget = (case_budget is not None) and (time.perf_counter() - start > case_budget)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "nr_samples": nr_samples,
+            "max_attempts": max_attempts,
+            "case_budget": case_budget,
+            "seed": seed,
+        },
+        "results": results
+    }
+
+@cli.command()
+@click.argument("baseline_path")
+@click.argument("candidate_path")
+@click.option("--threshold", default=1.2, help="Ratio of median times above which a stage is reported as a regression")
+@click.option("--min-time", default=1e-3, help="Stages faster than this (in seconds) in the baseline are ignored (too noisy)")
+def compare(baseline_path: str, candidate_path: str, threshold: float, min_time: float):
+    """ Compares two benchmark results and exits with a non-zero code if any stage regressed """
+    with open(baseline_path, "r") as f: baseline = json.load(f)
+    with open(candidate_path, "r") as f: candidate = json.load(f)
+
+    def by_key(report):
+        return {(r["ruleset"], r["criterion"], r["size"]): r for r in report["results"]}
+    baseline_cases, candidate_cases = by_key(baseline), by_key(candidate)
+
+    nr_regressions = 0
+    for key, base_case in baseline_cases.items():
+        if key not in candidate_cases: continue
+        if base_case.get("skipped", False):
+            if not candidate_cases[key].get("skipped", False): print(f"now within budget {'/'.join(map(str, key))}")
+            continue
+        if candidate_cases[key].get("skipped", False):
+            nr_regressions += 1
+            print(f"REGRESSION {'/'.join(map(str, key))}: exceeded the budget")
+            continue
+        for stage, base_stage in base_case["stages"].items():
+            cand_stage = candidate_cases[key]["stages"].get(stage, None)
+            if cand_stage is None: continue
+            base_time, cand_time = base_stage["time_s"]["median"], cand_stage["time_s"]["median"]
+            if base_time < min_time: continue
+            ratio = cand_time / base_time
+            if ratio > threshold:
+                nr_regressions += 1
+                print(f"REGRESSION {'/'.join(map(str, key))} {stage}: {base_time:.4f}s -> {cand_time:.4f}s (x{ratio:.2f})")
+            elif ratio < 1 / threshold:
+                print(f"improvement {'/'.join(map(str, key))} {stage}: {base_time:.4f}s -> {cand_time:.4f}s (x{ratio:.2f})")
+
+    print(f"{nr_regressions} regression(s) found")
+    sys.exit(1 if nr_regressions > 0 else 0)
+
+if __name__ == "__main__":
+    cli()
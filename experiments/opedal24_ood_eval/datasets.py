@@ -1,22 +1,31 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 from mathgap.logicalforms.logicalform import LogicalForm
 from mathgap.natlang.templates.template import WHITESPACE
 from mathgap.trees.generators import MultiGenerator
 from mathgap.trees.sampling.order import OrderSampler
 from mathgap.generation_util import *
+from mathgap.filters import MWPFilter
 
 from data.util import DATA_FOLDER
 
+# the columns of a dataset (see mwp_to_record)
+RECORD_FIELDS = ["problem", "reasoning_trace", "answer", "answer_nl", "depth", "width", "structure_hash"]
 
-def generate_linear_comparison(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
-    """ 
-        Generates a dataset of linear mwps with comparison inference rules, where the underlying proof tree is of depth between min_depth and max_depth.
-    """
+def mwp_to_record(mwp: MathWordProblem) -> Dict[str, str]:
+    """ Extracts the information that is stored per mwp in a dataset """
+    return {
+        "problem": mwp.ps_nl,
+        "reasoning_trace": mwp.rt_nl,
+        "answer": mwp.numerical_answers[-1],
+        "answer_nl": mwp.answers_nl,
+        "depth": mwp.tree.depth,
+        "width": len(mwp.tree.leaf_nodes),
+        "structure_hash": mwp.tree.structural_hash()
+    }
 
-    # 1. Define the generators for generating the proof-trees
-    #    In our case, we want a mixture of depths, where each depth is equally likely to occur 
-    #    (hence all sub-generators have weight 1.0)
+def linear_comparison_generator(min_depth: int, max_depth: int) -> MultiGenerator:
+    """ Mixture of linear trees with comparison inference rules of depth between min_depth and max_depth (each depth is equally likely) """
     weights_by_generator = {
         default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
                           comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0,
@@ -24,167 +33,178 @@ def generate_linear_comparison(nr_problems: int, min_depth: int, max_depth: int,
                           start_types=CONT_START_TYPE, inference_rules=COMP_RULESET): 1.0
         for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
     }
-    generator = MultiGenerator(weights_by_generator)
+    return MultiGenerator(weights_by_generator)
+
+def linear_transfer_generator(min_depth: int, max_depth: int) -> MultiGenerator:
+    """ Mixture of linear trees with transfer inference rules of depth between min_depth and max_depth """
+    weights_by_generator = {
+        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
+                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
+                          stopping_criterion=BranchDepthCriterion(i), 
+                          start_types=CONT_START_TYPE, inference_rules=TRANSFER_RULESET): 1.0
+        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
+    }
+    return MultiGenerator(weights_by_generator)
+
+def linear_depth_generator(min_depth: int, max_depth: int) -> MultiGenerator:
+    """ Mixture of linear trees with transfer and comparison inference rules of depth between min_depth and max_depth """
+    weights_by_generator = {
+        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
+                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
+                          stopping_criterion=BranchDepthCriterion(i), 
+                          start_types=CONT_START_TYPE, inference_rules=COMP_TRANSFER_RULESET): 1.0
+        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
+    }
+    return MultiGenerator(weights_by_generator)
+
+def linear_partwhole_generator(min_width: int, max_width: int) -> MultiGenerator:
+    """ Mixture of trees of depth 1 with part-whole inference rules and width between min_width and max_width """
+    weights_by_generator = {
+        default_generator(use_attribute=attr, use_unit=False, 
+                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
+                          min_part_whole=min_width, max_part_whole=max_width, stopping_criterion=BranchDepthCriterion(1), 
+                          start_types=PARTWHOLE_START_TYPE, inference_rules=PARTWHOLE_RULESET): 1.0
+        for attr in [True, False]
+    }
+    return MultiGenerator(weights_by_generator)
+
+def nonlinear_comparison_generator(min_depth: int, max_depth: int) -> MultiGenerator:
+    """ Mixture of nonlinear trees with comparison inference rules of depth between min_depth and max_depth """
+    weights_by_generator = {
+        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
+                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0,
+                          stopping_criterion=BranchDepthCriterion(i), 
+                          rule_sampling_policy = NONLINEAR_POLICY,
+                          #start_types=NONLINEAR_START_TYPE, 
+                          start_types=[Container],
+                          inference_rules=NONLINEAR_RULESET): 1.0
+        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
+    }
+    return MultiGenerator(weights_by_generator)
+
+def moved_linear_comparison_generator(depth: int) -> MultiGenerator:
+    """ Mixture of linear trees with comparison inference rules of a fixed depth """
+    weights_by_generator = {
+        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
+                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0,
+                          stopping_criterion=BranchDepthCriterion(depth), 
+                          start_types=CONT_START_TYPE, inference_rules=COMP_RULESET): 1.0
+        for atrr_unit in [[False, False], [True, False], [False, True]]
+    }
+    return MultiGenerator(weights_by_generator)
+
+def dataset_instantiator(data_folder: str = DATA_FOLDER, dataversion: str = "v1") -> Instantiator:
+    """ The default instantiator but with the agents, entities etc specified in the data-folder of this experiment """
+    return default_instantiator(data_folder=data_folder, dataversion=dataversion, leaf_min_value=2, leaf_max_value=20, 
+                                inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+
+def dataset_templates_and_samplers(data_folder: str = DATA_FOLDER) -> Tuple[ProblemStructureSampler, ProblemStructureAnswersSampler, ProblemStructureRenderer, ReasoningTraceSampler, ReasoningTraceRenderer]:
+    return default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+
+def generate_linear_comparison(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                               seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
+    """ 
+        Generates a dataset of linear mwps with comparison inference rules, where the underlying proof tree is of depth between min_depth and max_depth.
+    """
+
+    # 1. Define the generators for generating the proof-trees
+    #    In our case, we want a mixture of depths, where each depth is equally likely to occur 
+    #    (hence all sub-generators have weight 1.0)
+    generator = linear_comparison_generator(min_depth, max_depth)
 
     # 2. Load the default instantiator but use the agents, entities etc specified in the data-folder of this experiment
     #    The instantiator will be used to instantiate properties with values (e.g. agent1 -> Alice, quantity1 -> 4)
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="v1", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "v1")
     
     # 3. Load template renderers and samplers
     #    They will be used to express logical forms and deduction steps as natural language
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     # 4. Now, we actually generate the mwps
     mwps = generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
     # 5. extract the required information from the mwps
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps]
+    return [mwp_to_record(mwp) for mwp in mwps]
 
-def generate_linear_transfer(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
+def generate_linear_transfer(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                             seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
     """ 
         Generates a dataset of linear mwps with transfer inference rules, where the underlying proof tree is of depth between min_depth and max_depth.
     """
-    weights_by_generator = {
-        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
-                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
-                          stopping_criterion=BranchDepthCriterion(i), 
-                          start_types=CONT_START_TYPE, inference_rules=TRANSFER_RULESET): 1.0
-        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
-    }
-    generator = MultiGenerator(weights_by_generator)
+    generator = linear_transfer_generator(min_depth, max_depth)
 
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="v1", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "v1")
     
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     mwps = generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps]
+    return [mwp_to_record(mwp) for mwp in mwps]
 
-def generate_linear_depth(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
+def generate_linear_depth(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                          seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
     """ 
         Generates a dataset of linear mwps with transfer and commparison inference rules, where the underlying proof tree is of depth between min_depth and max_depth.
     """
-    weights_by_generator = {
-        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
-                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
-                          stopping_criterion=BranchDepthCriterion(i), 
-                          start_types=CONT_START_TYPE, inference_rules=COMP_TRANSFER_RULESET): 1.0
-        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
-    }
-    generator = MultiGenerator(weights_by_generator)
+    generator = linear_depth_generator(min_depth, max_depth)
 
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="v1", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "v1")
     
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     mwps = generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps]
+    return [mwp_to_record(mwp) for mwp in mwps]
 
 
-def generate_linear_partwhole(nr_problems: int, min_width: int, max_width: int, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
+def generate_linear_partwhole(nr_problems: int, min_width: int, max_width: int, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                              seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
     """ 
         Generates a dataset of linear mwps with part-whole inference rules, where the underlying proof tree is of depth 1 and has width between min_width and max_width.
     """
-    weights_by_generator = {
-        default_generator(use_attribute=attr, use_unit=False, 
-                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0, 
-                          min_part_whole=min_width, max_part_whole=max_width, stopping_criterion=BranchDepthCriterion(1), 
-                          start_types=PARTWHOLE_START_TYPE, inference_rules=PARTWHOLE_RULESET): 1.0
-        for attr in [True, False]
-    }
-    generator = MultiGenerator(weights_by_generator)
+    generator = linear_partwhole_generator(min_width, max_width)
 
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="v1", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "v1")
     
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     mwps = generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps]
+    return [mwp_to_record(mwp) for mwp in mwps]
 
-def generate_nonlinear_comparison(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
+def generate_nonlinear_comparison(nr_problems: int, min_depth: int, max_depth: int, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                                  seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
     """ 
         Generates a dataset of nonlinear mwps with comparison inference rules, where the underlying proof tree is of depth between min_depth and max_depth.
     """
 
-    weights_by_generator = {
-        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
-                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0,
-                          stopping_criterion=BranchDepthCriterion(i), 
-                          rule_sampling_policy = NONLINEAR_POLICY,
-                          #start_types=NONLINEAR_START_TYPE, 
-                          start_types=[Container],
-                          inference_rules=NONLINEAR_RULESET): 1.0
-        for i in range(min_depth, max_depth+1) for atrr_unit in [[False, False], [True, False], [False, True]]
-    }
-    generator = MultiGenerator(weights_by_generator)
+    generator = nonlinear_comparison_generator(min_depth, max_depth)
 
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="long", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "long")
     
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     mwps = generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps] 
+    return [mwp_to_record(mwp) for mwp in mwps] 
 
-def generate_moved_linear_comparison(nr_problems: int, depth: int, move_idx: int = 0, seed: int = None, data_folder: str = DATA_FOLDER) -> List[Dict[str, str]]:
+def generate_moved_linear_comparison(nr_problems: int, depth: int, move_idx: int = 0, seed: int = None, data_folder: str = DATA_FOLDER, mwp_filter: MWPFilter = None,
+                                     seed_mode: str = "chain", start_index: int = 0) -> List[Dict[str, str]]:
     """ 
         Generates a dataset of linear mwps with comparison inference rules, 
         where the sentences indexed by move_idx has been moved to the front in relation to canonical order
@@ -195,36 +215,21 @@ def generate_moved_linear_comparison(nr_problems: int, depth: int, move_idx: int
     # 1. Define the generators for generating the proof-trees
     #    In our case, we want a mixture of depths, where each depth is equally likely to occur 
     #    (hence all sub-generators have weight 1.0)
-    weights_by_generator = {
-        default_generator(use_attribute=atrr_unit[0], use_unit=atrr_unit[1], 
-                          comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0,
-                          stopping_criterion=BranchDepthCriterion(depth), 
-                          start_types=CONT_START_TYPE, inference_rules=COMP_RULESET): 1.0
-        for atrr_unit in [[False, False], [True, False], [False, True]]
-    }
-    generator = MultiGenerator(weights_by_generator)
+    generator = moved_linear_comparison_generator(depth)
 
     # 2. Load the default instantiator but use the agents, entities etc specified in the data-folder of this experiment
     #    The instantiator will be used to instantiate properties with values (e.g. agent1 -> Alice, quantity1 -> 4)
-    instantiator = default_instantiator(data_folder=data_folder, dataversion="v1", leaf_min_value=2, leaf_max_value=20, 
-                                        inner_min_value=2, inner_max_value=10_000, strategy="cpga")
+    instantiator = dataset_instantiator(data_folder, "v1")
     
     # 3. Load template renderers and samplers
     #    They will be used to express logical forms and deduction steps as natural language
     ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer \
-        = default_templates_and_samplers(data_folder, "v1", WHITESPACE)
+        = dataset_templates_and_samplers(data_folder)
 
     # 4. Now, we actually generate the mwps
     mwps = generate_mwps(nr_problems, generator, instantiator, FrontMovementOrderSampler(move_idx), 
                          ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                         rt_template_sampler, rt_renderer, seed)
+                         rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, seed_mode=seed_mode, start_index=start_index)
 
     # 5. extract the required information from the mwps
-    return [{
-        "problem": mwp.ps_nl,
-        "reasoning_trace": mwp.rt_nl,
-        "answer": mwp.numerical_answers[-1],
-        "answer_nl": mwp.answers_nl,
-        "depth": mwp.tree.depth,
-        "width": len(mwp.tree.leaf_nodes)
-    } for mwp in mwps]
+    return [mwp_to_record(mwp) for mwp in mwps]
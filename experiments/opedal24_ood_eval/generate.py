@@ -1,10 +1,12 @@
 import os
+import json
 from pathlib import Path
 
 import click
 import pandas as pd
 
 from datasets import *
+from mathgap.leakage import LeakageIndex, LeakageFilter
 
 def save_df_to_csv(df: pd.DataFrame, file_path: str):
     path = Path(file_path)
@@ -13,20 +15,77 @@ def save_df_to_csv(df: pd.DataFrame, file_path: str):
         os.makedirs(folder_name, exist_ok=True)
     df.to_csv(file_path, index=False)
 
+def exclusion_options(command):
+    """ Options to exclude problems that are already part of other datasets (e.g. to avoid leakage between train and eval) """
+    command = click.option("--exclude-by", type=click.Choice(["both", "structure", "surface"]), default="both", help="Whether to exclude problems with the same proof tree structure, the same problem text or both (generation stops with an error if the exclusion rejects too many problems in a row, e.g. if the index contains all structures)")(command)
+    command = click.option("--exclude-dataset", multiple=True, help="Only exclude problems of these datasets in the index (default: all)")(command)
+    command = click.option("--exclude-index", default=None, help="Path to a leakage index (see index command), problems present in the index will not be generated")(command)
+    return command
+
+def build_exclusion_filter(exclude_index: str, exclude_dataset: List[str], exclude_by: str) -> MWPFilter:
+    if exclude_index is None: return None
+    datasets = list(exclude_dataset) if len(exclude_dataset) > 0 else None
+    return LeakageFilter(LeakageIndex(exclude_index), datasets=datasets, 
+                         by_structure=exclude_by in ["both", "structure"], by_surface=exclude_by in ["both", "surface"])
+
+def shard_options(command):
+    """ Options to generate only a disjoint slice of the problems (e.g. to spread the generation of one dataset across multiple machines, see merge command) """
+    command = click.option("--seed-mode", type=click.Choice(["chain", "counter"]), default="chain", help="How the seed of each problem is derived (sharding requires counter, which makes each problem only depend on its index)")(command)
+    command = click.option("--shard-count", default=1, help="Into how many shards the problems are split")(command)
+    command = click.option("--shard-index", default=0, help="Which of the shards should be generated (0-based)")(command)
+    return command
+
+def shard_range(nr_problems: int, shard_index: int, shard_count: int, seed_mode: str) -> Tuple[int, int]:
+    """ The range [start, stop) of problem indices that belong to a shard """
+    if not (0 <= shard_index < shard_count): raise click.UsageError("--shard-index must be in [0, --shard-count)")
+    if shard_count > 1 and seed_mode != "counter": raise click.UsageError("Sharding requires --seed-mode counter")
+    return nr_problems * shard_index // shard_count, nr_problems * (shard_index + 1) // shard_count
+
+def shard_manifest_path(out_path: str) -> str:
+    return f"{out_path}.shard.json"
+
+def save_shard(df: pd.DataFrame, out_path: str, command: str, seed: int, nr_problems: int, shard_index: int, shard_count: int, start: int, stop: int):
+    """ Saves the dataset and, if it is a shard, a manifest describing which problems it contains """
+    save_df_to_csv(df, out_path)
+    if shard_count == 1: return
+    with open(shard_manifest_path(out_path), "w") as f:
+        json.dump({
+            "command": command, "seed": seed, "nr_problems": nr_problems,
+            "shard_index": shard_index, "shard_count": shard_count,
+            "start": start, "stop": stop, "nr_records": len(df)
+        }, f, indent=2)
+
 @click.group()
 def cli():
     pass
 
+@cli.command()
+@click.option("-i", "--index-path", required=True, help="Where the leakage index is stored (will be created if it doesn't exist)")
+@click.option("--name", required=True, help="Name under which the datasets will be registered in the index")
+@click.argument("dataset_paths", nargs=-1, required=True)
+def index(index_path: str, name: str, dataset_paths: List[str]):
+    leakage_index = LeakageIndex(index_path)
+    for dataset_path in dataset_paths:
+        df = pd.read_csv(dataset_path)
+        leakage_index.add_records(name, df.to_dict("records"))
+    leakage_index.close()
+
 @cli.command()
 @click.option("-o", "--out-path", required=True, help="Where the generated dataset will be stored")
 @click.option("-n", "--nr-problems", default=50, help="The number of problems that should be generated")
 @click.option("--min-depth", default=1, help="The min depth of the trees that will be generated")
 @click.option("--max-depth", default=3, help="The max depth of the trees that will be generated")
 @click.option("-s", "--seed", default=140499, help="The seed to be used")
-def linear_comparison(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int):
+@exclusion_options
+@shard_options
+def linear_comparison(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int, exclude_index: str, exclude_dataset: List[str], exclude_by: str,
+                      shard_index: int, shard_count: int, seed_mode: str):
     path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
-    df = pd.DataFrame(generate_linear_comparison(nr_problems=nr_problems, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path))
-    save_df_to_csv(df, out_path)
+    mwp_filter = build_exclusion_filter(exclude_index, exclude_dataset, exclude_by)
+    start, stop = shard_range(nr_problems, shard_index, shard_count, seed_mode)
+    df = pd.DataFrame(generate_linear_comparison(nr_problems=stop - start, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path, mwp_filter=mwp_filter,
+                                                 seed_mode=seed_mode, start_index=start))
+    save_shard(df, out_path, "linear_comparison", seed, nr_problems, shard_index, shard_count, start, stop)
 
 @cli.command()
 @click.option("-o", "--out-path", required=True, help="Where the generated dataset will be stored")
@@ -34,10 +93,16 @@ def linear_comparison(out_path: str, nr_problems: int, min_depth: int, max_depth
 @click.option("--min-depth", default=1, help="The min depth of the trees that will be generated")
 @click.option("--max-depth", default=3, help="The max depth of the trees that will be generated")
 @click.option("-s", "--seed", default=140499, help="The seed to be used")
-def linear_transfer(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int):
+@exclusion_options
+@shard_options
+def linear_transfer(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int, exclude_index: str, exclude_dataset: List[str], exclude_by: str,
+                    shard_index: int, shard_count: int, seed_mode: str):
     path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
-    df = pd.DataFrame(generate_linear_transfer(nr_problems=nr_problems, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path))
-    save_df_to_csv(df, out_path)
+    mwp_filter = build_exclusion_filter(exclude_index, exclude_dataset, exclude_by)
+    start, stop = shard_range(nr_problems, shard_index, shard_count, seed_mode)
+    df = pd.DataFrame(generate_linear_transfer(nr_problems=stop - start, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path, mwp_filter=mwp_filter,
+                                               seed_mode=seed_mode, start_index=start))
+    save_shard(df, out_path, "linear_transfer", seed, nr_problems, shard_index, shard_count, start, stop)
 
 @cli.command()
 @click.option("-o", "--out-path", required=True, help="Where the generated dataset will be stored")
@@ -45,10 +110,16 @@ def linear_transfer(out_path: str, nr_problems: int, min_depth: int, max_depth:
 @click.option("--min-width", default=2, help="The min width of the trees that will be generated")
 @click.option("--max-width", default=4, help="The max width of the trees that will be generated")
 @click.option("-s", "--seed", default=140499, help="The seed to be used")
-def linear_partwhole(out_path: str, nr_problems: int, min_width: int, max_width: int, seed: int):
+@exclusion_options
+@shard_options
+def linear_partwhole(out_path: str, nr_problems: int, min_width: int, max_width: int, seed: int, exclude_index: str, exclude_dataset: List[str], exclude_by: str,
+                     shard_index: int, shard_count: int, seed_mode: str):
     path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
-    df = pd.DataFrame(generate_linear_partwhole(nr_problems=nr_problems, min_width=min_width, max_width=max_width, seed=seed, data_folder=path))
-    save_df_to_csv(df, out_path)
+    mwp_filter = build_exclusion_filter(exclude_index, exclude_dataset, exclude_by)
+    start, stop = shard_range(nr_problems, shard_index, shard_count, seed_mode)
+    df = pd.DataFrame(generate_linear_partwhole(nr_problems=stop - start, min_width=min_width, max_width=max_width, seed=seed, data_folder=path, mwp_filter=mwp_filter,
+                                                seed_mode=seed_mode, start_index=start))
+    save_shard(df, out_path, "linear_partwhole", seed, nr_problems, shard_index, shard_count, start, stop)
 
 @cli.command()
 @click.option("-o", "--out-path", required=True, help="Where the generated dataset will be stored")
@@ -56,10 +127,16 @@ def linear_partwhole(out_path: str, nr_problems: int, min_width: int, max_width:
 @click.option("--depth", default=1, help="The depth of the trees that will be generated")
 @click.option("--move-idx", default=1, help="The depth of the trees that will be generated")
 @click.option("-s", "--seed", default=140499, help="The seed to be used")
-def moved_linear_comparison(out_path: str, nr_problems: int, depth: int, move_idx: int, seed: int):
+@exclusion_options
+@shard_options
+def moved_linear_comparison(out_path: str, nr_problems: int, depth: int, move_idx: int, seed: int, exclude_index: str, exclude_dataset: List[str], exclude_by: str,
+                            shard_index: int, shard_count: int, seed_mode: str):
     path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
-    df = pd.DataFrame(generate_moved_linear_comparison(nr_problems=nr_problems, depth=depth, move_idx=move_idx, seed=seed, data_folder=path))
-    save_df_to_csv(df, out_path)
+    mwp_filter = build_exclusion_filter(exclude_index, exclude_dataset, exclude_by)
+    start, stop = shard_range(nr_problems, shard_index, shard_count, seed_mode)
+    df = pd.DataFrame(generate_moved_linear_comparison(nr_problems=stop - start, depth=depth, move_idx=move_idx, seed=seed, data_folder=path, mwp_filter=mwp_filter,
+                                                       seed_mode=seed_mode, start_index=start))
+    save_shard(df, out_path, "moved_linear_comparison", seed, nr_problems, shard_index, shard_count, start, stop)
 
 @cli.command()
 @click.option("-o", "--out-path", required=True, help="Where the generated dataset will be stored")
@@ -67,10 +144,66 @@ def moved_linear_comparison(out_path: str, nr_problems: int, depth: int, move_id
 @click.option("--min-depth", default=1, help="The min depth of the trees that will be generated")
 @click.option("--max-depth", default=3, help="The max depth of the trees that will be generated")
 @click.option("-s", "--seed", default=140499, help="The seed to be used")
-def nonlinear_comparison(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int):
+@exclusion_options
+@shard_options
+def nonlinear_comparison(out_path: str, nr_problems: int, min_depth: int, max_depth: int, seed: int, exclude_index: str, exclude_dataset: List[str], exclude_by: str,
+                         shard_index: int, shard_count: int, seed_mode: str):
     path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
-    df = pd.DataFrame(generate_nonlinear_comparison(nr_problems=nr_problems, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path))
-    save_df_to_csv(df, out_path)
+    mwp_filter = build_exclusion_filter(exclude_index, exclude_dataset, exclude_by)
+    start, stop = shard_range(nr_problems, shard_index, shard_count, seed_mode)
+    df = pd.DataFrame(generate_nonlinear_comparison(nr_problems=stop - start, min_depth=min_depth, max_depth=max_depth, seed=seed, data_folder=path, mwp_filter=mwp_filter,
+                                                    seed_mode=seed_mode, start_index=start))
+    save_shard(df, out_path, "nonlinear_comparison", seed, nr_problems, shard_index, shard_count, start, stop)
+
+@cli.command()
+@click.option("-w", "--workers", default=1, help="How many worker processes generate the problems of all sub-datasets")
+@click.argument("plan_path")
+def plan(plan_path: str, workers: int):
+    """ Generates all sub-datasets of a plan (json or yaml, see plan.compile_plan), building shared generators, vocabularies and templates only once """
+    from plan import load_plan, compile_plan, run_plan
+
+    path = os.path.join("experiments/opedal24_ood_eval/data") if 'mathgap' in os.listdir() else os.path.join("data")
+    compiled = compile_plan(load_plan(plan_path), default_data_folder=path)
+    print(f"Compiled {len(compiled.sub_datasets)} sub-datasets sharing {compiled.resources()}")
+    run_plan(compiled, nr_workers=workers)
+
+@cli.command()
+@click.option("-o", "--out-path", required=True, help="Where the merged dataset will be stored")
+@click.argument("shard_paths", nargs=-1, required=True)
+def merge(out_path: str, shard_paths: List[str]):
+    """ Concatenates the shards of a dataset (generated with --shard-index/--shard-count) into the dataset a single run would have generated """
+    shards = []
+    for shard_path in shard_paths:
+        if not os.path.exists(shard_manifest_path(shard_path)): raise click.UsageError(f"Missing shard manifest {shard_manifest_path(shard_path)}")
+        with open(shard_manifest_path(shard_path), "r") as f:
+            shards.append((json.load(f), shard_path))
+    shards.sort(key=lambda x: x[0]["start"])
+
+    # 1. all shards must stem from the same run
+    first = shards[0][0]
+    for manifest, shard_path in shards:
+        for key in ["command", "seed", "nr_problems", "shard_count"]:
+            if manifest[key] != first[key]: raise click.UsageError(f"{shard_path} has {key}={manifest[key]} but expected {first[key]}")
+
+    # 2. the shards must cover all problem indices exactly once
+    shard_indices = [m["shard_index"] for m,_ in shards]
+    if sorted(shard_indices) != list(range(first["shard_count"])): 
+        raise click.UsageError(f"Expected shards 0..{first['shard_count'] - 1} exactly once but got {sorted(shard_indices)}")
+    expected_start = 0
+    for manifest, shard_path in shards:
+        if manifest["start"] != expected_start: raise click.UsageError(f"{shard_path} starts at problem {manifest['start']} but expected {expected_start}")
+        expected_start = manifest["stop"]
+    if expected_start != first["nr_problems"]: raise click.UsageError(f"Shards only cover {expected_start} of {first['nr_problems']} problems")
+
+    # 3. each shard must contain all of its problems
+    dfs = []
+    for manifest, shard_path in shards:
+        df = pd.read_csv(shard_path)
+        if len(df) != manifest["stop"] - manifest["start"]: 
+            raise click.UsageError(f"{shard_path} contains {len(df)} problems but expected {manifest['stop'] - manifest['start']}")
+        dfs.append(df)
+
+    save_df_to_csv(pd.concat(dfs, ignore_index=True), out_path)
 
 if __name__ == "__main__":
     cli()
\ No newline at end of file
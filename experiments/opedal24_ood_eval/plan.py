@@ -0,0 +1,202 @@
+"""
+    Generates many sub-datasets at once from a plan (see compile_plan and run_plan).
+
+    NOTE: every sub-dataset is generated with seed_mode="counter" (s.t. it can be split into chunks that are generated in parallel),
+        i.e. it is identical to running its command with --seed-mode counter. Plans don't support mwp filters 
+        (e.g. --exclude-dataset or deduplication), generate such datasets with their own command instead.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from dataclasses import dataclass
+import csv
+import json
+import multiprocessing
+import os
+
+from datasets import *
+
+@dataclass
+class DatasetKind:
+    """
+        How a kind of sub-dataset is generated
+        - build_generator: builds the generator from the parameters of the sub-dataset
+        - parameters: the names of the parameters of the sub-dataset (all of them are required)
+        - dataversion: which version of the vocabulary is used to instantiate the problems
+        - build_order_sampler: builds the order sampler from the parameters of the sub-dataset
+    """
+    build_generator: Callable[..., Generator]
+    parameters: List[str]
+    dataversion: str = "v1"
+    build_order_sampler: Callable[..., OrderSampler] = lambda **params: CANONICAL_ORDER_SAMPLER
+
+DATASET_KINDS: Dict[str, DatasetKind] = {
+    "linear_comparison": DatasetKind(linear_comparison_generator, ["min_depth", "max_depth"]),
+    "linear_transfer": DatasetKind(linear_transfer_generator, ["min_depth", "max_depth"]),
+    "linear_depth": DatasetKind(linear_depth_generator, ["min_depth", "max_depth"]),
+    "linear_partwhole": DatasetKind(linear_partwhole_generator, ["min_width", "max_width"]),
+    "nonlinear_comparison": DatasetKind(nonlinear_comparison_generator, ["min_depth", "max_depth"], dataversion="long"),
+    "moved_linear_comparison": DatasetKind(lambda depth, move_idx: moved_linear_comparison_generator(depth), ["depth", "move_idx"],
+                                           build_order_sampler=lambda depth, move_idx: FrontMovementOrderSampler(move_idx)),
+}
+
+@dataclass
+class SubDataset:
+    name: str
+    kind: str
+    out_path: str
+    nr_problems: int
+    seed: int
+    params: Dict[str, Any]
+
+    @property
+    def generator_key(self) -> Tuple:
+        return (self.kind, tuple(sorted(self.params.items())))
+
+    @property
+    def instantiator_key(self) -> str:
+        return DATASET_KINDS[self.kind].dataversion
+
+@dataclass
+class CompiledPlan:
+    """
+        A plan where the resources shared between sub-datasets (generators, instantiators, templates) are deduplicated
+        - data_folder: the data-folder with the vocabularies and templates of all sub-datasets
+        - chunk_size: how many problems of a sub-dataset are generated per task of the worker pool
+    """
+    data_folder: str
+    sub_datasets: List[SubDataset]
+    chunk_size: int
+
+    def resources(self) -> Dict[str, int]:
+        """ The number of distinct resources that need to be built """
+        return {
+            "generators": len(set(d.generator_key for d in self.sub_datasets)),
+            "instantiators": len(set(d.instantiator_key for d in self.sub_datasets)),
+            "templates": 1
+        }
+
+    def tasks(self) -> Iterator[Tuple[int, int, int]]:
+        """ All tasks (sub-dataset index, start, stop), ordered by sub-dataset and problem index """
+        for i, sub_dataset in enumerate(self.sub_datasets):
+            for start in range(0, sub_dataset.nr_problems, self.chunk_size):
+                yield (i, start, min(start + self.chunk_size, sub_dataset.nr_problems))
+
+def load_plan(path: str) -> Dict[str, Any]:
+    """ Loads a plan from a json (or, if pyyaml is installed, a yaml) file """
+    with open(path, "r") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml # NOTE: optional dependency, only needed for plans in yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def compile_plan(plan: Dict[str, Any], default_data_folder: str = DATA_FOLDER) -> CompiledPlan:
+    """
+        Validates a plan and deduplicates the resources of its sub-datasets. A plan looks as follows:
+        {
+            "data_folder": "data",      (optional)
+            "seed": 140499,             (optional, default seed of all sub-datasets)
+            "chunk_size": 50,           (optional)
+            "datasets": [
+                {"name": "comparison", "kind": "linear_comparison", "out_path": "out/comparison.csv", "nr_problems": 1000,
+                 "seed": 1, "params": {"min_depth": 1, "max_depth": 3}},
+                ...
+            ]
+        }
+        where kind is one of DATASET_KINDS
+    """
+    default_seed = plan.get("seed", 140499)
+    sub_datasets = []
+    for entry in plan["datasets"]:
+        kind = entry["kind"]
+        assert kind in DATASET_KINDS, f"Unknown kind of dataset {kind} (must be one of {list(DATASET_KINDS.keys())})"
+        params = entry.get("params", {})
+        assert set(params.keys()) == set(DATASET_KINDS[kind].parameters), f"Dataset of kind {kind} requires the params {DATASET_KINDS[kind].parameters}"
+        sub_datasets.append(SubDataset(name=entry.get("name", kind), kind=kind, out_path=entry["out_path"], nr_problems=entry["nr_problems"],
+                                       seed=entry.get("seed", default_seed), params=params))
+
+    names = [d.name for d in sub_datasets]
+    assert len(set(names)) == len(names), "Each sub-dataset needs its own name"
+    out_paths = [d.out_path for d in sub_datasets]
+    assert len(set(out_paths)) == len(out_paths), "Each sub-dataset needs its own out_path"
+    return CompiledPlan(data_folder=plan.get("data_folder", default_data_folder), sub_datasets=sub_datasets, chunk_size=plan.get("chunk_size", 50))
+
+class PlanResources:
+    """ Builds each resource of a compiled plan at most once (per process) """
+    def __init__(self, compiled: CompiledPlan) -> None:
+        self.compiled = compiled
+        self._generators: Dict[Tuple, Generator] = {}
+        self._instantiators: Dict[str, Instantiator] = {}
+        self._templates_and_samplers = None
+
+    def generator(self, sub_dataset: SubDataset) -> Generator:
+        key = sub_dataset.generator_key
+        if key not in self._generators:
+            self._generators[key] = DATASET_KINDS[sub_dataset.kind].build_generator(**sub_dataset.params)
+        return self._generators[key]
+
+    def instantiator(self, sub_dataset: SubDataset) -> Instantiator:
+        key = sub_dataset.instantiator_key
+        if key not in self._instantiators:
+            self._instantiators[key] = dataset_instantiator(self.compiled.data_folder, key)
+        return self._instantiators[key]
+
+    def templates_and_samplers(self) -> Tuple:
+        if self._templates_and_samplers is None:
+            self._templates_and_samplers = dataset_templates_and_samplers(self.compiled.data_folder)
+        return self._templates_and_samplers
+
+    def generate(self, sub_dataset_index: int, start: int, stop: int) -> List[Dict[str, str]]:
+        """ Generates the problems start..stop-1 of a sub-dataset (identical to the problems of a single run with seed_mode=counter) """
+        sub_dataset = self.compiled.sub_datasets[sub_dataset_index]
+        mwps = generate_mwps(stop - start, self.generator(sub_dataset), self.instantiator(sub_dataset),
+                             DATASET_KINDS[sub_dataset.kind].build_order_sampler(**sub_dataset.params),
+                             *self.templates_and_samplers(), seed=sub_dataset.seed, seed_mode="counter", start_index=start)
+        return [mwp_to_record(mwp) for mwp in mwps]
+
+_WORKER_RESOURCES: PlanResources = None
+
+def _init_worker(compiled: CompiledPlan):
+    global _WORKER_RESOURCES
+    _WORKER_RESOURCES = PlanResources(compiled)
+
+def _run_task(task: Tuple[int, int, int]) -> Tuple[int, List[Dict[str, str]]]:
+    return task[0], _WORKER_RESOURCES.generate(*task)
+
+def run_plan(compiled: CompiledPlan, nr_workers: int = 1):
+    """
+        Generates all sub-datasets through one pool of workers,
+        the records of each sub-dataset are streamed (in order) into its own csv-file as soon as they are available
+    """
+    tasks = list(compiled.tasks())
+    writers: Dict[int, Tuple[Any, csv.DictWriter]] = {}
+    nr_written = [0 for _ in compiled.sub_datasets]
+
+    def write(sub_dataset_index: int, records: List[Dict[str, str]]):
+        sub_dataset = compiled.sub_datasets[sub_dataset_index]
+        if sub_dataset_index not in writers:
+            os.makedirs(os.path.dirname(sub_dataset.out_path) or ".", exist_ok=True)
+            f = open(sub_dataset.out_path, "w", newline="", encoding="utf-8")
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS, lineterminator="\n") # NOTE: same format as pandas.to_csv
+            writer.writeheader()
+            writers[sub_dataset_index] = (f, writer)
+        f, writer = writers[sub_dataset_index]
+        writer.writerows(records)
+        nr_written[sub_dataset_index] += len(records)
+
+        # close the stream as soon as the sub-dataset is complete
+        if nr_written[sub_dataset_index] == sub_dataset.nr_problems:
+            f.close()
+            print(f"Finished {sub_dataset.name}: {sub_dataset.nr_problems} problems -> {sub_dataset.out_path}")
+
+    # NOTE: empty sub-datasets have no tasks, their files only contain the header
+    for i, sub_dataset in enumerate(compiled.sub_datasets):
+        if sub_dataset.nr_problems == 0: write(i, [])
+
+    if nr_workers <= 1:
+        _init_worker(compiled)
+        results = map(_run_task, tasks)
+        for sub_dataset_index, records in results: write(sub_dataset_index, records)
+    else:
+        with multiprocessing.Pool(nr_workers, initializer=_init_worker, initargs=(compiled,)) as pool:
+            # NOTE: imap preserves the order of the tasks, s.t. the records of each sub-dataset are written in order
+            for sub_dataset_index, records in pool.imap(_run_task, tasks):
+                write(sub_dataset_index, records)
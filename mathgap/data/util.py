@@ -1,8 +1,8 @@
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 import os
 import json
-
-import pandas as pd
+import csv
+import copy
 
 from mathgap.natlang.templates import Template, TemplateParser, TemplateWithMetadataParser, TemplateType, TemplateCatalog
 from mathgap.logicalforms import LogicalForm, Container, Transfer, CompEq, Comp, PartWhole
@@ -17,24 +17,57 @@ TEMPLATE_TYPES = {
     PartWhole: "partwhole"
 }
 
+# process-wide cache of loaded vocabularies, keyed by (kind, data_folder, version, mtime of the files)
+_VOCABULARY_CACHE: Dict[Tuple[str, str, str, float], Any] = {}
+
+def read_word_list(path: str) -> List[str]:
+    """ Reads the first column of a header-less csv-file (skipping blank lines) """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return [row[0] for row in csv.reader(f) if len(row) > 0 and row[0] != ""]
+
+def cached_vocabulary(kind: str, data_folder: str, version: str, files: List[str], load: Callable[[], Any]) -> Any:
+    """ 
+        Loads a vocabulary only once per process (or again once any of its files has been modified) 
+        - kind: name of the vocabulary (e.g. agents)
+        - files: all files the vocabulary is loaded from
+        - load: loads the vocabulary from the files
+        NOTE: returns a copy s.t. callers can modify it without affecting the cache
+    """
+    mtime = max(os.path.getmtime(f) for f in files)
+    key = (kind, os.path.abspath(data_folder), version, mtime)
+    if key not in _VOCABULARY_CACHE:
+        _VOCABULARY_CACHE[key] = load()
+    return copy.deepcopy(_VOCABULARY_CACHE[key])
+
+def clear_vocabulary_cache():
+    _VOCABULARY_CACHE.clear()
+
 def load_agents(data_folder: str = DATA_FOLDER, version: str = "v1") -> List[str]:
-    return list(pd.read_csv(os.path.join(data_folder, "agents", version, "agents.csv"), index_col=False, names=["name"])["name"])
+    path = os.path.join(data_folder, "agents", version, "agents.csv")
+    return cached_vocabulary("agents", data_folder, version, [path], lambda: read_word_list(path))
 
 def load_attributes(data_folder: str = DATA_FOLDER, version: str = "v1") -> List[str]:
-    return list(pd.read_csv(os.path.join(data_folder, "attributes", version, "attributes.csv"), index_col=False, names=["attr"])["attr"])
+    path = os.path.join(data_folder, "attributes", version, "attributes.csv")
+    return cached_vocabulary("attributes", data_folder, version, [path], lambda: read_word_list(path))
 
 def load_entities(data_folder: str = DATA_FOLDER, version: str = "v1") -> Dict[str, List[str] | Dict[str, str]]:
-    entities = list(pd.read_csv(os.path.join(data_folder, "entities", version, "entities.csv"), index_col=False, names=["entity"])["entity"]) 
-    with open(os.path.join(data_folder, "entities", version, "entity_unit_names.json"), "r") as f:
-        unit_by_entity = json.load(f)
-    with open(os.path.join(data_folder, "entities", version, "entities_part_whole.json"), "r") as f:
-        entities_part_whole = json.load(f)
-
-    return {
-        "entities_without_units": entities,
-        "entities_with_units": unit_by_entity,
-        "parts_by_whole": entities_part_whole
-    }
+    entities_file = os.path.join(data_folder, "entities", version, "entities.csv")
+    units_file = os.path.join(data_folder, "entities", version, "entity_unit_names.json")
+    part_whole_file = os.path.join(data_folder, "entities", version, "entities_part_whole.json")
+
+    def load():
+        entities = read_word_list(entities_file)
+        with open(units_file, "r") as f:
+            unit_by_entity = json.load(f)
+        with open(part_whole_file, "r") as f:
+            entities_part_whole = json.load(f)
+
+        return {
+            "entities_without_units": entities,
+            "entities_with_units": unit_by_entity,
+            "parts_by_whole": entities_part_whole
+        }
+    return cached_vocabulary("entities", data_folder, version, [entities_file, units_file, part_whole_file], load)
 
 def load_templates(data_folder: str = DATA_FOLDER, template_parser: TemplateParser = None, version: str = "v1") -> TemplateCatalog:
     """ Loads all natural-language templates of a specific version """
@@ -0,0 +1,56 @@
+from typing import Any, Dict
+from contextlib import contextmanager
+
+from mathgap.util import LRUCache
+
+class ExprCache:
+    """
+        Bounded memoization of stringifying expressions, keyed by (expression identity, instantiation identity, instantiation version).
+        NOTE: evaluation is memoized by the expressions themselves (see Expr.eval)
+        Because the version of an instantiation changes with every modification, entries never go stale and never have to be cleared by hand.
+
+        Activate it for a block of code with use_expr_cache, all expressions will then consult the cache:
+            with use_expr_cache(ExprCache(max_size=100_000)) as cache:
+                mwp.reasoning_trace_as_nl()
+            print(cache.stats())
+    """
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.strings = LRUCache(max_size)
+
+    def get_to_str(self, expr, instantiation, depth: int, with_parentheses: bool) -> str | None:
+        entry = self.strings.get((id(expr), instantiation.uid, instantiation.version, depth, with_parentheses))
+        return None if entry is None else entry[1]
+
+    def put_to_str(self, expr, instantiation, depth: int, with_parentheses: bool, text: str):
+        # NOTE: keep a reference to the expression s.t. its id cannot be re-used while the entry exists
+        self.strings.put((id(expr), instantiation.uid, instantiation.version, depth, with_parentheses), (expr, text))
+
+    def get_str(self, expr) -> str | None:
+        entry = self.strings.get((id(expr), None, None, None, None))
+        return None if entry is None else entry[1]
+
+    def put_str(self, expr, text: str):
+        self.strings.put((id(expr), None, None, None, None), (expr, text))
+
+    def clear(self):
+        self.strings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.strings.stats()
+
+_ACTIVE_CACHE: ExprCache = None
+
+def active_expr_cache() -> ExprCache | None:
+    """ The cache that expressions currently consult (None if caching is off) """
+    return _ACTIVE_CACHE
+
+@contextmanager
+def use_expr_cache(cache: ExprCache | None):
+    """ Makes all expressions consult cache within the block (None disables caching), restores the previous cache afterwards """
+    global _ACTIVE_CACHE
+    previous = _ACTIVE_CACHE
+    _ACTIVE_CACHE = cache
+    try:
+        yield cache
+    finally:
+        _ACTIVE_CACHE = previous
@@ -1,76 +1,175 @@
-from typing import Any, List
+from typing import Any, Callable, Dict, FrozenSet, List, Tuple
 import numpy as np
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
+from mathgap.exprcache import active_expr_cache
+
+# above this number of wrt_vars, gradients are accumulated sparsely (as variable => coefficient maps) and only densified once at the end
+SPARSE_GRAD_THRESHOLD = 32
+
+_MISSING = object() # marks that no (valid) result has been memoized
+
+# (list, tuple) of the wrt_vars of the last gradient, shared s.t. memoized gradients are mostly matched by identity (and wrt_vars is rarely copied)
+_last_wrt: Tuple[List[Any], Tuple[Any, ...]] = ([], ())
+
+def _wrt_key(wrt_vars: List[Any]) -> Tuple[Any, ...]:
+    """ Snapshot of wrt_vars under which gradients are memoized """
+    global _last_wrt
+    last_vars, last_key = _last_wrt
+    if isinstance(wrt_vars, list) and wrt_vars == last_vars: return last_key
+    wrt_key = tuple(wrt_vars)
+    if wrt_key == last_key: return last_key
+    _last_wrt = (list(wrt_key), wrt_key)
+    return wrt_key
 
-class Expr(BaseModel):
-    # memoize results (especially important if many subexpressions are evaluated)
-    is_cache_enabled: bool = Field(default=False)
 
+class Expr(BaseModel):
     def __init__(self, subexpressions: List['Expr'] = None, **data) -> None:
         super().__init__(**data)
         self._subexpressions = [] if subexpressions is None else subexpressions
-        self._cached_eval = None
-        self._cached_grad = None
+        # memoized results, stamped with the instantiation (uid, version) they were computed for
+        self._cached_eval = None # (uid, version, None, value)
+        self._cached_grad = None # (uid, version, wrt_key, grad)
+        self._cached_sparse_grad = None # (uid, version, None, sparse_grad)
+        self._free_variables = None
+        self._simplified = None # canonical expression this expression is evaluated through (see simplify)
+
+    @property
+    def simplified(self) -> 'Expr':
+        """ The canonical expression that eval and grad are computed on (see simplify), the expression itself if it hasn't been simplified """
+        return self if self._simplified is None else self._simplified
+
+    def set_simplified(self, simplified: 'Expr'):
+        """ Evaluates this expression through simplified from now on (which must evaluate to the same values) """
+        self._simplified = None if simplified is self else simplified
+
+    @property
+    def free_variables(self) -> FrozenSet[Any]:
+        """ Identifiers of all variables that occur in this expression """
+        if self._free_variables is None:
+            for expr in self._stale_subexpressions(lambda e: e._free_variables is not None):
+                expr._free_variables = frozenset().union(*[s._free_variables for s in expr._subexpressions])
+        return self._free_variables
+
+    def _is_unchanged_since(self, instantiation, version: int) -> bool:
+        """ Whether none of the variables of this expression have been modified after version """
+        changed = instantiation.changed_since(version)
+        return changed is not None and self.free_variables.isdisjoint(changed)
+
+    def _lookup(self, attribute: str, instantiation, wrt_key: Tuple[Any, ...] = None) -> Any:
+        """ 
+            The result memoized in attribute if it is still valid for the instantiation (and was computed with respect to the same variables), otherwise _MISSING 
+            - wrt_key: tuple of the variables the result was computed with respect to (i.e. a snapshot, s.t. equal lists match and modified lists don't)
+        """
+        cached = getattr(self, attribute)
+        if cached is None or cached[0] != instantiation.uid: return _MISSING
+        if cached[2] is not wrt_key and cached[2] != wrt_key: return _MISSING
+        if cached[1] != instantiation.version:
+            if not self._is_unchanged_since(instantiation, cached[1]): return _MISSING
+            setattr(self, attribute, (instantiation.uid, instantiation.version, cached[2], cached[3]))
+        return cached[3]
+
+    def _stale_subexpressions(self, is_fresh: Callable[['Expr'], bool]) -> List['Expr']:
+        """ 
+            This expression and all subexpressions that are not fresh (and are not below a fresh subexpression), 
+            ordered s.t. each expression comes after all of its subexpressions 
+            NOTE: iterative s.t. deep expressions don't exceed the recursion limit
+        """
+        order, visited = [], set([])
+        stack = [(self, False)]
+        while len(stack) > 0:
+            expr, children_done = stack.pop()
+            if children_done:
+                order.append(expr)
+                continue
+            if id(expr) in visited: continue
+            visited.add(id(expr))
+            if expr is not self and is_fresh(expr): continue
+            stack.append((expr, True))
+            stack.extend((c, False) for c in reversed(expr._subexpressions) if id(c) not in visited)
+        return order
+
+    def _memoized(self, attribute: str, instantiation, compute: Callable[['Expr'], Any], wrt_key: Tuple[Any, ...] = None) -> Any:
+        """ 
+            Returns the result memoized in attribute or computes it bottom-up, 
+            s.t. compute(expr) can rely on the results of all subexpressions of expr being memoized (i.e. never recurses deeper than one level)
+        """
+        value = self._lookup(attribute, instantiation, wrt_key)
+        if value is not _MISSING: return value
+
+        for expr in self._stale_subexpressions(lambda e: e._lookup(attribute, instantiation, wrt_key) is not _MISSING):
+            value = compute(expr)
+            setattr(expr, attribute, (instantiation.uid, instantiation.version, wrt_key, value))
+        return value
 
     def eval(self, instantiation):
         """ 
-            Evaluates this expression recursively 
+            Evaluates this expression (bottom-up, without recursion)
             - instantiation: assigning values to variables
+
+            NOTE: results are memoized per instantiation and only recomputed if any of the variables of the expression have changed since,
+                s.t. after modifying few variables, only the affected subexpressions are re-evaluated
+            NOTE: if the expression has been simplified, it is evaluated through its simplified expression
         """
-        if self.is_cache_enabled:
-            if self._cached_eval is None:
-                self._cached_eval = self._eval(instantiation)
-            return self._cached_eval
-        else:
-            return self._eval(instantiation)
+        if self._simplified is not None: return self._simplified.eval(instantiation)
+        return self._memoized("_cached_eval", instantiation, lambda e: e._eval(instantiation))
 
     def _eval(self, instantiation):
         ...
     
-    def grad(self, wrt_vars: List[Any], instantiation):
+    def grad(self, wrt_vars: List[Any], instantiation, sparse: bool = None):
         """
             Computes the gradient of this expression with respect to a list of variables
             under a given instantiation.
 
             - wrt_vars: the variable identifiers with respect to which the gradient should be computed
             - instantiation: instantiation of the variables
-            - allow_cache: whether or not the result should be cached for subsequent re-use
-                NOTE: you are then responsible for consistency (e.g. clearing cache if numbers change etc)
+            - sparse: whether the gradient should be accumulated through sparse_grad (instead of dense vectors at every subexpression),
+                by default only if there are more than SPARSE_GRAD_THRESHOLD wrt_vars
+
+            NOTE: results are memoized like eval (as long as the same variables are passed as wrt_vars), do not modify the returned array in-place
         """
-        if self.is_cache_enabled:
-            if self._cached_grad is None:
-                self._cached_grad = self._grad(wrt_vars, instantiation)
-            return self._cached_grad
-        else:
-            return self._grad(wrt_vars, instantiation)
+        if self._simplified is not None: return self._simplified.grad(wrt_vars, instantiation, sparse=sparse)
+        if sparse is None: sparse = len(wrt_vars) > SPARSE_GRAD_THRESHOLD
+        wrt_key = _wrt_key(wrt_vars)
+        if sparse:
+            def densify(expr: 'Expr') -> np.ndarray:
+                coefficients = expr.sparse_grad(instantiation)
+                return np.array([coefficients.get(v, 0.0) for v in wrt_vars], dtype=float)
+            # NOTE: only the gradient of this expression is densified, not the ones of its subexpressions
+            value = self._lookup("_cached_grad", instantiation, wrt_key)
+            if value is _MISSING:
+                value = densify(self)
+                self._cached_grad = (instantiation.uid, instantiation.version, wrt_key, value)
+            return value
+        return self._memoized("_cached_grad", instantiation, lambda e: e._grad(wrt_vars, instantiation), wrt_key=wrt_key)
+
+    def sparse_grad(self, instantiation) -> Dict[Any, float]:
+        """
+            Computes the gradient of this expression with respect to all of its free variables as a map of variable identifier => coefficient
+            (i.e. the cost only depends on the size of the expression, not on how many variables there are overall)
 
-    def _grad(self, wrt_vars: List[Any], instantiation, allow_cache: bool = False):
-        ...
+            - instantiation: instantiation of the variables
 
-    def enable_cache(self, recursive: bool = True):
-        """ 
-            Enables memoization of values
-            NOTE: you will be in charge of ensuring consistency (e.g. clearing the cache if the instantiation changes)
+            NOTE: results are memoized like eval, do not modify the returned map in-place
         """
-        self.is_cache_enabled = True
-        if recursive:
-            for s in self._subexpressions:
-                s.enable_cache(recursive)
-
-    def disable_cache(self, recursive: bool = True):
-        self.is_cache_enabled = False
-        if recursive:
-            for s in self._subexpressions:
-                s.disable_cache(recursive)
-
-    def clear_cache(self, recursive: bool = True):
-        self._cached_eval = None
-        self._cached_grad = None
-        if recursive:
-            for s in self._subexpressions:
-                s.clear_cache(recursive)
+        if self._simplified is not None: return self._simplified.sparse_grad(instantiation)
+        return self._memoized("_cached_sparse_grad", instantiation, lambda e: e._sparse_grad(instantiation))
+
+    def _sparse_grad(self, instantiation) -> Dict[Any, float]:
+        grad = {}
+        for subexpression, partial in zip(self._subexpressions, self._partials(instantiation)):
+            for identifier, coefficient in subexpression.sparse_grad(instantiation).items():
+                grad[identifier] = grad.get(identifier, 0.0) + partial * coefficient
+        return grad
+
+    def _grad(self, wrt_vars: List[Any], instantiation):
+        ...
+
+    def _partials(self, instantiation) -> List[float]:
+        """ Partial derivatives of this expression with respect to each of its direct subexpressions """
+        ...
     
     def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
         """ 
@@ -81,9 +180,64 @@ class Expr(BaseModel):
             - depth: beyond which depth should values be evaluated instead of being printed as expressions¨
             - with_parentheses: should all subexpressions be put into parentheses (to avoid incorrectness)
         """
+        cache = active_expr_cache()
+        return self._stringify(
+            depth,
+            atom_str=lambda expr: str(expr.eval(instantiation)),
+            format_str=lambda expr, substrings: expr._format(substrings, with_parentheses),
+            lookup=None if cache is None else lambda expr, d: cache.get_to_str(expr, instantiation, d, with_parentheses),
+            store=None if cache is None else lambda expr, d, text: cache.put_to_str(expr, instantiation, d, with_parentheses, text)
+        )
+
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        """ Combines the strings of the direct subexpressions into the string of this expression """
         ...
 
+    def _stringify(self, depth: int | None, atom_str: Callable[['Expr'], str], format_str: Callable[['Expr', List[str]], str],
+                   lookup: Callable[['Expr', int | None], str | None] = None, store: Callable[['Expr', int | None, str], None] = None) -> str:
+        """ 
+            Builds the string of this expression bottom-up (without recursion)
+            - depth: expressions at depth <= 0 (or without subexpressions) are converted through atom_str, None means unlimited
+            - atom_str: converts an expression that is not expanded any further
+            - format_str: combines the strings of the subexpressions of an expression
+            - lookup, store: optional cache of strings per (expression, depth)
+        """
+        strings: Dict[Tuple[int, int | None], str] = {}
+        stack = [(self, depth, False)]
+        while len(stack) > 0:
+            expr, d, children_done = stack.pop()
+            key = (id(expr), d)
+            if key in strings and not children_done: continue
+            child_depth = None if d is None else d - 1
+
+            if not children_done:
+                cached = None if lookup is None else lookup(expr, d)
+                if cached is not None:
+                    strings[key] = cached
+                    continue
+                if len(expr._subexpressions) == 0 or (d is not None and d <= 0):
+                    strings[key] = atom_str(expr)
+                else:
+                    stack.append((expr, d, True))
+                    stack.extend((c, child_depth, False) for c in reversed(expr._subexpressions))
+                    continue
+            else:
+                strings[key] = format_str(expr, [strings[(id(c), child_depth)] for c in expr._subexpressions])
+            if store is not None: store(expr, d, strings[key])
+        return strings[(id(self), depth)]
+
     def __str__(self) -> str:
+        cache = active_expr_cache()
+        return self._stringify(
+            None,
+            atom_str=lambda expr: expr._str(),
+            format_str=lambda expr, substrings: expr._format(substrings, with_parentheses=True),
+            lookup=None if cache is None else lambda expr, d: cache.get_str(expr),
+            store=None if cache is None else lambda expr, d, text: cache.put_str(expr, text)
+        )
+
+    def _str(self) -> str:
+        """ String of an expression without subexpressions """
         ...
 
 class Const(Expr):
@@ -98,10 +252,10 @@ class Const(Expr):
     def _grad(self, wrt_vars: List[Any], instantiation):
         return np.zeros(shape=(len(wrt_vars)))
 
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        return str(self.eval(instantiation))
+    def _partials(self, instantiation) -> List[float]:
+        return []
 
-    def __str__(self) -> str:
+    def _str(self) -> str:
         return str(self.value)
 
 class Variable(Expr):
@@ -109,17 +263,24 @@ class Variable(Expr):
 
     def __init__(self, identifier: Any) -> None:
         super().__init__(subexpressions=None, identifier=identifier)
+        self._free_variables = frozenset([identifier])
 
     def _eval(self, instantiation):
-        return instantiation._instantiations[self.identifier]
+        try:
+            return instantiation._instantiations[self.identifier]
+        except KeyError:
+            raise KeyError(f"{self.identifier} not instantiated") from None
 
     def _grad(self, wrt_vars: List[Any], instantiation):
         return np.array(list(map(lambda x: 1.0 * (x == self.identifier), wrt_vars)))
-    
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        return str(self.eval(instantiation))
 
-    def __str__(self) -> str:
+    def _sparse_grad(self, instantiation) -> Dict[Any, float]:
+        return {self.identifier: 1.0}
+
+    def _partials(self, instantiation) -> List[float]:
+        return []
+    
+    def _str(self) -> str:
         return str(self.identifier)
     
 class Sum(Expr):
@@ -134,19 +295,15 @@ class Sum(Expr):
     def _grad(self, wrt_vars: List[Any], instantiation):
         return sum([s.grad(wrt_vars, instantiation) for s in self.summands])
 
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        if depth > 0:
-            summands_str = [a.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses) for a in self.summands]
-            if with_parentheses:
-                return " + ".join([f"({a})" for a in summands_str])
-            else:
-                return " + ".join([f"{a}" for a in summands_str])
+    def _partials(self, instantiation) -> List[float]:
+        return [1.0 for _ in self.summands]
+
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        if with_parentheses:
+            return " + ".join([f"({a})" for a in substrings])
         else:
-            return str(self.eval(instantiation))
-    
-    def __str__(self) -> str:
-        return " + ".join([f"({str(a)})" for a in self.summands])
-    
+            return " + ".join([f"{a}" for a in substrings])
+
 class Addition(Sum):
     def __init__(self, summand1: Expr, summand2: Expr) -> None:
         super().__init__(summands=[summand1, summand2])
@@ -164,20 +321,54 @@ class Subtraction(Expr):
     def _grad(self, wrt_vars: List[Any], instantiation):
         return self.minuend.grad(wrt_vars, instantiation) - self.subtrahend.grad(wrt_vars, instantiation)
 
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        if depth > 0:
-            minuend_str = self.minuend.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            subtrahend_str = self.subtrahend.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            if with_parentheses:
-                return f"({minuend_str}) - ({subtrahend_str})"
-            else:
-                return f"{minuend_str} - {subtrahend_str}"
+    def _partials(self, instantiation) -> List[float]:
+        return [1.0, -1.0]
+
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        minuend_str, subtrahend_str = substrings
+        if with_parentheses:
+            return f"({minuend_str}) - ({subtrahend_str})"
         else:
-            return str(self.eval(instantiation))
+            return f"{minuend_str} - {subtrahend_str}"
+
+class SignedSum(Expr):
+    """ n-ary sum of terms that are each scaled by an (integer) coefficient, plus a constant (e.g. a flattened chain of additions and subtractions) """
+    terms: List[Expr]
+    coefficients: List[Any]
+    constant: Any
+
+    def __init__(self, terms: List[Expr], coefficients: List[Any], constant: Any = 0) -> None:
+        super().__init__(subexpressions=terms, terms=terms, coefficients=coefficients, constant=constant)
+
+    def _eval(self, instantiation):
+        value = 0
+        for term, coefficient in zip(self.terms, self.coefficients):
+            if coefficient == 1: value += term.eval(instantiation)
+            elif coefficient == -1: value -= term.eval(instantiation)
+            else: value += coefficient * term.eval(instantiation)
+        return value + self.constant if self.constant != 0 else value
+
+    def _grad(self, wrt_vars: List[Any], instantiation):
+        return sum([coefficient * term.grad(wrt_vars, instantiation) for term, coefficient in zip(self.terms, self.coefficients)])
+
+    def _partials(self, instantiation) -> List[float]:
+        return [float(coefficient) for coefficient in self.coefficients]
+
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        signed_parts = []
+        for substring, coefficient in zip(substrings, self.coefficients):
+            part = f"({substring})" if with_parentheses else substring
+            if abs(coefficient) != 1: part = f"{abs(coefficient)} * {part}"
+            signed_parts.append((coefficient < 0, part))
+        if self.constant != 0 or len(signed_parts) == 0:
+            signed_parts.append((self.constant < 0, str(abs(self.constant))))
+
+        is_negative, text = signed_parts[0]
+        if is_negative: text = f"-{text}"
+        for is_negative, part in signed_parts[1:]:
+            text += f" - {part}" if is_negative else f" + {part}"
+        return text
 
-    def __str__(self) -> str:
-        return f"({str(self.minuend)}) - ({str(self.subtrahend)})"
-    
 class Product(Expr):
     factor1: Expr
     factor2: Expr
@@ -194,19 +385,15 @@ class Product(Expr):
         return self.factor2.eval(instantiation) * self.factor1.grad(wrt_vars, instantiation) \
              + self.factor1.eval(instantiation) * self.factor2.grad(wrt_vars, instantiation)
 
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        if depth > 0:
-            factor1_str = self.factor1.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            factor2_str = self.factor2.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            if with_parentheses:
-                return f"({factor1_str}) * ({factor2_str})"
-            else:
-                return f"{factor1_str} * {factor2_str}"
-        else:
-            return str(self.eval(instantiation))
+    def _partials(self, instantiation) -> List[float]:
+        return [self.factor2.eval(instantiation), self.factor1.eval(instantiation)]
 
-    def __str__(self) -> str:
-        return f"({str(self.factor1)}) * ({str(self.factor2)})"
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        factor1_str, factor2_str = substrings
+        if with_parentheses:
+            return f"({factor1_str}) * ({factor2_str})"
+        else:
+            return f"{factor1_str} * {factor2_str}"
 
 class Fraction(Expr):
     numerator: Expr
@@ -225,16 +412,166 @@ class Fraction(Expr):
         return 1.0 / dval * self.numerator.grad(wrt_vars, instantiation) \
              - self.numerator.eval(instantiation) / (dval**2) * self.denominator.grad(wrt_vars, instantiation)
 
-    def to_str(self, instantiation, depth: int, with_parentheses: bool = True) -> str:
-        if depth > 0:
-            numerator_str = self.numerator.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            denominator_str = self.denominator.to_str(instantiation, depth=depth-1, with_parentheses=with_parentheses)
-            if with_parentheses:
-                return f"({numerator_str}) / ({denominator_str})"
+    def _partials(self, instantiation) -> List[float]:
+        dval = self.denominator.eval(instantiation)
+        return [1.0 / dval, -self.numerator.eval(instantiation) / (dval**2)]
+
+    def _format(self, substrings: List[str], with_parentheses: bool) -> str:
+        numerator_str, denominator_str = substrings
+        if with_parentheses:
+            return f"({numerator_str}) / ({denominator_str})"
+        else:
+            return f"{numerator_str} / {denominator_str}"
+
+def topological_order(roots: List[Expr]) -> List[Expr]:
+    """ 
+        All distinct (sub-)expressions of roots, ordered s.t. each expression comes after all of its subexpressions 
+        NOTE: iterative s.t. deep trees don't exceed the recursion limit
+    """
+    order, visited = [], set([])
+    for root in roots:
+        stack = [(root, False)]
+        while len(stack) > 0:
+            expr, children_done = stack.pop()
+            if children_done:
+                order.append(expr)
+                continue
+            if id(expr) in visited: continue
+            visited.add(id(expr))
+            stack.append((expr, True))
+            stack.extend((c, False) for c in reversed(expr._subexpressions) if id(c) not in visited)
+    return order
+
+def _signed_subexpressions(expr: Expr) -> List[Tuple[Expr, Any]]:
+    """ The direct subexpressions of an additive expression with their coefficients """
+    if isinstance(expr, SignedSum): return list(zip(expr.terms, expr.coefficients))
+    if isinstance(expr, Subtraction): return [(expr.minuend, 1), (expr.subtrahend, -1)]
+    return [(summand, 1) for summand in expr.summands]
+
+def simplify(roots: List[Expr]) -> List[Expr]:
+    """
+        Canonicalizes the expressions of roots (e.g. the quantities of all nodes of a tree) into a smaller graph that evaluates to the same values:
+        - chains of additions/subtractions are flattened into n-ary SignedSums, but only through subexpressions that are neither roots
+          nor shared (s.t. no intermediate result has to be computed twice)
+        - identical subexpressions are shared (hash-consing), s.t. each of them is only evaluated (and differentiated) once
+        - subexpressions that only involve constants are folded
+        Returns the simplified expression of each root, which re-uses the original expressions wherever nothing could be simplified
+        NOTE: the original expressions are left untouched (e.g. s.t. to_str can still render their structure)
+        NOTE: iterative s.t. deep trees don't exceed the recursion limit
+    """
+    additive_types = (Sum, Subtraction, SignedSum)
+    order = topological_order(roots)
+    root_ids = set([id(r) for r in roots])
+
+    # additive expressions that are only used by a single additive expression (and aren't roots) are inlined into it
+    parents_by_id: Dict[int, List[Expr]] = {}
+    for expr in order:
+        for subexpression in expr._subexpressions:
+            parents_by_id.setdefault(id(subexpression), []).append(expr)
+    inlined_ids = set([
+        id(expr) for expr in order 
+        if isinstance(expr, additive_types) and id(expr) not in root_ids 
+        and len(parents_by_id.get(id(expr), [])) == 1 and isinstance(parents_by_id[id(expr)][0], additive_types)
+    ])
+
+    canonical_by_key: Dict[Any, Expr] = {}
+    def canonical(key: Any, expr: Expr) -> Expr:
+        try:
+            return canonical_by_key.setdefault(key, expr)
+        except TypeError:
+            return expr # NOTE: unhashable (e.g. variables identified by expressions) are not shared
+
+    def const(value: Any) -> Expr:
+        return canonical(("const", type(value), value), Const(value))
+
+    simplified_by_id: Dict[int, Expr] = {}
+    terms_by_id: Dict[int, Tuple[List[Tuple[Expr, Any]], Any]] = {} # inlined expression => (terms with coefficients, constant)
+    for expr in order:
+        if isinstance(expr, Const):
+            simplified_by_id[id(expr)] = canonical(("const", type(expr.value), expr.value), expr)
+        elif isinstance(expr, Variable):
+            simplified_by_id[id(expr)] = canonical(("var", expr.identifier), expr)
+        elif isinstance(expr, additive_types):
+            coefficient_by_term: Dict[int, List] = {} # id(term) => [term, coefficient] (in order of first occurrence)
+            def add_term(term: Expr, coefficient: Any):
+                entry = coefficient_by_term.setdefault(id(term), [term, 0])
+                entry[1] += coefficient
+
+            constant = expr.constant if isinstance(expr, SignedSum) else 0
+            for subexpression, sign in _signed_subexpressions(expr):
+                if id(subexpression) in inlined_ids:
+                    sub_terms, sub_constant = terms_by_id.pop(id(subexpression))
+                    for term, coefficient in sub_terms: add_term(term, sign * coefficient)
+                    constant += sign * sub_constant
+                    continue
+                simplified_subexpression = simplified_by_id[id(subexpression)]
+                if isinstance(simplified_subexpression, Const):
+                    constant += sign * simplified_subexpression.value
+                else:
+                    add_term(simplified_subexpression, sign)
+            terms = [(term, coefficient) for term, coefficient in coefficient_by_term.values() if coefficient != 0]
+
+            if id(expr) in inlined_ids:
+                terms_by_id[id(expr)] = (terms, constant)
+            elif len(terms) == 0:
+                simplified_by_id[id(expr)] = const(constant)
+            elif len(terms) == 1 and terms[0][1] == 1 and constant == 0:
+                simplified_by_id[id(expr)] = terms[0][0]
             else:
-                return f"{numerator_str} / {denominator_str}"
+                key = ("sum", tuple([(id(term), coefficient) for term, coefficient in terms]), type(constant), constant)
+                original_terms = [(simplified_by_id.get(id(s)), c) for s,c in _signed_subexpressions(expr)]
+                is_unchanged = constant == (expr.constant if isinstance(expr, SignedSum) else 0) \
+                    and len(original_terms) == len(terms) and all([a is b and c == d for (a,c),(b,d) in zip(original_terms, terms)])
+                simplified = expr if is_unchanged else SignedSum([t for t,_ in terms], [c for _,c in terms], constant)
+                simplified_by_id[id(expr)] = canonical(key, simplified)
+        elif isinstance(expr, (Product, Fraction)):
+            subexpressions = [simplified_by_id[id(s)] for s in expr._subexpressions]
+            if all([isinstance(s, Const) for s in subexpressions]) and not (isinstance(expr, Fraction) and subexpressions[1].value == 0):
+                a, b = [s.value for s in subexpressions]
+                simplified_by_id[id(expr)] = const(a * b if isinstance(expr, Product) else a / b)
+                continue
+            is_unchanged = all([a is b for a,b in zip(subexpressions, expr._subexpressions)])
+            simplified = expr if is_unchanged else type(expr)(*subexpressions)
+            simplified_by_id[id(expr)] = canonical((type(expr), tuple([id(s) for s in subexpressions])), simplified)
         else:
-            return str(self.eval(instantiation))
-
-    def __str__(self) -> str:
-        return f"({str(self.numerator)}) / ({str(self.denominator)})"
\ No newline at end of file
+            simplified_by_id[id(expr)] = expr # NOTE: unknown kinds of expressions are kept as they are
+
+    return [simplified_by_id[id(root)] for root in roots]
+
+def weighted_sparse_grad(roots: List[Expr], root_weights: List[float], instantiation, order: List[Expr] = None) -> Dict[Any, float]:
+    """
+        Computes sum_r root_weights[r] * d root_r / d x for all variables x in a single backward sweep (reverse-mode) over the shared expressions of all roots,
+        i.e. the cost is independent of how many roots have a non-zero weight and each subexpression is visited only once.
+        Returns a map of variable identifier => coefficient (variables with a zero coefficient might be missing)
+
+        - roots: the expressions whose gradients should be accumulated
+        - root_weights: weight of each root (roots with weight 0 don't contribute)
+        - instantiation: instantiation of the variables
+        - order: topological_order(roots), can be passed in if the same roots are differentiated repeatedly
+    """
+    if order is None: order = topological_order(roots)
+
+    adjoints = {}
+    for root, weight in zip(roots, root_weights):
+        adjoints[id(root)] = adjoints.get(id(root), 0.0) + weight
+
+    grad = {}
+    for expr in reversed(order):
+        adjoint = adjoints.pop(id(expr), 0.0)
+        if adjoint == 0.0: continue
+        if isinstance(expr, Variable):
+            grad[expr.identifier] = grad.get(expr.identifier, 0.0) + adjoint
+            continue
+        for subexpression, partial in zip(expr._subexpressions, expr._partials(instantiation)):
+            adjoints[id(subexpression)] = adjoints.get(id(subexpression), 0.0) + adjoint * partial
+    return grad
+
+def weighted_grad(roots: List[Expr], root_weights: List[float], wrt_vars: List[Any], instantiation, order: List[Expr] = None) -> np.ndarray:
+    """
+        Same as weighted_sparse_grad but returns the gradient as a dense vector (with respect to wrt_vars)
+
+        - wrt_vars: the variable identifiers with respect to which the gradient should be computed
+        (see weighted_sparse_grad for all other parameters)
+    """
+    coefficients = weighted_sparse_grad(roots, root_weights, instantiation, order=order)
+    return np.array([coefficients.get(v, 0.0) for v in wrt_vars], dtype=float)
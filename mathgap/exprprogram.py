@@ -0,0 +1,163 @@
+from typing import Any, Dict, List, Tuple
+import copy
+import numpy as np
+
+from mathgap.expressions import Expr, Const, Variable, Sum, SignedSum, Subtraction, Product, Fraction
+
+OP_CONST = 0
+OP_INPUT = 1 # variable that is not a parameter (e.g. preselected), value is fixed per evaluation
+OP_SUM = 2
+OP_SUB = 3
+OP_MUL = 4
+OP_DIV = 5
+OP_SIGNED_SUM = 6
+
+class ExprProgram:
+    """
+        Compiles a set of expressions (sharing subexpressions) into a flat list of operations over slots,
+        s.t. they can be evaluated and differentiated for a whole batch of parameter-instantiations at once using numpy.
+
+        Slots 0..len(parameters)-1 hold the parameters, every other (distinct) subexpression gets its own slot.
+
+        - roots: the expressions that should be computed (e.g. all quantities of the inner nodes of a tree)
+        - parameters: the variable identifiers that will be varied (i.e. the rows of the batch-matrices)
+    """
+    def __init__(self, roots: List[Expr], parameters: List[Any]) -> None:
+        self.parameters = parameters
+        self.nr_parameters = len(parameters)
+        self.ops: List[Tuple[int, int, Any]] = [] # (op-code, out-slot, args)
+        self.inputs: List[Tuple[int, Any]] = [] # (slot, variable identifier)
+
+        slot_by_param = {p: i for i,p in enumerate(parameters)}
+        slot_by_expr: Dict[int, int] = {}
+        self.nr_slots = self.nr_parameters
+
+        def new_slot() -> int:
+            self.nr_slots += 1
+            return self.nr_slots - 1
+
+        # NOTE: iterative post-order s.t. deep trees don't exceed the recursion limit
+        for root in roots:
+            stack = [(root, False)]
+            while len(stack) > 0:
+                expr, children_done = stack.pop()
+                if id(expr) in slot_by_expr: continue
+
+                if isinstance(expr, Variable):
+                    if expr.identifier in slot_by_param:
+                        slot_by_expr[id(expr)] = slot_by_param[expr.identifier]
+                    else:
+                        slot = new_slot()
+                        self.inputs.append((slot, expr.identifier))
+                        slot_by_expr[id(expr)] = slot
+                    continue
+                if isinstance(expr, Const):
+                    slot = new_slot()
+                    self.ops.append((OP_CONST, slot, expr.value))
+                    slot_by_expr[id(expr)] = slot
+                    continue
+
+                children = self._children(expr)
+                if not children_done:
+                    stack.append((expr, True))
+                    stack.extend((c, False) for c in reversed(children) if id(c) not in slot_by_expr)
+                    continue
+
+                args = [slot_by_expr[id(c)] for c in children]
+                slot = new_slot()
+                if isinstance(expr, Sum):
+                    self.ops.append((OP_SUM, slot, args))
+                elif isinstance(expr, SignedSum):
+                    self.ops.append((OP_SIGNED_SUM, slot, (args, np.array(expr.coefficients, dtype=float)[:, None], expr.constant)))
+                elif isinstance(expr, Subtraction):
+                    self.ops.append((OP_SUB, slot, args))
+                elif isinstance(expr, Product):
+                    self.ops.append((OP_MUL, slot, args))
+                elif isinstance(expr, Fraction):
+                    self.ops.append((OP_DIV, slot, args))
+                slot_by_expr[id(expr)] = slot
+
+        self.root_slots = np.array([slot_by_expr[id(r)] for r in roots], dtype=int)
+
+    def remapped(self, parameters: List[Any], identifier_map: Dict[Any, Any]) -> 'ExprProgram':
+        """
+            The same program (sharing its operations) over other variables, e.g. for a tree with the same structure
+            - parameters: the new parameters (corresponding to the current ones)
+            - identifier_map: maps the identifiers of all other variables (inputs) onto their new identifiers
+        """
+        program = copy.copy(self)
+        program.parameters = parameters
+        program.inputs = [(slot, identifier_map[identifier]) for slot, identifier in self.inputs]
+        return program
+
+    def _children(self, expr: Expr) -> List[Expr]:
+        if isinstance(expr, Sum): return expr.summands
+        if isinstance(expr, SignedSum): return expr.terms
+        if isinstance(expr, Subtraction): return [expr.minuend, expr.subtrahend]
+        if isinstance(expr, Product): return [expr.factor1, expr.factor2]
+        if isinstance(expr, Fraction): return [expr.numerator, expr.denominator]
+        raise NotImplementedError(f"Cannot compile expressions of type {type(expr)}")
+
+    def evaluate(self, params: np.ndarray, instantiation = None) -> np.ndarray:
+        """
+            Evaluates all slots for a batch of parameter-instantiations
+            - params: (nr_parameters, batch_size) matrix
+            - instantiation: provides the values of all variables that are not parameters
+            Returns the values of all slots (nr_slots, batch_size), use root_slots to select the values of the roots
+        """
+        batch_size = params.shape[1]
+        values = np.empty(shape=(self.nr_slots, batch_size), dtype=float)
+        values[:self.nr_parameters] = params
+        for slot, identifier in self.inputs:
+            values[slot] = instantiation._instantiations[identifier]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for op, out, args in self.ops:
+                if op == OP_SUM:
+                    values[out] = values[args].sum(axis=0)
+                elif op == OP_SUB:
+                    values[out] = values[args[0]] - values[args[1]]
+                elif op == OP_MUL:
+                    values[out] = values[args[0]] * values[args[1]]
+                elif op == OP_DIV:
+                    values[out] = values[args[0]] / values[args[1]]
+                elif op == OP_SIGNED_SUM:
+                    slots, coefficients, constant = args
+                    values[out] = (coefficients * values[slots]).sum(axis=0) + constant
+                elif op == OP_CONST:
+                    values[out] = args
+        return values
+
+    def roots(self, values: np.ndarray) -> np.ndarray:
+        """ Selects the values of the roots (nr_roots, batch_size) from the values of all slots """
+        return values[self.root_slots]
+
+    def vjp(self, values: np.ndarray, root_weights: np.ndarray) -> np.ndarray:
+        """
+            Computes sum_r root_weights[r] * d root_r / d params for each element of the batch in a single backward sweep
+            - values: the values of all slots as computed by evaluate
+            - root_weights: (nr_roots, batch_size) weight of each root
+            Returns a (nr_parameters, batch_size) matrix
+        """
+        adjoints = np.zeros_like(values)
+        np.add.at(adjoints, self.root_slots, root_weights)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for op, out, args in reversed(self.ops):
+                adj = adjoints[out]
+                if op == OP_SUM:
+                    for a in args: adjoints[a] += adj
+                elif op == OP_SUB:
+                    adjoints[args[0]] += adj
+                    adjoints[args[1]] -= adj
+                elif op == OP_SIGNED_SUM:
+                    slots, coefficients, _ = args
+                    np.add.at(adjoints, slots, coefficients * adj)
+                elif op == OP_MUL:
+                    adjoints[args[0]] += adj * values[args[1]]
+                    adjoints[args[1]] += adj * values[args[0]]
+                elif op == OP_DIV:
+                    denominator = values[args[1]]
+                    adjoints[args[0]] += adj / denominator
+                    adjoints[args[1]] -= adj * values[args[0]] / denominator**2
+        return adjoints[:self.nr_parameters]
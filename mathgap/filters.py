@@ -0,0 +1,127 @@
+from typing import Any, Dict, List
+import hashlib
+
+from mathgap.mathwordproblems import MathWordProblem
+from mathgap.util import BoundedHashSet, BloomFilter
+
+def normalize_text(text: str) -> str:
+    """ Normalizes natural language s.t. minor differences in casing and whitespace are ignored """
+    return " ".join(text.lower().split())
+
+def surface_hash(mwp: MathWordProblem) -> str:
+    """ Hash of the rendered problem and its answers """
+    assert mwp.ps_nl is not None, "Requires the problem to be rendered as natural language"
+    surface = "\n".join([
+        normalize_text(mwp.ps_nl),
+        normalize_text(mwp.answers_nl) if mwp.answers_nl is not None else "",
+        repr(mwp.numerical_answers)
+    ])
+    return hashlib.blake2b(surface.encode("utf-8"), digest_size=16).hexdigest()
+
+class MWPFilter:
+    def accept(self, mwp: MathWordProblem) -> bool:
+        """ Returns true if the mwp should be kept, false if it should be dropped """
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        """ Counters about what has been filtered so far """
+        return {}
+
+class AllFilter(MWPFilter):
+    """ Accepts a mwp only if all of its sub-filters accept it (sub-filters are evaluated in order and stop at the first rejection) """
+    def __init__(self, filters: List[MWPFilter]) -> None:
+        self.filters = filters
+
+    def accept(self, mwp: MathWordProblem) -> bool:
+        return all(f.accept(mwp) for f in self.filters)
+
+    def stats(self) -> Dict[str, Any]:
+        return {type(f).__name__: f.stats() for f in self.filters}
+
+class DedupFilter(MWPFilter):
+    """
+        Streaming filter that drops mwps which have been seen before, either
+        - by_structure: the proof tree is structurally identical (up to renaming of agents, entities etc)
+        - by_surface: the rendered problem and answers are identical
+
+        Seen hashes are kept in memory-bounded sets:
+        - max_size: if specified, an exact set remembering the max_size most recent hashes is used
+        - otherwise: a bloom filter with fixed capacity and error-rate is used (false positives drop a few unique mwps)
+
+        NOTE: when deduplicating by structure, make sure the generator can produce enough distinct structures,
+        otherwise generation stalls (e.g. there's only few linear trees of depth 1, see max_consecutive_rejections of generate_mwps_iter).
+    """
+    def __init__(self, by_structure: bool = True, by_surface: bool = True, max_size: int = None,
+                 bloom_capacity: int = 10_000_000, bloom_error_rate: float = 1e-4) -> None:
+        assert by_structure or by_surface, "Need to deduplicate by at least one of structure or surface"
+        self.by_structure = by_structure
+        self.by_surface = by_surface
+
+        def create_set():
+            if max_size is not None:
+                return BoundedHashSet(max_size)
+            return BloomFilter(bloom_capacity, bloom_error_rate)
+
+        self.seen_structures = create_set() if by_structure else None
+        self.seen_surfaces = create_set() if by_surface else None
+
+        self.nr_seen = 0
+        self.nr_accepted = 0
+        self.nr_structure_duplicates = 0
+        self.nr_surface_duplicates = 0
+
+    def accept(self, mwp: MathWordProblem) -> bool:
+        self.nr_seen += 1
+
+        if self.by_structure:
+            s_hash = mwp.tree.structural_hash()
+            if s_hash in self.seen_structures:
+                self.nr_structure_duplicates += 1
+                return False
+
+        if self.by_surface:
+            t_hash = surface_hash(mwp)
+            if t_hash in self.seen_surfaces:
+                self.nr_surface_duplicates += 1
+                return False
+
+        # only remember accepted mwps
+        if self.by_structure: self.seen_structures.add(s_hash)
+        if self.by_surface: self.seen_surfaces.add(t_hash)
+
+        self.nr_accepted += 1
+        return True
+
+    @property
+    def nr_dropped(self) -> int:
+        return self.nr_structure_duplicates + self.nr_surface_duplicates
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seen": self.nr_seen,
+            "accepted": self.nr_accepted,
+            "dropped": self.nr_dropped,
+            "structure_duplicates": self.nr_structure_duplicates,
+            "surface_duplicates": self.nr_surface_duplicates
+        }
+
+class QuotaFilter(MWPFilter):
+    """ Drops mwps whose stratum has already been filled (see StratifiedGenerator) """
+    def __init__(self, generator: 'StratifiedGenerator') -> None:
+        self.generator = generator
+        self.nr_seen = 0
+        self.nr_over_quota = 0
+
+    def accept(self, mwp: MathWordProblem) -> bool:
+        self.nr_seen += 1
+        if not self.generator.has_room(mwp.tree):
+            self.nr_over_quota += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seen": self.nr_seen,
+            "over_quota": self.nr_over_quota,
+            "fill": dict(self.generator.fill)
+        }
@@ -1,20 +1,28 @@
 from typing import List, Tuple, Generator as GeneratorType
+from contextlib import nullcontext
 import random
 
 from mathgap.logicalforms.comp import ADDITIVE_COMP_TYPES, ComparisonType
 from mathgap.natlang.templates.template import NEW_LINE, TextPart
-from mathgap.trees.generators import Generator, GeneralGenerator, UniformPolicy, RuleSamplingPolicy, Criterion, BranchDepthCriterion
+from mathgap.trees.generators import Generator, GeneralGenerator, StratifiedGenerator, UniformPolicy, RuleSamplingPolicy, Criterion, BranchDepthCriterion
 from mathgap.trees.generators.policies.nonlinearpolicy import NonlinearPolicy
 from mathgap.trees.rules import ContTransferCont, ContCompCont, ContCompCompeqCont, ContContComp, ContPartWhole, InferenceRule
 from mathgap.logicalforms import Container, PartWhole, LogicalForm, Comp
-from mathgap.instantiate import PerPropTypeInstantiator, WordListInstantiator, PositiveRandIntInstantiator, PartAndUnitAwareEntityInstantiator, EntityAwareUnitInstantiator, Instantiator
+from mathgap.instantiate import InstantiationError, PerPropTypeInstantiator, WordListInstantiator, PositiveRandIntInstantiator, PartAndUnitAwareEntityInstantiator, EntityAwareUnitInstantiator, Instantiator
 from mathgap.properties import PropertyType
+from mathgap.trees import ProofTree
+from mathgap.trees.prooftree import TreeNode, property_keys
+from mathgap.instantiate import Instantiation
 from mathgap.natlang.templates import TemplateSampler, ProblemStructureSampler, ProblemStructureRenderer, TemplateRenderer, ProblemStructureAnswersSampler, ReasoningTraceSampler, ReasoningTraceRenderer
 from mathgap.data.util import load_templates, load_agents, load_attributes, load_entities, DATA_FOLDER
 from mathgap import MathWordProblem
 from mathgap.trees.sampling.canonical import CanonicalOrderSampler
 from mathgap.trees.sampling.order import OrderSampler
 from mathgap.trees.sampling.movement import FrontMovementOrderSampler
+from mathgap.filters import MWPFilter, AllFilter, QuotaFilter
+from mathgap.metrics import GenerationMetrics
+from mathgap.exprcache import ExprCache, use_expr_cache
+from mathgap.util import derive_seed
 
 CONT_START_TYPE = [
     Container
@@ -143,35 +151,119 @@ def default_templates_and_samplers(data_folder: str = DATA_FOLDER, dataversion:
 
     return ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer
 
+class GenerationStalledError(RuntimeError):
+    """ Raised if generating mwps is given up because the attempts keep failing (e.g. the filter rejects every tree the generator can produce) """
+
 def generate_mwps(nr_problems: int, generator: Generator, instantiator: Instantiator, order_sampler: OrderSampler,
                   ps_template_sampler: ProblemStructureSampler, ps_answers_template_sampler: ProblemStructureAnswersSampler,
                   ps_renderer: ProblemStructureRenderer, rt_template_sampler: ReasoningTraceSampler, rt_renderer: ReasoningTraceRenderer, 
-                  seed: int = 14) -> List[MathWordProblem]:
-    """ Generates a list of mathwordproblems """
+                  seed: int = 14, mwp_filter: MWPFilter = None, metrics: GenerationMetrics = None, 
+                  instantiation_retries: int = 0, max_repairs: int = 0, expr_cache: ExprCache = None,
+                  seed_mode: str = "chain", start_index: int = 0, max_consecutive_rejections: int = 10_000) -> List[MathWordProblem]:
+    """ 
+        Generates a list of mathwordproblems 
+        
+        NOTE: with seed_mode="counter", generate_mwps(n, ..., start_index=k) returns the problems k..k+n-1 of the stream (e.g. to generate shards in parallel)
+    """
     mwp_iter = generate_mwps_iter(generator, instantiator, order_sampler, 
                                   ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
-                                  rt_template_sampler, rt_renderer, seed)
+                                  rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, metrics=metrics,
+                                  instantiation_retries=instantiation_retries, max_repairs=max_repairs, expr_cache=expr_cache,
+                                  seed_mode=seed_mode, start_index=start_index, max_consecutive_rejections=max_consecutive_rejections)
     return [
         next(mwp_iter)
         for i in range(nr_problems)
     ]
 
+def generate_stratified_mwps(generator: StratifiedGenerator, instantiator: Instantiator, order_sampler: OrderSampler,
+                             ps_template_sampler: ProblemStructureSampler, ps_answers_template_sampler: ProblemStructureAnswersSampler,
+                             ps_renderer: ProblemStructureRenderer, rt_template_sampler: ReasoningTraceSampler, rt_renderer: ReasoningTraceRenderer, 
+                             seed: int = 14, mwp_filter: MWPFilter = None, metrics: GenerationMetrics = None, 
+                             instantiation_retries: int = 0, max_repairs: int = 0, expr_cache: ExprCache = None,
+                             max_attempts: int = None) -> List[MathWordProblem]:
+    """ 
+        Generates mwps until every quota of the stratified generator is met exactly (mwps of strata that are already filled are dropped) 
+
+        - max_attempts: after how many attempts (in total) a GenerationStalledError with the remaining quotas is raised, 
+            e.g. if no tree is ever attributed to a stratum or the trees of a stratum can never be instantiated (default: 100 attempts per required mwp)
+    """
+    if max_attempts is None: max_attempts = 100 * generator.total_quota
+
+    quota_filter = QuotaFilter(generator)
+    mwp_filter = quota_filter if mwp_filter is None else AllFilter([quota_filter, mwp_filter])
+    mwp_iter = generate_mwps_iter(generator, instantiator, order_sampler, 
+                                  ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
+                                  rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, metrics=metrics,
+                                  instantiation_retries=instantiation_retries, max_repairs=max_repairs, expr_cache=expr_cache,
+                                  max_attempts=max_attempts)
+    mwps = []
+    try:
+        while not generator.is_filled:
+            mwps.append(next(mwp_iter))
+    except GenerationStalledError as e:
+        remaining = {s: generator.remaining(s) for s in generator.quotas.keys() if generator.remaining(s) > 0}
+        raise GenerationStalledError(f"{e}, the quotas of the strata {remaining} (stratum: nr of missing mwps) could not be met") from e
+    return mwps
+
 def generate_mwps_iter(generator: Generator, instantiator: Instantiator, order_sampler: OrderSampler,
                        ps_template_sampler: ProblemStructureSampler, ps_answers_template_sampler: ProblemStructureAnswersSampler,
                        ps_renderer: ProblemStructureRenderer, rt_template_sampler: ReasoningTraceSampler, rt_renderer: ReasoningTraceRenderer, 
-                       seed: int = 14) -> GeneratorType[MathWordProblem, None, None]:
-    """ Generates a list of mathwordproblems iteratively """
+                       seed: int = 14, mwp_filter: MWPFilter = None, metrics: GenerationMetrics = None,
+                       instantiation_retries: int = 0, max_repairs: int = 0, expr_cache: ExprCache = None,
+                       seed_mode: str = "chain", start_index: int = 0, max_consecutive_rejections: int = 10_000, 
+                       max_attempts: int = None) -> GeneratorType[MathWordProblem, None, None]:
+    """ 
+        Generates a list of mathwordproblems iteratively 
+        
+        - mwp_filter: if specified, only mwps accepted by the filter are yielded (e.g. to drop duplicates)
+        - metrics: if specified, records the wall-time of each stage, the instantiation effort and the failure reasons of every attempt
+        - instantiation_retries: how many more times the instantiation of a tree is retried (with a different seed) before the tree is discarded.
+            NOTE: this saves re-generating the tree and reduces the bias towards trees that are easy to instantiate
+        - max_repairs: how many times the subtree that makes a tree impossible to instantiate is regenerated (keeping the rest of the tree) before the tree is discarded.
+            NOTE: this requires a generator that supports repairing (e.g. GeneralGenerator)
+        - expr_cache: if specified, evaluating and stringifying expressions is memoized while computing the answers and rendering (see ExprCache)
+        - seed_mode: how the seed of each attempt is derived
+            - chain: each seed is drawn from a generator seeded with the previous seed (i.e. problem i can only be reproduced by replaying all previous attempts)
+            - counter: the seed of attempt a at problem i is derive_seed(seed, i, a), s.t. each problem only depends on its own index 
+                (i.e. can be regenerated on its own, see generate_mwp_at, and failed attempts don't shift later problems).
+                NOTE: this only holds if the generator, instantiator and filter don't carry state across problems (e.g. not for AdaptiveMultiGenerator or a duplicate filter)
+        - start_index: index of the first problem (only relevant for seed_mode="counter")
+        - max_consecutive_rejections: after how many mwps in a row that are rejected by the filter a GenerationStalledError is raised (None = never).
+            NOTE: e.g. excluding by structure against a reference dataset that contains all structures the generator can produce rejects every mwp
+        - max_attempts: after how many attempts (in total, accepted or not) a GenerationStalledError is raised (None = never)
+
+        The generator receives feedback about whether each of its trees was accepted (see AdaptiveMultiGenerator).
+    """
+    if metrics is None: metrics = GenerationMetrics() # NOTE: without sinks, nothing is recorded
+
+    assert seed_mode in ["chain", "counter"], f"Unknown seed_mode {seed_mode}"
+
     _seed = seed
+    problem_index, attempt = start_index, 0
+    nr_consecutive_rejections = 0
+    nr_attempts = 0
     while True:
-        random.seed(_seed)
-        _seed = random.randint(0, 2**32 - 1)
+        if max_attempts is not None and nr_attempts >= max_attempts:
+            raise GenerationStalledError(f"Gave up after {nr_attempts} attempts")
+        nr_attempts += 1
+
+        if seed_mode == "counter":
+            _seed = derive_seed(seed, problem_index, attempt)
+            attempt += 1
+        else:
+            random.seed(_seed)
+            _seed = random.randint(0, 2**32 - 1)
+        metrics.start_attempt(_seed)
             
         # 1. generate the tree
-        tree = generator.generate(seed=_seed)
+        with metrics.stage("generate"):
+            tree = generator.generate(seed=_seed)
+        metrics.set_tree_stats(tree)
         
         # 2. try to instantiate the properties of the tree ...
         try:
-            instantiation = instantiator.instantiate(tree, seed=_seed)
+            with metrics.stage("instantiate"):
+                instantiation = instantiate_with_repairs(tree, generator, instantiator, instantiation_retries, max_repairs, _seed, metrics)
             mwp = MathWordProblem(tree=tree, instantiation=instantiation, 
                                   ps_template_sampler=ps_template_sampler, answers_template_sampler=ps_answers_template_sampler, 
                                   ps_renderer=ps_renderer, rt_template_sampler=rt_template_sampler, rt_renderer=rt_renderer)
@@ -179,17 +271,132 @@ def generate_mwps_iter(generator: Generator, instantiator: Instantiator, order_s
             # ... if successful:
             
             # 3. sample the leaf nodes of the tree in some specific order
-            mwp.sample_problem_order(order_sampler, seed=_seed)
+            with metrics.stage("sample_problem_order"):
+                mwp.sample_problem_order(order_sampler, seed=_seed)
+
+            with use_expr_cache(expr_cache) if expr_cache is not None else nullcontext():
+                # 4. compute the actual answers of the mwp given the problem order and instantiation
+                with metrics.stage("compute_answers"):
+                    mwp.compute_answers()
 
-            # 4. compute the actual answers of the mwp given the problem order and instantiation
-            mwp.compute_answers()
+                # 5. render the problem, its reasoning trace and answer into natural language
+                with metrics.stage("render"):
+                    mwp.problem_as_nl(seed=_seed)
+                    mwp.reasoning_trace_as_nl(seed=_seed)
+                    mwp.answers_as_nl(seed=_seed)
 
-            # 5. render the problem, its reasoning trace and answer into natural language
-            mwp.problem_as_nl(seed=_seed)
-            mwp.reasoning_trace_as_nl(seed=_seed)
-            mwp.answers_as_nl(seed=_seed)
+            # 6. optionally, drop the mwp (e.g. if it's a duplicate)
+            if mwp_filter is not None:
+                with metrics.stage("filter"):
+                    accepted = mwp_filter.accept(mwp)
+                if not accepted:
+                    metrics.end_attempt(accepted=False, failure_reason=f"rejected by {type(mwp_filter).__name__}")
+                    generator.feedback(tree, accepted=False)
+                    nr_consecutive_rejections += 1
+                    if max_consecutive_rejections is not None and nr_consecutive_rejections >= max_consecutive_rejections:
+                        raise GenerationStalledError(f"{type(mwp_filter).__name__} rejected {nr_consecutive_rejections} mwps in a row, "
+                                                     "it likely rejects (almost) every tree the generator can produce")
+                    continue
+                nr_consecutive_rejections = 0
 
+            metrics.end_attempt(accepted=True)
+            generator.feedback(tree, accepted=True)
+            problem_index, attempt = problem_index + 1, 0
             yield mwp
         except ValueError as e:
             # NOTE: instantiation can fail, in this case we simply retry with a different structure
+            if isinstance(e, InstantiationError): metrics.set_failure_details(e.details())
+            metrics.end_attempt(accepted=False, failure_reason=str(e))
+            generator.feedback(tree, accepted=False)
             print(e)
+
+def generate_mwp_at(index: int, generator: Generator, instantiator: Instantiator, order_sampler: OrderSampler,
+                    ps_template_sampler: ProblemStructureSampler, ps_answers_template_sampler: ProblemStructureAnswersSampler,
+                    ps_renderer: ProblemStructureRenderer, rt_template_sampler: ReasoningTraceSampler, rt_renderer: ReasoningTraceRenderer, 
+                    seed: int = 14, mwp_filter: MWPFilter = None, metrics: GenerationMetrics = None,
+                    instantiation_retries: int = 0, max_repairs: int = 0, expr_cache: ExprCache = None, 
+                    max_consecutive_rejections: int = 10_000) -> MathWordProblem:
+    """ 
+        Regenerates the problem with the given index of generate_mwps_iter(..., seed_mode="counter") 
+        without generating any of the problems before it 
+    """
+    mwp_iter = generate_mwps_iter(generator, instantiator, order_sampler, 
+                                  ps_template_sampler, ps_answers_template_sampler, ps_renderer, 
+                                  rt_template_sampler, rt_renderer, seed, mwp_filter=mwp_filter, metrics=metrics,
+                                  instantiation_retries=instantiation_retries, max_repairs=max_repairs, expr_cache=expr_cache,
+                                  seed_mode="counter", start_index=index, max_consecutive_rejections=max_consecutive_rejections)
+    return next(mwp_iter)
+
+def instantiate_with_retries(tree: ProofTree, instantiator: Instantiator, nr_retries: int, seed: int, metrics: GenerationMetrics, 
+                             partial_instantiation: Instantiation = None, nr_repairs: int = None) -> Instantiation:
+    """ 
+        Instantiates the tree, retrying up to nr_retries times with a different seed if no valid instantiation can be found 
+        - partial_instantiation: if specified, these instantiations are kept and only the remaining properties are instantiated
+        - nr_repairs: how many times the tree has been repaired before (only recorded in the metrics)
+    """
+    for retry in range(nr_retries + 1):
+        try:
+            if partial_instantiation is None:
+                return instantiator.instantiate(tree, seed=(seed + retry) % 2**32)
+            return instantiator.instantiate(tree, partial_instantiation.copy(), skip_existing=True, seed=(seed + retry) % 2**32)
+        except InstantiationError:
+            if retry == nr_retries: raise
+        finally:
+            stats = {**instantiator.stats(), "retries": retry}
+            if nr_repairs is not None: stats["repairs"] = nr_repairs
+            metrics.set_instantiation_stats(stats)
+
+def instantiate_with_repairs(tree: ProofTree, generator: Generator, instantiator: Instantiator, nr_retries: int, max_repairs: int, 
+                             seed: int, metrics: GenerationMetrics) -> Instantiation:
+    """ 
+        Instantiates the tree, if no valid instantiation can be found, the subtree responsible for the failure is regenerated 
+        (up to max_repairs times) and only the properties of the new subtree are instantiated (where possible, see repair_instantiation).
+    """
+    partial_instantiation = None
+    for repair in range(max_repairs + 1):
+        try:
+            instantiation = instantiate_with_retries(tree, instantiator, nr_retries, (seed + repair * (nr_retries + 1)) % 2**32, 
+                                                     metrics, partial_instantiation, nr_repairs=repair if max_repairs > 0 else None)
+            if repair > 0: metrics.set_tree_stats(tree)
+            return instantiation
+        except InstantiationError as e:
+            if repair == max_repairs: raise
+
+            node = responsible_node(tree, e.violations)
+            kept_instantiation = repair_instantiation(tree, node, e)
+            if not generator.repair(tree, node, seed=(seed + repair) % 2**32): raise
+            partial_instantiation = kept_instantiation
+
+def responsible_node(tree: ProofTree, violations: List[Tuple[TreeNode, str]]) -> TreeNode:
+    """ The root of the smallest subtree that is responsible for a violation (i.e. the deepest violating inner node) """
+    deepest_node = max([n for n,_ in violations], key=lambda n: n.depth)
+    if deepest_node.is_leaf: return tree.parent_by_node.get(deepest_node, deepest_node)
+    return deepest_node
+
+def repair_instantiation(tree: ProofTree, node: TreeNode, error: InstantiationError) -> Instantiation:
+    """ 
+        Extracts the instantiation of all properties outside of the subtree below node (before it is regenerated).
+        The quantities are only kept if all violations are in the subtree or on the path to the root (whose quantities will change anyway),
+        otherwise they need to be re-instantiated too.
+    """
+    subtree_nodes = set([])
+    stack = list(node.child_nodes)
+    while len(stack) > 0:
+        n = stack.pop(-1)
+        subtree_nodes.add(n)
+        stack.extend(n.child_nodes)
+
+    path_to_root = set([])
+    n = node
+    while n is not None:
+        path_to_root.add(n)
+        n = tree.parent_by_node.get(n, None)
+    keep_quantities = all(n in subtree_nodes or n in path_to_root for n,_ in error.violations)
+
+    kept_keys = set([k for n in tree.nodes if n not in subtree_nodes for k in property_keys(n.logicalform)])
+    instantiation = Instantiation({})
+    for key, value in error.instantiation._instantiations.items():
+        if key not in kept_keys: continue
+        if key.property_type == PropertyType.QUANTITY and not keep_quantities: continue
+        instantiation[key] = value
+    return instantiation
\ No newline at end of file
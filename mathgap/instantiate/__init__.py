@@ -1,4 +1,4 @@
 from mathgap.instantiate.instantiation import Instantiation, delete_all_of_type
 from mathgap.instantiate.instantiators import Instantiator, WordListInstantiator, PerPropTypeInstantiator
-from mathgap.instantiate.quantities import RandIntInstantiator, PositiveRandIntInstantiator
+from mathgap.instantiate.quantities import RandIntInstantiator, PositiveRandIntInstantiator, InstantiationError
 from mathgap.instantiate.entityconsistency import EntityAwareUnitInstantiator, PartAndUnitAwareEntityInstantiator
\ No newline at end of file
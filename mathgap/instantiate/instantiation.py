@@ -1,14 +1,41 @@
-from typing import Dict
+from typing import Deque, Dict, Set, Tuple
+from collections import deque
+import itertools
 
 from mathgap.properties import PropertyKey, PropertyType
 
+_uids = itertools.count()
+_MISSING = object()
+CHANGE_LOG_SIZE = 1024
+
 class Instantiation:
-    """ Maps agent_id, entity_id etc to a string value and quantity_id to numerical values """
+    """ 
+        Maps agent_id, entity_id etc to a string value and quantity_id to numerical values 
+        
+        Each instantiation has a unique id and a version that is increased with every modification, 
+        s.t. (uid, version) identifies the exact state of an instantiation (e.g. for caching).
+        The most recent modifications are kept in a change log, s.t. caches can tell which properties changed since some version.
+        NOTE: always modify it through its methods, never through _instantiations directly.
+    """
     def __init__(self, instantiations: Dict[PropertyKey, object] = {}) -> None:
         self._instantiations = instantiations
+        self.uid = next(_uids)
+        self.version = 0
+        self._change_log: Deque[Tuple[int, PropertyKey]] = deque(maxlen=CHANGE_LOG_SIZE) # (version after the change, changed key)
+
+    def __setstate__(self, state):
+        # NOTE: unpickled or deep-copied instantiations are distinct objects and must not share the uid of the original
+        self.__dict__.update(state)
+        self.uid = next(_uids)
+        self.version = state.get("version", 0)
+        self._change_log = deque(state.get("_change_log", []), maxlen=CHANGE_LOG_SIZE)
 
     def __contains__(self, property_key: PropertyKey) -> bool:
-        return any([k == property_key for k in self._instantiations.keys()])
+        try:
+            return property_key in self._instantiations
+        except TypeError:
+            # NOTE: unhashable keys can only be compared one by one
+            return any([k == property_key for k in self._instantiations.keys()])
     
     def __getitem__(self, key: PropertyKey):
         assert key in self, f"No instantiation for {key} (key-type: {type(key)})!"
@@ -17,9 +44,28 @@ class Instantiation:
     def __setitem__(self, key: PropertyKey, value: object):
         assert key not in self._instantiations.keys(), f"Multiple instantiations for {key}! [{self._instantiations[key]}, {value}]"
         self._instantiations[key] = value
+        self._changed(key)
 
     def set_even_if_present(self, key: PropertyKey, value: object):
+        old_value = self._instantiations.get(key, _MISSING)
+        if type(old_value) is type(value) and old_value == value: return # unchanged
         self._instantiations[key] = value
+        self._changed(key)
+
+    def _changed(self, key: PropertyKey):
+        self.version += 1
+        self._change_log.append((self.version, key))
+
+    def changed_since(self, version: int) -> Set[PropertyKey] | None:
+        """ Returns the keys that have been modified after version, or None if the change log doesn't reach back that far """
+        if version == self.version: return set([])
+        if len(self._change_log) == 0 or self._change_log[0][0] > version + 1: return None
+        
+        changed = set([])
+        for change_version, key in reversed(self._change_log):
+            if change_version <= version: break
+            changed.add(key)
+        return changed
 
     def get_instantiations_of_type(self, property_type: PropertyType) -> Dict[PropertyKey, object]:
         return {k:v for k,v in self._instantiations.items() if k.property_type == property_type}
@@ -27,6 +73,7 @@ class Instantiation:
     def remove(self, key: PropertyKey):
         if key in self._instantiations:
             self._instantiations.pop(key)
+            self._changed(key)
     
     def copy(self) -> 'Instantiation':
         return Instantiation(self._instantiations.copy())
@@ -1,5 +1,5 @@
 import random
-from typing import List
+from typing import Any, Dict, List
 from mathgap.instantiate.instantiation import Instantiation
 
 from mathgap.trees import ProofTree
@@ -23,6 +23,10 @@ class Instantiator:
         # Override this method
         ...
 
+    def stats(self) -> Dict[str, Any]:
+        """ Statistics about the last call to instantiate (e.g. how many attempts were needed) """
+        return {}
+
 class PerPropTypeInstantiator(Instantiator):
     """ Instantiator that calls sub-instantiators per property type """
     def __init__(self, agent_inst: Instantiator, number_inst: Instantiator, entity_inst: Instantiator, attribute_inst: Instantiator, unit_inst: Instantiator) -> None:
@@ -39,6 +43,12 @@ class PerPropTypeInstantiator(Instantiator):
         instantiation = self.attribute_inst.instantiate(tree, instantiation, skip_existing, seed)
         instantiation = self.unit_inst.instantiate(tree, instantiation, skip_existing, seed)
         return instantiation
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for inst in [self.agent_inst, self.number_inst, self.entity_inst, self.attribute_inst, self.unit_inst]:
+            stats.update(inst.stats())
+        return stats
         
 
 class WordListInstantiator(Instantiator):
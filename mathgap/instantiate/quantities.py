@@ -1,8 +1,9 @@
 # Instantiators for quantities
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 import random
+import time
 
-from mathgap.expressions import Expr, Variable
+from mathgap.expressions import Expr, Variable, Const, Sum, Subtraction, Product, Fraction, topological_order, weighted_grad, weighted_sparse_grad, SPARSE_GRAD_THRESHOLD
 from mathgap.instantiate.instantiation import Instantiation
 from mathgap.instantiate.instantiators import Instantiator
 
@@ -29,7 +30,7 @@ class RandIntInstantiator(Instantiator):
 def rand_int_inst_random(tree: ProofTree, orig_instantiation: Instantiation, parameters: List[PropertyKey],
                          min_leaf_value: int = 2, max_leaf_value: int = 100, 
                          min_inner_value: int = 2, max_inner_value: int = 1000,
-                         max_attempts: int = 100_000, seed: int = 14) -> Instantiation:
+                         max_attempts: int = 100_000, seed: int = 14, stats: Dict[str, Any] = None) -> Instantiation:
     """ 
         Try to find a random instantiation of integer numbers by trying random instantiations until a valid one is found
 
@@ -42,6 +43,7 @@ def rand_int_inst_random(tree: ProofTree, orig_instantiation: Instantiation, par
         - inner_max_value (incl): maximum value each quantity on inner nodes can have
         - max_attempts: how many tries will be performed before giving up
         - seed
+        - stats: if specified, will be filled with the number of attempts that were needed
     """
     random.seed(seed)
 
@@ -51,19 +53,13 @@ def rand_int_inst_random(tree: ProofTree, orig_instantiation: Instantiation, par
         if node.is_leaf: continue # constraints on leaves are enforced through random.range
         quantities.extend(node.logicalform.get_quantities())
 
-    # 0. enable caching/memoization of values and gradients 
-    for q in tree.root_node.logicalform.get_quantities():
-        q.enable_cache(recursive=True)
-
     # 1. retry until a valid instantiation is found or the number of attempts is exceeded
+    nr_attempts = 0
     for _ in range(max_attempts):
-        # 1.0 clear the cache
-        for q in tree.root_node.logicalform.get_quantities():
-            q.clear_cache(recursive=True)
-
+        nr_attempts += 1
         # 1.1 instantiate each of the parameters with a random valid leaf-value
         for param in parameters:
-            instantiation._instantiations[param] = random.randint(min_leaf_value, max_leaf_value)
+            instantiation.set_even_if_present(param, random.randint(min_leaf_value, max_leaf_value))
 
         # 1.2 test if the instantiation is valid
         is_valid = True
@@ -78,9 +74,8 @@ def rand_int_inst_random(tree: ProofTree, orig_instantiation: Instantiation, par
         if is_valid:
             break
 
-    # 3. we're done => disable the cache on all expression
-    for q in tree.root_node.logicalform.get_quantities():
-        q.disable_cache(recursive=True)
+    if stats is not None:
+        stats["attempts"] = nr_attempts
 
     return instantiation
 
@@ -89,7 +84,7 @@ def rand_int_inst_through_cpga(tree: ProofTree, orig_instantiation: Instantiatio
                               min_leaf_value: int = 2, max_leaf_value: int = 100, 
                               min_inner_value: int = 2, max_inner_value: int = 1000,
                               max_steps: int = 1_000, re_init_after_steps: int = 100, eps: float = 1e-14, 
-                              boundary_bounce: float = 0.0, seed: int = 14) -> Instantiation:
+                              boundary_bounce: float = 0.0, seed: int = 14, stats: Dict[str, Any] = None) -> Instantiation:
     """ 
         Try to find a pseudo-random instantiation of integer numbers through constrained projected gradient ascent 
 
@@ -108,6 +103,7 @@ def rand_int_inst_through_cpga(tree: ProofTree, orig_instantiation: Instantiatio
             "bounce-back" a random amount (scaled by boundary_bounce) from the boundary upon collision. 
             This helps to avoid values sticking to boundaries.
         - seed: 
+        - stats: if specified, will be filled with the number of gradient steps and re-initializations that were needed
     """
     random.seed(seed)
     np.random.seed(seed)
@@ -117,47 +113,55 @@ def rand_int_inst_through_cpga(tree: ProofTree, orig_instantiation: Instantiatio
     for node in tree.traverse():
         if node.is_leaf: continue # constraints on leaves are enforced through clipping
         quantities.extend(node.logicalform.get_quantities())
-
-    # 0. enable caching/memoization of values and gradients 
-    for q in tree.root_node.logicalform.get_quantities():
-        q.enable_cache(recursive=True)
+    roots = [q.simplified for q in quantities] # NOTE: backward sweeps run over the simplified expressions
+    order = topological_order(roots) # NOTE: the expressions don't change, only their values
+    # NOTE: for wide trees (e.g. part-whole with many parts), most parameters don't occur in any violated quantity 
+    #   => only densify the non-zero entries of the gradient
+    sparse = len(parameters) > SPARSE_GRAD_THRESHOLD
+    index_by_param = {p: i for i,p in enumerate(parameters)}
 
     # 1. randomly initialize the set of tunable variables with min_leaf_value <= x <= max_leaf_value
     var_values = np.random.rand(len(parameters)) * (max_leaf_value - min_leaf_value) + min_leaf_value
     for val,prop in zip(var_values, parameters):
-        instantiation._instantiations[prop] = round(val) # we round each value to integers
+        instantiation.set_even_if_present(prop, round(val)) # we round each value to integers
 
     # 2. perform constrained projected gradient descent
+    nr_steps, nr_restarts = 0, 0
     for i in range(max_steps):
-        # 2.0 clear the cache at the beginning of each gradient step
-        for q in tree.root_node.logicalform.get_quantities():
-            q.clear_cache(recursive=True)
-
+        nr_steps += 1
         # 2.1 compute the gradient based on all quantities of non-leaf nodes
-        total_grad = np.zeros(shape=(len(parameters)))
+        weights = []
         is_invalid = False
         for quantity in quantities:
             qval = quantity.eval(instantiation)
 
             if qval < min_inner_value:
                 # Case 1: value is too small => increase
-                total_grad += quantity.grad(parameters, instantiation) * (min_inner_value - qval)
+                weights.append(min_inner_value - qval)
                 is_invalid = True
             elif qval > max_inner_value:
                 # Case 2: value is too large => decrease
-                total_grad -= quantity.grad(parameters, instantiation) * (qval - max_inner_value)
+                weights.append(-(qval - max_inner_value))
                 is_invalid = True
             else:
                 # Case 3: value is within interval => no gradient signal
-                pass # no need to even compute gradient in this case
-        
-        # take the mean s.t. larger trees don't get huge gradients
-        mean_grad = total_grad / len(quantities)
-        
+                weights.append(0.0)
+
         # 2.2 check if we found a valid instantiation
         if not is_invalid:
             break # if so: terminate early
 
+        # accumulate the violation-weighted gradients of all quantities in one backward sweep
+        if sparse:
+            total_grad = np.zeros(shape=(len(parameters)))
+            for prop, coefficient in weighted_sparse_grad(roots, weights, instantiation, order=order).items():
+                if prop in index_by_param: total_grad[index_by_param[prop]] += coefficient
+        else:
+            total_grad = weighted_grad(roots, weights, parameters, instantiation, order=order)
+        
+        # take the mean s.t. larger trees don't get huge gradients
+        mean_grad = total_grad / len(quantities)
+
         # 2.3 compute the new initialization
         new_values = var_values + lr * mean_grad
         new_values_clipped = np.clip(new_values, min_leaf_value, max_leaf_value)
@@ -171,19 +175,450 @@ def rand_int_inst_through_cpga(tree: ProofTree, orig_instantiation: Instantiatio
         if ((i+1) % re_init_after_steps == 0) or (np.linalg.norm(new_values_clipped - var_values) <= eps):
             # if we are stuck but haven't found a valid instantiation => restart with a different initialization
             new_values_clipped = np.random.rand(len(parameters)) * (max_leaf_value - min_leaf_value) + min_leaf_value
+            nr_restarts += 1
 
-        # 2.5 perform the gradient update
+        # 2.5 perform the gradient update (only parameters whose rounded value changed need to be written)
+        changed = np.flatnonzero(np.round(new_values_clipped) != np.round(var_values))
         var_values = new_values_clipped
-        for val,prop in zip(var_values, parameters):
+        for idx in changed:
             # we are performing the gradient computation etc with floats but round to integers for the initialization
-            instantiation._instantiations[prop] = round(val)
+            instantiation.set_even_if_present(parameters[idx], round(var_values[idx]))
 
-    # 3. we're done => disable the cache on all expression
-    for q in tree.root_node.logicalform.get_quantities():
-        q.disable_cache(recursive=True)
+    if stats is not None:
+        stats["steps"] = nr_steps
+        stats["restarts"] = nr_restarts
 
     return instantiation
 
+def rand_int_inst_through_cpga_multistart(tree: ProofTree, orig_instantiation: Instantiation, 
+                                          parameters: List[PropertyKey], lr: float = 1.0,
+                                          min_leaf_value: int = 2, max_leaf_value: int = 100, 
+                                          min_inner_value: int = 2, max_inner_value: int = 1000,
+                                          max_steps: int = 1_000, re_init_after_steps: int = 100, eps: float = 1e-14, 
+                                          boundary_bounce: float = 0.0, nr_starts: int = 256, seed: int = 14, 
+                                          stats: Dict[str, Any] = None) -> Instantiation:
+    """ 
+        Same as rand_int_inst_through_cpga but advances nr_starts trajectories in parallel (as columns of numpy matrices)
+        using a single compiled program for the values and gradients of all quantities.
+        Stops as soon as any of the trajectories has found a valid instantiation.
+
+        - nr_starts: how many trajectories are followed in parallel
+        (see rand_int_inst_through_cpga for all other parameters)
+    """
+    from mathgap.trees.structurecache import active_structure_cache
+    from mathgap.exprprogram import ExprProgram
+
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    instantiation = orig_instantiation.copy()
+    quantities: List[Expr] = []
+    for node in tree.traverse():
+        if node.is_leaf: continue # constraints on leaves are enforced through clipping
+        quantities.extend(node.logicalform.get_quantities())
+
+    cache = active_structure_cache()
+    # NOTE: trees of the same structure share the compiled program (remapped onto their properties)
+    program = ExprProgram([q.simplified for q in quantities], parameters) if cache is None else cache.program(tree, parameters)
+    nr_params = len(parameters)
+
+    def random_init(nr_columns: int) -> np.ndarray:
+        return rng.random((nr_params, nr_columns)) * (max_leaf_value - min_leaf_value) + min_leaf_value
+
+    # 1. randomly initialize all trajectories with min_leaf_value <= x <= max_leaf_value
+    var_values = random_init(nr_starts)
+
+    # 2. perform constrained projected gradient descent on all trajectories at once
+    nr_steps, nr_restarts, best = 0, 0, 0
+    for i in range(max_steps):
+        nr_steps += 1
+
+        # 2.1 evaluate all quantities on the rounded values (same as the single-trajectory version)
+        rounded = np.round(var_values)
+        values = program.evaluate(rounded, instantiation)
+        qvals = program.roots(values)
+        too_small = qvals < min_inner_value
+        too_large = qvals > max_inner_value
+        # NOTE: nan (e.g. division by zero) is never valid
+        is_valid = ~(too_small | too_large | np.isnan(qvals))
+
+        # 2.2 check if any trajectory found a valid instantiation
+        valid_columns = np.flatnonzero(is_valid.all(axis=0))
+        if len(valid_columns) > 0:
+            best = valid_columns[0]
+            break
+
+        # 2.3 compute the violation-weighted gradient of each trajectory in one backward sweep
+        weights = too_small * (min_inner_value - qvals) - too_large * (qvals - max_inner_value)
+        weights = np.nan_to_num(weights, nan=0.0, posinf=0.0, neginf=0.0)
+        mean_grad = np.nan_to_num(program.vjp(values, weights)) / len(quantities)
+
+        # 2.4 compute the new initialization
+        new_values = var_values + lr * mean_grad
+        new_values_clipped = np.clip(new_values, min_leaf_value, max_leaf_value)
+
+        # 2.4.1 if we have bouncy boundaries, any parameter that would be clipped to the boundary bounces back a random amount
+        if boundary_bounce > 0.0:
+            bounce = boundary_bounce * rng.random(new_values.shape) * (max_leaf_value - min_leaf_value)
+            new_values_clipped += (1.0 * (new_values < min_leaf_value) - 1.0 * (new_values > max_leaf_value)) * bounce
+
+        # 2.5 re-initialize the trajectories that are either due or stuck
+        if (i+1) % re_init_after_steps == 0:
+            stuck = np.ones(nr_starts, dtype=bool)
+        else:
+            stuck = np.linalg.norm(new_values_clipped - var_values, axis=0) <= eps
+        if stuck.any():
+            new_values_clipped[:, stuck] = random_init(int(stuck.sum()))
+            nr_restarts += int(stuck.sum())
+
+        var_values = new_values_clipped
+
+    # 3. use the first valid (or, if none was found, the first) trajectory
+    for val,prop in zip(np.round(var_values[:, best]), parameters):
+        instantiation.set_even_if_present(prop, int(val))
+
+    if stats is not None:
+        stats["steps"] = nr_steps
+        stats["restarts"] = nr_restarts
+
+    return instantiation
+
+def rand_int_inst_local_search(tree: ProofTree, orig_instantiation: Instantiation, parameters: List[PropertyKey],
+                               min_leaf_value: int = 2, max_leaf_value: int = 100, 
+                               min_inner_value: int = 2, max_inner_value: int = 1000,
+                               max_steps: int = 100_000, re_init_after_steps: int = 1_000, 
+                               temperature: float = 0.1, cooling: float = 0.995, seed: int = 14, 
+                               stats: Dict[str, Any] = None) -> Instantiation:
+    """ 
+        Try to find a random instantiation of integer numbers through local search (min-conflicts with simulated annealing):
+        each step picks a violated quantity, changes a single parameter it depends on and only re-evaluates the quantities that depend on this parameter.
+        Worse moves are accepted with probability exp(-delta / temperature), where the temperature cools down with every step.
+
+        - tree: prooftree for which we want to find a valid instantiation
+        - orig_instantiation: the current and/or partial instantiation
+        - parameters: which propertykeys can be tuned (i.e. which quantities/variables)
+        - leaf_min_value (incl): minimum value each quantity on leaf nodes can have
+        - leaf_max_value (incl): maximum value each quantity on leaf nodes can have
+        - inner_min_value (incl): minimum value each quantity on inner nodes can have
+        - inner_max_value (incl): maximum value each quantity on inner nodes can have
+        - max_steps: how many moves to try at the max
+        - re_init_after_steps: after how many moves should we restart with a different random instantiation
+        - temperature: initial temperature (violations are measured relative to the size of the inner interval)
+        - cooling: factor by which the temperature is multiplied after each move
+        - seed: 
+        - stats: if specified, will be filled with the number of moves, accepted moves and restarts that were needed
+    """
+    random.seed(seed)
+
+    instantiation = orig_instantiation.copy()
+    quantities: List[Expr] = []
+    for node in tree.traverse():
+        if node.is_leaf: continue # constraints on leaves are enforced through the range of the moves
+        quantities.extend(node.logicalform.get_quantities())
+
+    # 0. index which quantities (and which tunable parameters of them) are affected by each parameter
+    # NOTE: iterate over the parameters (instead of the free variables) s.t. the order and thereby the moves are reproducible
+    dependents: Dict[PropertyKey, List[int]] = {p: [] for p in parameters}
+    parameters_of: List[List[PropertyKey]] = []
+    for i, quantity in enumerate(quantities):
+        quantity_params = [p for p in parameters if p in quantity.free_variables]
+        for p in quantity_params:
+            dependents[p].append(i)
+        parameters_of.append(quantity_params)
+
+    inner_range = max(max_inner_value - min_inner_value, 1)
+    def violation(quantity: Expr) -> float:
+        try:
+            value = quantity.eval(instantiation)
+        except ZeroDivisionError:
+            return float("inf")
+        return (max(min_inner_value - value, 0) + max(value - max_inner_value, 0)) / inner_range
+
+    def random_init():
+        for p in parameters:
+            instantiation.set_even_if_present(p, random.randint(min_leaf_value, max_leaf_value))
+        return [violation(q) for q in quantities]
+
+    # 1. randomly initialize the set of tunable variables
+    violations = random_init()
+    violated = set(i for i,v in enumerate(violations) if v > 0 and len(parameters_of[i]) > 0)
+    current_temperature = temperature
+
+    nr_steps, nr_accepted, nr_restarts = 0, 0, 0
+    for i in range(max_steps):
+        # 2.1 stop as soon as no tunable quantity is violated anymore
+        if len(violated) == 0: break
+        nr_steps += 1
+
+        # 2.2 restart with a different initialization if due
+        if (i+1) % re_init_after_steps == 0:
+            violations = random_init()
+            violated = set(j for j,v in enumerate(violations) if v > 0 and len(parameters_of[j]) > 0)
+            current_temperature = temperature
+            nr_restarts += 1
+            continue
+
+        # 2.3 pick a violated quantity and one of its parameters and propose a new value for it (either a local step or a random jump)
+        param = random.choice(parameters_of[random.choice(tuple(violated))])
+        old_value = instantiation[param]
+        if random.random() < 0.5:
+            step = random.randint(1, max(1, (max_leaf_value - min_leaf_value) // 4))
+            new_value = min(max(old_value + random.choice([-step, step]), min_leaf_value), max_leaf_value)
+        else:
+            new_value = random.randint(min_leaf_value, max_leaf_value)
+        if new_value == old_value: continue
+
+        # 2.4 only re-evaluate the quantities that depend on the changed parameter
+        instantiation.set_even_if_present(param, new_value)
+        affected = dependents[param]
+        new_violations = [violation(quantities[j]) for j in affected]
+        delta = sum(new_violations) - sum(violations[j] for j in affected)
+
+        # 2.5 accept improvements, worse moves only with a probability decreasing with the temperature
+        if delta <= 0 or (current_temperature > 0 and random.random() < np.exp(-delta / current_temperature)):
+            nr_accepted += 1
+            for j, v in zip(affected, new_violations):
+                violations[j] = v
+                if v > 0: violated.add(j)
+                else: violated.discard(j)
+        else:
+            instantiation.set_even_if_present(param, old_value)
+        current_temperature *= cooling
+
+    if stats is not None:
+        stats["steps"] = nr_steps
+        stats["accepted_moves"] = nr_accepted
+        stats["restarts"] = nr_restarts
+
+    return instantiation
+
+def _divisors(value: int) -> List[int]:
+    """ All positive divisors of a (non-zero) integer """
+    value = abs(value)
+    small, large = [], []
+    for d in range(1, int(value**0.5) + 1):
+        if value % d == 0:
+            small.append(d)
+            if d != value // d: large.append(value // d)
+    return small + large[::-1]
+
+def rand_int_inst_constructive(tree: ProofTree, orig_instantiation: Instantiation, parameters: List[PropertyKey],
+                               min_leaf_value: int = 2, max_leaf_value: int = 100, 
+                               min_inner_value: int = 2, max_inner_value: int = 1000,
+                               max_attempts: int = 1_000, seed: int = 14, stats: Dict[str, Any] = None) -> Instantiation:
+    """ 
+        Constructs a random instantiation of integer numbers top-down (ancestral sampling) instead of sampling the leaves and checking the inner nodes:
+        1. computes bottom-up the interval of values each quantity can take (given the bounds of its node and all nodes below)
+        2. samples the quantities of the root within their interval and pushes each value down through the inverse of the operation that computed it
+            (e.g. a sum is split into summands, for a difference the subtrahend is chosen and the minuend follows), 
+            always staying within the interval of each operand
+
+        For additive trees (sums and differences of distinct leaves, i.e. all trees of the additive rules) the intervals are exact,
+        thus every draw is valid by construction and the cost per node is constant. 
+        Products and fractions additionally require divisibility, which intervals cannot capture, hence their draws are retried up to max_attempts times.
+        NOTE: the distribution differs from rejection sampling (values are uniform per split, not uniform over all valid instantiations)
+
+        - tree: prooftree for which we want to find a valid instantiation
+        - orig_instantiation: the current and/or partial instantiation
+        - parameters: which propertykeys can be tuned (i.e. which quantities/variables), all other variables keep their value
+        - leaf_min_value (incl): minimum value each quantity on leaf nodes can have
+        - leaf_max_value (incl): maximum value each quantity on leaf nodes can have
+        - inner_min_value (incl): minimum value each quantity on inner nodes can have
+        - inner_max_value (incl): maximum value each quantity on inner nodes can have
+        - max_attempts: how many draws are tried (only relevant for trees with products or fractions)
+        - seed
+        - stats: if specified, will be filled with the number of draws that were needed
+    """
+    random.seed(seed)
+
+    instantiation = orig_instantiation.copy()
+    is_parameter = set(parameters)
+
+    # 0. bounds imposed by the nodes themselves
+    bounds_by_expr: Dict[int, Tuple[float, float]] = {}
+    for node in tree.traverse():
+        for quantity in node.logicalform.get_quantities():
+            if node.is_leaf:
+                if isinstance(quantity, Variable) and quantity.identifier not in is_parameter:
+                    value = quantity.eval(instantiation)
+                    bounds_by_expr[id(quantity)] = (value, value)
+                else:
+                    bounds_by_expr[id(quantity)] = (min_leaf_value, max_leaf_value)
+            else:
+                bounds_by_expr[id(quantity)] = (min_inner_value, max_inner_value)
+
+    # 1. compute the interval of each (sub-)expression bottom-up
+    interval_by_expr: Dict[int, Tuple[float, float]] = {}
+    def interval(expr: Expr) -> Tuple[float, float]:
+        if id(expr) in interval_by_expr: return interval_by_expr[id(expr)]
+
+        if isinstance(expr, Const):
+            lo, hi = expr.value, expr.value
+        elif isinstance(expr, Variable):
+            lo, hi = (min_leaf_value, max_leaf_value) if expr.identifier in is_parameter else (expr.eval(instantiation), expr.eval(instantiation))
+        elif isinstance(expr, Sum):
+            child_intervals = [interval(c) for c in expr.summands]
+            lo, hi = sum(c[0] for c in child_intervals), sum(c[1] for c in child_intervals)
+        elif isinstance(expr, Subtraction):
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.minuend), interval(expr.subtrahend)
+            lo, hi = a_lo - b_hi, a_hi - b_lo
+        elif isinstance(expr, Product):
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.factor1), interval(expr.factor2)
+            corners = [a_lo * b_lo, a_lo * b_hi, a_hi * b_lo, a_hi * b_hi]
+            lo, hi = min(corners), max(corners)
+        elif isinstance(expr, Fraction):
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.numerator), interval(expr.denominator)
+            if b_lo <= 0 <= b_hi: 
+                lo, hi = -float("inf"), float("inf") # NOTE: not tracked precisely, draws that divide by zero are retried
+            else:
+                corners = [a_lo / b_lo, a_lo / b_hi, a_hi / b_lo, a_hi / b_hi]
+                lo, hi = min(corners), max(corners)
+        else:
+            raise NotImplementedError(f"Cannot construct instantiations for expressions of type {type(expr)}")
+
+        if id(expr) in bounds_by_expr:
+            lo, hi = max(lo, bounds_by_expr[id(expr)][0]), min(hi, bounds_by_expr[id(expr)][1])
+        interval_by_expr[id(expr)] = (lo, hi)
+        return lo, hi
+
+    # NOTE: bottom-up s.t. interval never recurses deeper than one level (deep trees would exceed the recursion limit otherwise)
+    root_quantities = tree.root_node.logicalform.get_quantities()
+    for expr in topological_order(root_quantities):
+        interval(expr)
+
+    def int_range(lo: float, hi: float) -> Tuple[int, int]:
+        return int(np.ceil(lo)), int(np.floor(hi))
+
+    class Infeasible(Exception):
+        pass
+
+    # values of the parameters that have been assigned in the current draw
+    # NOTE: a parameter can occur multiple times in the expressions (e.g. a leaf used in multiple derivations), all occurrences must agree
+    assigned: Dict[PropertyKey, int] = {}
+
+    # 2. push the value of an expression down to its operands, 
+    #   yields the values of the operands one at a time (s.t. the operands are assigned in order without recursion)
+    def assign_steps(expr: Expr, value):
+        if isinstance(expr, Const):
+            if expr.value != value: raise Infeasible()
+        elif isinstance(expr, Variable):
+            if expr.identifier in is_parameter:
+                if assigned.get(expr.identifier, value) != value: raise Infeasible()
+                assigned[expr.identifier] = value
+                instantiation.set_even_if_present(expr.identifier, value)
+            elif expr.eval(instantiation) != value:
+                raise Infeasible()
+        elif isinstance(expr, Sum):
+            # split the value among the summands (in random order), s.t. the remaining summands can still make up the rest
+            summands = list(expr.summands)
+            random.shuffle(summands)
+            remaining = value
+            rest_lo = sum(interval(c)[0] for c in summands)
+            rest_hi = sum(interval(c)[1] for c in summands)
+            for summand in summands[:-1]:
+                s_lo, s_hi = interval(summand)
+                rest_lo, rest_hi = rest_lo - s_lo, rest_hi - s_hi
+                lo, hi = int_range(max(s_lo, remaining - rest_hi), min(s_hi, remaining - rest_lo))
+                if lo > hi: raise Infeasible()
+                summand_value = random.randint(lo, hi)
+                yield summand, summand_value
+                remaining -= summand_value
+            yield summands[-1], remaining
+        elif isinstance(expr, Subtraction):
+            # minuend - subtrahend = value: choose the subtrahend, the minuend follows
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.minuend), interval(expr.subtrahend)
+            lo, hi = int_range(max(b_lo, a_lo - value), min(b_hi, a_hi - value))
+            if lo > hi: raise Infeasible()
+            subtrahend_value = random.randint(lo, hi)
+            yield expr.subtrahend, subtrahend_value
+            yield expr.minuend, value + subtrahend_value
+        elif isinstance(expr, Product):
+            # factor1 * factor2 = value: choose a divisor as factor2
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.factor1), interval(expr.factor2)
+            if value == 0: raise Infeasible()
+            candidates = [d * sign for d in _divisors(value) for sign in [1, -1] 
+                          if b_lo <= d * sign <= b_hi and a_lo <= value // (d * sign) <= a_hi]
+            if len(candidates) == 0: raise Infeasible()
+            factor2_value = random.choice(candidates)
+            yield expr.factor2, factor2_value
+            yield expr.factor1, value // factor2_value
+        elif isinstance(expr, Fraction):
+            # numerator / denominator = value: choose the denominator, the numerator follows
+            (a_lo, a_hi), (b_lo, b_hi) = interval(expr.numerator), interval(expr.denominator)
+            if value == 0: raise Infeasible()
+            lo, hi = int_range(max(b_lo, min(a_lo / value, a_hi / value)), min(b_hi, max(a_lo / value, a_hi / value)))
+            candidates = [d for d in range(lo, hi + 1) if d != 0 and float(value * d).is_integer()]
+            if len(candidates) == 0: raise Infeasible()
+            denominator_value = random.choice(candidates)
+            yield expr.denominator, denominator_value
+            yield expr.numerator, int(value * denominator_value)
+
+    def assign(expr: Expr, value):
+        stack = [assign_steps(expr, value)]
+        while len(stack) > 0:
+            step = next(stack[-1], None)
+            if step is None:
+                stack.pop()
+            else:
+                stack.append(assign_steps(*step))
+
+    # 3. sample the quantities of the root and construct everything below (retrying draws that turn out infeasible)
+    nr_attempts = 0
+    for _ in range(max_attempts):
+        nr_attempts += 1
+        assigned.clear()
+        try:
+            for quantity in root_quantities:
+                lo, hi = int_range(*interval(quantity))
+                if lo > hi: raise Infeasible() # NOTE: the tree cannot be instantiated within the bounds at all
+                assign(quantity, random.randint(lo, hi))
+            break
+        except Infeasible:
+            if any(int_range(*interval(q))[0] > int_range(*interval(q))[1] for q in root_quantities): break
+
+    # parameters no draw has reached (e.g. on infeasible trees) still need a value s.t. the instantiation can be validated
+    for param in parameters:
+        if param not in instantiation:
+            instantiation.set_even_if_present(param, random.randint(min_leaf_value, max_leaf_value))
+
+    if stats is not None:
+        stats["attempts"] = nr_attempts
+
+    return instantiation
+
+class InstantiationError(ValueError):
+    """ 
+        Raised if no valid instantiation could be found. 
+        Carries the tree, the last (invalid) instantiation and which nodes violated their bounds.
+
+        - violations: list of (node, "too_small" | "too_large")
+        - elapsed: seconds spent before giving up
+    """
+    def __init__(self, message: str, tree: ProofTree, instantiation: Instantiation, violations: List[Tuple[TreeNode, str]], elapsed: float) -> None:
+        super().__init__(message)
+        self.tree = tree
+        self.instantiation = instantiation
+        self.violations = violations
+        self.elapsed = elapsed
+
+    def details(self) -> Dict[str, Any]:
+        """ Classifies the failure by the depth and rule of the violated nodes """
+        violations_by_depth = {}
+        violated_rules = {}
+        for node, kind in self.violations:
+            by_kind = violations_by_depth.setdefault(node.depth, {})
+            by_kind[kind] = by_kind.get(kind, 0) + 1
+            if node.rule is not None:
+                rule_name = type(node.rule).__name__
+                violated_rules[rule_name] = violated_rules.get(rule_name, 0) + 1
+
+        return {
+            "nr_violations": len(self.violations),
+            "violations_by_depth": violations_by_depth,
+            "violated_rules": violated_rules,
+            "elapsed_s": self.elapsed
+        }
+
 class PositiveRandIntInstantiator(Instantiator):
     """ 
         Instantiates all numbers of a problem with random numbers in a range,
@@ -196,11 +631,14 @@ class PositiveRandIntInstantiator(Instantiator):
         - strategy: what is the strategy for finding a valid instantiation
             - random: will try random instantiations until valid
             - cpga: will start with a random instantiation and perform constrained projected gradient ascent
+            - cpga_multistart: same as cpga but follows nr_starts trajectories in parallel (much faster on deep trees)
+            - local_search: will start with a random instantiation and change one leaf at a time (only re-evaluating the affected quantities)
+            - constructive: will sample the root and push the values down to the leaves (valid by construction for additive trees)
         - validate_preselected: regardless of whether quantities have been preselected, if true, this will validate all leaf- and inner-nodes
             if false, only the non-preselected leaf-nodes as well as all inner-nodes are validated
     """
     def __init__(self, leaf_min_value: int = 2, leaf_max_value: int = 100, inner_min_value: int = 2, inner_max_value: int = 1000, 
-                 strategy: str = "cpga", max_attempts: int = 1000000, validate_preselected: bool = True) -> None:
+                 strategy: str = "cpga", max_attempts: int = 1000000, validate_preselected: bool = True, nr_starts: int = 256) -> None:
         self.leaf_min_value = leaf_min_value
         self.leaf_max_value = leaf_max_value
         self.inner_min_value = inner_min_value
@@ -208,6 +646,8 @@ class PositiveRandIntInstantiator(Instantiator):
         self.max_attempts = max_attempts
         self.strategy = strategy
         self.validate_preselected = validate_preselected
+        self.nr_starts = nr_starts
+        self._last_stats = {}
 
         if self.strategy == "random":
             self.rand_int_inst = RandIntInstantiator(min_value=leaf_min_value, max_value=leaf_max_value)
@@ -227,8 +667,27 @@ class PositiveRandIntInstantiator(Instantiator):
                         return False
         return True
 
+    def find_violations(self, tree: ProofTree, instantiation: Instantiation, preselected_leaf_node_ids: List[int] = []) -> List[Tuple[TreeNode, str]]:
+        """ Returns all nodes whose quantities are out of bounds (and whether they're too small or too large) """
+        violations = []
+        for node in tree.traverse():
+            if node.is_leaf:
+                if not self.validate_preselected and tree.id_by_node[node] in preselected_leaf_node_ids: continue
+                min_value, max_value = self.leaf_min_value, self.leaf_max_value
+            else:
+                min_value, max_value = self.inner_min_value, self.inner_max_value
+
+            for quantity in node.logicalform.get_quantities():
+                value = quantity.eval(instantiation)
+                if value < min_value: 
+                    violations.append((node, "too_small"))
+                elif value > max_value:
+                    violations.append((node, "too_large"))
+        return violations
+
     def _instantiate(self, tree: ProofTree, orig_instantiation: Instantiation, skip_existing: bool, seed: int) -> Instantiation:
         assert tree.is_symbolically_computed, "Can only enforce positiveness of intermediates on a symbolically computed tree!"
+        start_time = time.perf_counter()
         
         # establish the list of properties that should be instantiated
         all_vars = [PropertyKey(PropertyType.QUANTITY, pid) for pid in tree.property_tracker.get_by_type(PropertyType.QUANTITY)]
@@ -237,19 +696,40 @@ class PositiveRandIntInstantiator(Instantiator):
             preselected_parameters = list(orig_instantiation.get_instantiations_of_type(PropertyType.QUANTITY).keys())
         parameters = [v for v in all_vars if v not in preselected_parameters]
 
+        self._last_stats = {"strategy": self.strategy, "nr_parameters": len(parameters)}
         if self.strategy == "random":
             # try random instantiations until a valid one is found
             instantiation = rand_int_inst_random(tree, orig_instantiation, parameters,
                                 min_leaf_value=self.leaf_min_value, max_leaf_value=self.leaf_max_value,
                                 min_inner_value=self.inner_min_value, max_inner_value=self.inner_max_value,
-                                max_attempts=self.max_attempts, seed=seed)
+                                max_attempts=self.max_attempts, seed=seed, stats=self._last_stats)
         elif self.strategy == "cpga":
             # use constrained projected gradient descent to find a valid instantiation
             instantiation = rand_int_inst_through_cpga(tree, orig_instantiation, parameters, lr=np.sqrt(self.leaf_max_value - self.leaf_min_value),
                                 min_leaf_value=self.leaf_min_value, max_leaf_value=self.leaf_max_value,
                                 min_inner_value=self.inner_min_value, max_inner_value=self.inner_max_value,
                                 max_steps=self.max_attempts, re_init_after_steps=self.max_attempts // 10,
-                                boundary_bounce=0.25, seed=seed)
+                                boundary_bounce=0.25, seed=seed, stats=self._last_stats)
+        elif self.strategy == "cpga_multistart":
+            # follow many gradient-ascent trajectories in parallel
+            instantiation = rand_int_inst_through_cpga_multistart(tree, orig_instantiation, parameters, lr=np.sqrt(self.leaf_max_value - self.leaf_min_value),
+                                min_leaf_value=self.leaf_min_value, max_leaf_value=self.leaf_max_value,
+                                min_inner_value=self.inner_min_value, max_inner_value=self.inner_max_value,
+                                max_steps=self.max_attempts, re_init_after_steps=self.max_attempts // 10,
+                                boundary_bounce=0.25, nr_starts=self.nr_starts, seed=seed, stats=self._last_stats)
+        elif self.strategy == "constructive":
+            # sample top-down s.t. every node is within bounds by construction
+            instantiation = rand_int_inst_constructive(tree, orig_instantiation, parameters,
+                                min_leaf_value=self.leaf_min_value, max_leaf_value=self.leaf_max_value,
+                                min_inner_value=self.inner_min_value, max_inner_value=self.inner_max_value,
+                                max_attempts=self.max_attempts, seed=seed, stats=self._last_stats)
+        elif self.strategy == "local_search":
+            # change one parameter at a time, guided by the violated quantities
+            instantiation = rand_int_inst_local_search(tree, orig_instantiation, parameters,
+                                min_leaf_value=self.leaf_min_value, max_leaf_value=self.leaf_max_value,
+                                min_inner_value=self.inner_min_value, max_inner_value=self.inner_max_value,
+                                max_steps=self.max_attempts, re_init_after_steps=max(self.max_attempts // 10, 1),
+                                seed=seed, stats=self._last_stats)
 
         # compute which tree-nodes have been preselected
         preselected_leaf_node_ids = []
@@ -261,4 +741,8 @@ class PositiveRandIntInstantiator(Instantiator):
         if self.is_valid_instantiation(tree, instantiation, preselected_leaf_node_ids):
             return instantiation
         
-        raise ValueError(f"Failed to find a valid instantiation after {self.max_attempts} iterations!")
\ No newline at end of file
+        raise InstantiationError(f"Failed to find a valid instantiation after {self.max_attempts} iterations!", tree, instantiation, 
+                                 self.find_violations(tree, instantiation, preselected_leaf_node_ids), time.perf_counter() - start_time)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._last_stats
\ No newline at end of file
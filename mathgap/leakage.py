@@ -0,0 +1,133 @@
+from typing import Any, Dict, Iterable, List, Set
+import hashlib
+import sqlite3
+
+from mathgap.mathwordproblems import MathWordProblem
+from mathgap.filters import MWPFilter, normalize_text
+
+def text_hash(text: str) -> str:
+    """ Hash of the normalized problem text """
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+class LeakageIndex:
+    """
+        Persistent on-disk index (sqlite) of the structural hashes and normalized problem texts of reference datasets.
+        Generation runs can query the index to exclude anything that is already part of e.g. an evaluation set.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS structures (dataset TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (hash, dataset));
+            CREATE TABLE IF NOT EXISTS problems (dataset TEXT NOT NULL, hash TEXT NOT NULL, text TEXT, PRIMARY KEY (hash, dataset));
+        """)
+
+    def add(self, dataset: str, problem: str, structure_hash: str = None):
+        """ Adds a single problem (and optionally the structural hash of its tree) to the index """
+        self.add_records(dataset, [{"problem": problem, "structure_hash": structure_hash}])
+
+    def add_mwps(self, dataset: str, mwps: Iterable[MathWordProblem]):
+        self.add_records(dataset, ({"problem": mwp.ps_nl, "structure_hash": mwp.tree.structural_hash()} for mwp in mwps))
+
+    def add_records(self, dataset: str, records: Iterable[Dict[str, Any]]):
+        """ Adds records (e.g. rows of a generated dataset) with keys "problem" and optionally "structure_hash" to the index """
+        structures, problems = [], []
+        for record in records:
+            problem = record.get("problem", None)
+            if isinstance(problem, str):
+                normalized = normalize_text(problem)
+                problems.append((dataset, text_hash(normalized), normalized))
+            structure_hash = record.get("structure_hash", None)
+            if isinstance(structure_hash, str):
+                structures.append((dataset, structure_hash))
+
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO structures (dataset, hash) VALUES (?, ?)", structures)
+            self._conn.executemany("INSERT OR IGNORE INTO problems (dataset, hash, text) VALUES (?, ?, ?)", problems)
+
+    def datasets(self) -> List[str]:
+        rows = self._conn.execute("SELECT dataset FROM structures UNION SELECT dataset FROM problems").fetchall()
+        return sorted(r[0] for r in rows)
+
+    def _hashes(self, table: str, datasets: List[str] = None) -> Set[str]:
+        if datasets is None:
+            rows = self._conn.execute(f"SELECT DISTINCT hash FROM {table}")
+        else:
+            placeholders = ", ".join("?" for _ in datasets)
+            rows = self._conn.execute(f"SELECT DISTINCT hash FROM {table} WHERE dataset IN ({placeholders})", datasets)
+        return set(r[0] for r in rows)
+
+    def structure_hashes(self, datasets: List[str] = None) -> Set[str]:
+        """ All structural hashes of the specified datasets (or of all datasets if None) """
+        return self._hashes("structures", datasets)
+
+    def problem_hashes(self, datasets: List[str] = None) -> Set[str]:
+        """ All hashes of normalized problem texts of the specified datasets (or of all datasets if None) """
+        return self._hashes("problems", datasets)
+
+    def _contains(self, table: str, h: str, datasets: List[str] = None) -> bool:
+        if datasets is None:
+            row = self._conn.execute(f"SELECT 1 FROM {table} WHERE hash = ? LIMIT 1", (h,)).fetchone()
+        else:
+            placeholders = ", ".join("?" for _ in datasets)
+            row = self._conn.execute(f"SELECT 1 FROM {table} WHERE hash = ? AND dataset IN ({placeholders}) LIMIT 1", (h, *datasets)).fetchone()
+        return row is not None
+
+    def contains_structure(self, structure_hash: str, datasets: List[str] = None) -> bool:
+        return self._contains("structures", structure_hash, datasets)
+
+    def contains_problem(self, problem: str, datasets: List[str] = None) -> bool:
+        return self._contains("problems", text_hash(problem), datasets)
+
+    def close(self):
+        self._conn.close()
+
+class LeakageFilter(MWPFilter):
+    """
+        Drops all mwps that are already present in any of the reference datasets of a leakage index.
+        - datasets: names of the reference datasets (None = all datasets in the index)
+        - by_structure: drop mwps whose proof tree is structurally identical to one in the reference datasets
+        - by_surface: drop mwps whose normalized problem text is present in the reference datasets
+        - preload: loads all hashes into memory once (fast lookups), otherwise the index is queried per mwp
+    """
+    def __init__(self, index: LeakageIndex, datasets: List[str] = None, by_structure: bool = True, by_surface: bool = True, preload: bool = True) -> None:
+        assert by_structure or by_surface, "Need to exclude by at least one of structure or surface"
+        self.index = index
+        self.datasets = datasets
+        self.by_structure = by_structure
+        self.by_surface = by_surface
+        self.preload = preload
+
+        self._structure_hashes = index.structure_hashes(datasets) if (preload and by_structure) else None
+        self._problem_hashes = index.problem_hashes(datasets) if (preload and by_surface) else None
+
+        self.nr_seen = 0
+        self.nr_structure_leaks = 0
+        self.nr_surface_leaks = 0
+
+    def is_structure_leaked(self, mwp: MathWordProblem) -> bool:
+        s_hash = mwp.tree.structural_hash()
+        if self.preload: return s_hash in self._structure_hashes
+        return self.index.contains_structure(s_hash, self.datasets)
+
+    def is_surface_leaked(self, mwp: MathWordProblem) -> bool:
+        if self.preload: return text_hash(mwp.ps_nl) in self._problem_hashes
+        return self.index.contains_problem(mwp.ps_nl, self.datasets)
+
+    def accept(self, mwp: MathWordProblem) -> bool:
+        self.nr_seen += 1
+        if self.by_structure and self.is_structure_leaked(mwp):
+            self.nr_structure_leaks += 1
+            return False
+        if self.by_surface and self.is_surface_leaked(mwp):
+            self.nr_surface_leaks += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seen": self.nr_seen,
+            "dropped": self.nr_structure_leaks + self.nr_surface_leaks,
+            "structure_leaks": self.nr_structure_leaks,
+            "surface_leaks": self.nr_surface_leaks
+        }
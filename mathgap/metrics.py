@@ -0,0 +1,268 @@
+from typing import Any, Dict, List, TextIO
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+class MetricsSink:
+    def record(self, event: Dict[str, Any]):
+        """ Records a single event (one attempt at generating a mwp) """
+        ...
+
+    def close(self):
+        pass
+
+class InMemoryMetrics(MetricsSink):
+    """ Aggregates all events in memory (counts, times per stage, instantiation effort, failure reasons) """
+    def __init__(self) -> None:
+        self.nr_attempts = 0
+        self.nr_accepted = 0
+        self.time_by_stage: Dict[str, float] = {}
+        self.max_time_by_stage: Dict[str, float] = {}
+        self.count_by_stage: Dict[str, int] = {}
+        self.instantiation_totals: Dict[str, int] = {}
+        self.failures_by_reason: Dict[str, int] = {}
+        self.max_retries = 0
+        self.start_time = time.perf_counter()
+
+    def record(self, event: Dict[str, Any]):
+        self.nr_attempts += 1
+        if event["accepted"]:
+            self.nr_accepted += 1
+            self.max_retries = max(self.max_retries, event["retries"])
+        else:
+            reason = f"{event['failure_stage']}: {event['failure_reason']}"
+            self.failures_by_reason[reason] = self.failures_by_reason.get(reason, 0) + 1
+
+        for stage, t in event["stage_times"].items():
+            self.time_by_stage[stage] = self.time_by_stage.get(stage, 0.0) + t
+            self.max_time_by_stage[stage] = max(self.max_time_by_stage.get(stage, 0.0), t)
+            self.count_by_stage[stage] = self.count_by_stage.get(stage, 0) + 1
+
+        for key, value in event["instantiation"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.instantiation_totals[key] = self.instantiation_totals.get(key, 0) + value
+
+    @property
+    def nr_failed(self) -> int:
+        return self.nr_attempts - self.nr_accepted
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.nr_attempts,
+            "accepted": self.nr_accepted,
+            "failed": self.nr_failed,
+            "acceptance_rate": self.nr_accepted / self.nr_attempts if self.nr_attempts > 0 else None,
+            "elapsed_s": time.perf_counter() - self.start_time,
+            "max_retries": self.max_retries,
+            "stages": {
+                stage: {
+                    "count": self.count_by_stage[stage],
+                    "total_s": total,
+                    "mean_s": total / self.count_by_stage[stage],
+                    "max_s": self.max_time_by_stage[stage]
+                }
+                for stage, total in self.time_by_stage.items()
+            },
+            "instantiation": dict(self.instantiation_totals),
+            "failures": dict(self.failures_by_reason),
+        }
+
+    def summary_line(self) -> str:
+        """ Compact single-line summary, e.g. for logging progress """
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.nr_accepted / elapsed if elapsed > 0 else 0.0
+        total_time = sum(self.time_by_stage.values())
+        shares = " ".join(f"{stage}={100 * t / total_time:.0f}%" for stage, t in self.time_by_stage.items()) if total_time > 0 else ""
+        instantiation = " ".join(f"{k}={v}" for k,v in self.instantiation_totals.items())
+        return (f"[{elapsed:.1f}s] accepted {self.nr_accepted}/{self.nr_attempts} ({rate:.2f}/s), failed {self.nr_failed} | "
+                f"{shares} | {instantiation}")
+
+class JsonlMetricsSink(MetricsSink):
+    """ Writes each event as a json-line to a file """
+    def __init__(self, path: str, flush_every: int = 100) -> None:
+        self.path = path
+        self.flush_every = flush_every
+        self._file = open(path, "a", encoding="utf-8")
+        self._nr_unflushed = 0
+
+    def record(self, event: Dict[str, Any]):
+        self._file.write(json.dumps(event) + "\n")
+        self._nr_unflushed += 1
+        if self._nr_unflushed >= self.flush_every:
+            self._file.flush()
+            self._nr_unflushed = 0
+
+    def close(self):
+        self._file.close()
+
+class PeriodicSummarySink(MetricsSink):
+    """
+        Prints a summary line every few accepted mwps and/or seconds
+        - every_n: print after every n accepted mwps (None = never)
+        - every_s: print at most every s seconds (None = never)
+    """
+    def __init__(self, every_n: int = 100, every_s: float = None, out: TextIO = None) -> None:
+        self.every_n = every_n
+        self.every_s = every_s
+        self.out = out if out is not None else sys.stderr
+        self.aggregator = InMemoryMetrics()
+        self._last_print_time = time.perf_counter()
+        self._last_print_attempts = 0
+
+    def record(self, event: Dict[str, Any]):
+        self.aggregator.record(event)
+
+        due = event["accepted"] and self.every_n is not None and self.aggregator.nr_accepted % self.every_n == 0
+        due |= self.every_s is not None and (time.perf_counter() - self._last_print_time) >= self.every_s
+        if due: self._print()
+
+    def _print(self):
+        print(self.aggregator.summary_line(), file=self.out)
+        self._last_print_time = time.perf_counter()
+        self._last_print_attempts = self.aggregator.nr_attempts
+
+    def close(self):
+        if self.aggregator.nr_attempts > self._last_print_attempts: self._print()
+
+class FailureAnalytics(MetricsSink):
+    """ 
+        Analyzes why attempts fail, by aggregating
+        - the acceptance rate per tree depth
+        - bound violations per depth of the violating node (too small or too large)
+        - the rule mix of failed vs accepted trees
+        - the time spent on attempts that were discarded
+    """
+    def __init__(self) -> None:
+        self.attempts_by_depth: Dict[int, int] = {}
+        self.accepted_by_depth: Dict[int, int] = {}
+        self.violations_by_depth: Dict[int, Dict[str, int]] = {}
+        self.violated_rules: Dict[str, int] = {}
+        self.rules_in_failed: Dict[str, int] = {}
+        self.rules_in_accepted: Dict[str, int] = {}
+        self.failures_by_stage: Dict[str, int] = {}
+        self.time_accepted = 0.0
+        self.time_failed = 0.0
+
+    def record(self, event: Dict[str, Any]):
+        tree_stats = event.get("tree", {})
+        depth = tree_stats.get("depth", None)
+        self.attempts_by_depth[depth] = self.attempts_by_depth.get(depth, 0) + 1
+        elapsed = sum(event["stage_times"].values())
+
+        if event["accepted"]:
+            self.accepted_by_depth[depth] = self.accepted_by_depth.get(depth, 0) + 1
+            self.time_accepted += elapsed
+            rule_counts = self.rules_in_accepted
+        else:
+            self.failures_by_stage[event["failure_stage"]] = self.failures_by_stage.get(event["failure_stage"], 0) + 1
+            self.time_failed += elapsed
+            rule_counts = self.rules_in_failed
+
+            details = event.get("failure_details", {})
+            for node_depth, by_kind in details.get("violations_by_depth", {}).items():
+                depth_violations = self.violations_by_depth.setdefault(node_depth, {})
+                for kind, count in by_kind.items():
+                    depth_violations[kind] = depth_violations.get(kind, 0) + count
+            for rule, count in details.get("violated_rules", {}).items():
+                self.violated_rules[rule] = self.violated_rules.get(rule, 0) + count
+
+        for rule, count in tree_stats.get("rules", {}).items():
+            rule_counts[rule] = rule_counts.get(rule, 0) + count
+
+    def report(self) -> Dict[str, Any]:
+        total_time = self.time_accepted + self.time_failed
+        return {
+            "acceptance_rate_by_depth": {
+                depth: self.accepted_by_depth.get(depth, 0) / attempts 
+                for depth, attempts in sorted(self.attempts_by_depth.items(), key=lambda x: (x[0] is None, x[0]))
+            },
+            "failures_by_stage": dict(self.failures_by_stage),
+            "violations_by_depth": dict(sorted(self.violations_by_depth.items())),
+            "violated_rules": dict(self.violated_rules),
+            "rules_in_failed": dict(self.rules_in_failed),
+            "rules_in_accepted": dict(self.rules_in_accepted),
+            "time_failed_s": self.time_failed,
+            "time_accepted_s": self.time_accepted,
+            "wasted_time_share": self.time_failed / total_time if total_time > 0 else None,
+        }
+
+def tree_stats(tree) -> Dict[str, Any]:
+    """ Summary of the shape and rule mix of a proof tree """
+    rules = {}
+    for node in tree.traverse():
+        if node.rule is None: continue
+        rule_name = type(node.rule).__name__
+        rules[rule_name] = rules.get(rule_name, 0) + 1
+    return {
+        "depth": tree.depth,
+        "nr_nodes": len(tree.node_by_id),
+        "nr_leaves": len(tree.leaf_nodes),
+        "rules": rules
+    }
+
+class GenerationMetrics:
+    """
+        Collects per-stage wall-times, instantiation effort and failure reasons of each attempt at generating a mwp
+        and forwards them to all sinks (e.g. InMemoryMetrics, JsonlMetricsSink, PeriodicSummarySink).
+    """
+    def __init__(self, sinks: List[MetricsSink] = None) -> None:
+        self.sinks = sinks if sinks is not None else []
+        self._event = None # NOTE: None outside of an attempt
+        self._current_stage = None
+        self._retries = 0
+
+    def start_attempt(self, seed: int):
+        self._event = {
+            "seed": seed,
+            "accepted": False,
+            "retries": self._retries,
+            "stage_times": {},
+            "instantiation": {},
+            "failure_stage": None,
+            "failure_reason": None
+        }
+        self._current_stage = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """ Measures the wall-time of a stage of the current attempt """
+        self._current_stage = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._event is not None: self._event["stage_times"][name] = time.perf_counter() - start
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.sinks) > 0
+
+    def set_tree_stats(self, tree):
+        if self.enabled and self._event is not None: self._event["tree"] = tree_stats(tree)
+
+    def set_instantiation_stats(self, stats: Dict[str, Any]):
+        """ Attaches the instantiation effort to the current attempt (ignored outside of an attempt, e.g. when instantiating directly) """
+        if self._event is not None: self._event["instantiation"] = dict(stats)
+
+    def set_failure_details(self, details: Dict[str, Any]):
+        if self._event is not None: self._event["failure_details"] = details
+
+    def end_attempt(self, accepted: bool, failure_reason: str = None):
+        """ Finishes the current attempt, if it failed, the failure is attributed to the last stage that was started """
+        event = self._event
+        event["accepted"] = accepted
+        if accepted:
+            self._retries = 0
+        else:
+            event["failure_stage"] = self._current_stage
+            event["failure_reason"] = failure_reason
+            self._retries += 1
+
+        for sink in self.sinks:
+            sink.record(event)
+        self._event = None
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
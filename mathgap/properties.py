@@ -49,6 +49,11 @@ class PropertyTracker:
         identifier = self.request_id(property_type)
         return PropertyKey(property_type, identifier)
     
+    def release_id(self, property_type: PropertyType, identifier: int):
+        """ Marks the id of a property as no longer used (e.g. after removing the part of a tree that used it) """
+        if identifier in self.used_ids[property_type]:
+            self.used_ids[property_type].remove(identifier)
+    
     def get_by_type(self, property_type: PropertyType) -> List[int]:
         """ Get all properties of the specified type """
         return self.used_ids.get(property_type, [])
@@ -1,3 +1,12 @@
+import importlib
+
 from mathgap.renderers.renderer import Renderer, PerTypeRenderer
 from mathgap.renderers.text import R as TEXT_RENDERER
-from mathgap.renderers.graph import ProofTreeRenderer, write_network_utf8, TimeDAGRenderer
\ No newline at end of file
+
+# NOTE: the graph renderers depend on networkx and pyvis and are therefore only imported on first access
+_LAZY_GRAPH_EXPORTS = ["ProofTreeRenderer", "write_network_utf8", "TimeDAGRenderer"]
+
+def __getattr__(name: str):
+    if name in _LAZY_GRAPH_EXPORTS:
+        return getattr(importlib.import_module("mathgap.renderers.graph"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,2 +1,3 @@
 from mathgap.trees.prooftree import ProofTree
-from mathgap.trees.generators.generator import Generator
\ No newline at end of file
+from mathgap.trees.generators.generator import Generator
+from mathgap.trees.hashing import canonical_property_mapping, structural_signature, structural_hash, canonical_structure
\ No newline at end of file
@@ -1,6 +1,7 @@
 from mathgap.trees.generators.generator import Generator
 from mathgap.trees.generators.general import GeneralGenerator
-from mathgap.trees.generators.multi import MultiGenerator
+from mathgap.trees.generators.multi import MultiGenerator, AdaptiveMultiGenerator, StratifiedGenerator
+from mathgap.trees.generators.enumerating import EnumeratingGenerator
 
 from mathgap.trees.generators.policies.rulesamplingpolicy import RuleSamplingPolicy
 from mathgap.trees.generators.policies.uniform import UniformPolicy
@@ -0,0 +1,85 @@
+from typing import Any, List
+import math
+import random
+
+from mathgap.trees.prooftree import ProofTree
+from mathgap.trees.rules import InferenceRule
+from mathgap.logicalforms import LogicalForm
+from mathgap.trees.generators.stoppingcriteria import Criterion
+
+class Decisions:
+    """ 
+        Source of all (random) decisions that are taken while generating a tree.
+        By default, decisions are sampled with the global random module (i.e. reproducible through random.seed).
+    """
+    def choice(self, options: List[Any]) -> Any:
+        return random.choice(options)
+
+    def flip(self, prob: float) -> bool:
+        """ True with probability prob """
+        return random.random() <= prob
+
+    def shuffle(self, items: List[Any]):
+        """ Shuffles the items in-place """
+        random.shuffle(items)
+
+    def randint(self, a: int, b: int) -> int:
+        """ Random integer in [a,b] """
+        return random.randint(a, b)
+
+    def rule(self, policy, lf: LogicalForm, tree: ProofTree, rules: List[InferenceRule], stopping_criterion: Criterion, check_applicability: bool = True) -> InferenceRule:
+        """ Selects the rule that is applied (in reverse) to lf according to the rule-sampling-policy """
+        return policy.sample(lf, tree, rules, stopping_criterion, check_applicability)
+
+class ScriptedDecisions(Decisions):
+    """ 
+        Takes the decisions according to a script (index of the chosen option per decision) and the first option once the script runs out
+        (or, if rng is specified, a uniformly random option).
+        Records all decisions that have been taken and how many options each of them had (e.g. to enumerate all possible trees).
+    """
+    def __init__(self, script: List[int] = None, rng: random.Random = None) -> None:
+        self.script = [] if script is None else script
+        self.rng = rng
+        self.taken: List[int] = []
+        self.nr_options: List[int] = []
+
+    def _decide(self, options: List[Any]) -> Any:
+        return options[self._decide_index(len(options))]
+
+    def _decide_index(self, nr_options: int) -> int:
+        """ Index of the chosen option (without materializing the options) """
+        assert nr_options > 0, "Cannot decide without any options"
+        pos = len(self.taken)
+        if pos < len(self.script):
+            idx = self.script[pos]
+        else:
+            idx = 0 if self.rng is None else self.rng.randrange(nr_options)
+        self.taken.append(idx)
+        self.nr_options.append(nr_options)
+        return idx
+
+    def choice(self, options: List[Any]) -> Any:
+        return self._decide(options)
+
+    def flip(self, prob: float) -> bool:
+        if prob >= 1.0: return self._decide([True])
+        if prob <= 0.0: return self._decide([False])
+        return self._decide([True, False])
+
+    def shuffle(self, items: List[Any]):
+        # NOTE: decodes the idx-th permutation in lexicographic order (as itertools.permutations) instead of listing all n! of them
+        idx = self._decide_index(math.factorial(len(items)))
+        remaining = list(items)
+        for i in range(len(items)):
+            j, idx = divmod(idx, math.factorial(len(items) - 1 - i))
+            items[i] = remaining.pop(j)
+
+    def randint(self, a: int, b: int) -> int:
+        return self._decide(list(range(a, b+1)))
+
+    def rule(self, policy, lf: LogicalForm, tree: ProofTree, rules: List[InferenceRule], stopping_criterion: Criterion, check_applicability: bool = True) -> InferenceRule:
+        applicable_rules = [r for r in rules if r.is_reverse_applicable(lf, tree)] if check_applicability else rules
+        if len(applicable_rules) == 0: return None
+
+        probs = policy.get_probs(lf, tree, applicable_rules, stopping_criterion)
+        return self._decide([r for r,p in probs.items() if p > 0])
@@ -0,0 +1,144 @@
+from typing import Iterator, List, Set, Tuple, Type
+import heapq
+import itertools
+import math
+import random
+
+from mathgap.trees.generators.general import GeneralGenerator
+from mathgap.trees.generators.decisions import ScriptedDecisions
+from mathgap.trees.generators.stoppingcriteria import Criterion
+from mathgap.trees.generators.policies import RuleSamplingPolicy
+
+from mathgap.trees.prooftree import ProofTree, TreeNode
+from mathgap.trees.rules import InferenceRule
+from mathgap.logicalforms import ComparisonType, ADDITIVE_COMP_TYPES
+
+class EnumeratingGenerator(GeneralGenerator):
+    def __init__(self, start_types: List[Type], inference_rules: List[InferenceRule], rule_sampling_policy: RuleSamplingPolicy, stopping_criterion: Criterion,
+                 min_part_whole: int = 2, max_part_whole: int = 4, comp_same_entity_prob: float = 0.5, compeq_same_entity_prob: float = 1.0,
+                 comp_allowed_comparisons: List[ComparisonType] = ADDITIVE_COMP_TYPES,
+                 use_attribute: bool = False, use_unit: bool = False,
+                 shard_index: int = 0, shard_count: int = 1) -> None:
+        """
+            Generator that enumerates every structurally distinct tree that the GeneralGenerator with the same arguments can generate exactly once
+            (i.e. every rule with non-zero probability under the rule_sampling_policy, every parametrization etc).
+
+            The enumeration is a depth-first search over the decisions taken by the GeneralGenerator:
+            each tree is generated by replaying a prefix of decisions, and every decision beyond the prefix opens up its alternatives as new prefixes.
+            Trees that are structurally identical to an already enumerated tree (e.g. only the properties are numbered differently) are skipped.
+
+            - shard_index, shard_count: only enumerate the trees of some subtrees of the decisions, s.t. the enumeration can be split across processes
+                (each shard only replays its own subtrees, see shard_prefixes).
+                NOTE: duplicates are filtered by structural hash within a shard only. Distinct decisions can lead to the same structure,
+                thus trees of different shards may coincide and should be deduplicated by structural hash (e.g. tree.structural_hash()) when merging the shards.
+
+            NOTE: each replay yields a tree that is dropped if its structural hash has been seen before,
+                thus the work is linear in the number of decision sequences (rather than in the number of distinct trees).
+                Building and validating each tree dominates (e.g. >90% of the time for FULL_NONLINEAR_RULESET at depth 2), 
+                which is why sub-derivations aren't memoized per type of logical form.
+
+            see GeneralGenerator for all other arguments
+        """
+        super().__init__(start_types, inference_rules, rule_sampling_policy, stopping_criterion, min_part_whole, max_part_whole,
+                         comp_same_entity_prob, compeq_same_entity_prob, comp_allowed_comparisons, use_attribute, use_unit)
+        assert 0 <= shard_index < shard_count, "Shard index must be in [0, shard_count)"
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self._stream = None
+
+    # how many subtrees of the decisions are split off per shard (more subtrees balance the shards better)
+    SUBTREES_PER_SHARD = 16
+    # how many random completions of a prefix are used to estimate how many trees it leads to
+    NR_ESTIMATE_SAMPLES = 8
+
+    def replay(self, prefix: List[int]) -> Tuple[ProofTree, List[List[int]]]:
+        """ Generates the tree of a prefix of decisions, returns it together with the prefixes of all alternatives to the decisions beyond the prefix """
+        decisions = ScriptedDecisions(prefix)
+        tree = self.generate_with(decisions)
+        # NOTE: the alternatives of the shallowest decisions come first, s.t. (popping from the end) the most recent decisions are changed first
+        alternatives = [
+            decisions.taken[:pos] + [alternative]
+            for pos in range(len(prefix), len(decisions.taken))
+            for alternative in range(decisions.nr_options[pos] - 1, 0, -1)
+        ]
+        return tree, alternatives
+
+    def estimate_nr_trees(self, prefix: List[int]) -> float:
+        """ 
+            Estimates how many trees a prefix of decisions leads to, as the mean product of the number of options of all decisions beyond the prefix
+            along random completions of the prefix (Knuth's estimator). The completions are seeded by the prefix, s.t. all shards agree on the estimate.
+        """
+        rng = random.Random(str(prefix))
+        total = 0
+        for _ in range(self.NR_ESTIMATE_SAMPLES):
+            decisions = ScriptedDecisions(prefix, rng)
+            self.generate_with(decisions)
+            total += math.prod(decisions.nr_options[len(prefix):])
+        return total / self.NR_ESTIMATE_SAMPLES
+
+    def shard_prefixes(self) -> Tuple[List[ProofTree], List[List[int]]]:
+        """ 
+            Splits the decisions into disjoint subtrees by repeatedly expanding the prefix that is estimated to lead to the most trees,
+            until there are enough of them. The trees generated while splitting are dealt out round-robin, 
+            the subtrees are dealt out largest first to the shard with the fewest (estimated) trees so far.
+            Returns the trees and the prefixes of the subtrees of this shard.
+
+            NOTE: every shard takes the same splits (i.e. replays a few hundred trees), s.t. the shards don't need to communicate
+        """
+        if self.shard_count == 1: return [], [[]]
+
+        frontier = [(0, 0, [])] # heap of (-estimated nr of trees, tie-breaker, prefix)
+        tie_breaker = itertools.count(1)
+        own_trees = []
+        nr_split = 0
+        while 0 < len(frontier) < self.shard_count * self.SUBTREES_PER_SHARD:
+            _, _, prefix = heapq.heappop(frontier)
+            tree, alternatives = self.replay(prefix)
+            if nr_split % self.shard_count == self.shard_index: own_trees.append(tree)
+            nr_split += 1
+            for alternative in alternatives:
+                heapq.heappush(frontier, (-self.estimate_nr_trees(alternative), next(tie_breaker), alternative))
+
+        load = [0.0 for _ in range(self.shard_count)]
+        own_prefixes = []
+        for negative_estimate, _, prefix in sorted(frontier):
+            shard = min(range(self.shard_count), key=lambda i: load[i])
+            load[shard] -= negative_estimate
+            if shard == self.shard_index: own_prefixes.append(prefix)
+        return own_trees, own_prefixes
+
+    def enumerate_trees(self) -> Iterator[ProofTree]:
+        """ Lazily enumerates all structurally distinct trees (of this shard) """
+        seen_hashes: Set[str] = set([])
+
+        def is_new(tree: ProofTree) -> bool:
+            structural_hash = tree.structural_hash()
+            if structural_hash in seen_hashes: return False
+            seen_hashes.add(structural_hash)
+            return True
+
+        own_trees, own_prefixes = self.shard_prefixes()
+        for tree in own_trees:
+            if is_new(tree): yield tree
+
+        prefixes = list(reversed(own_prefixes))
+        while len(prefixes) > 0:
+            tree, alternatives = self.replay(prefixes.pop())
+            prefixes.extend(alternatives)
+            if is_new(tree): yield tree
+
+    def generate(self, seed: int = 14) -> ProofTree:
+        """ Returns the next tree of the enumeration (the seed is ignored), once all trees have been enumerated, the enumeration starts over """
+        if self._stream is None:
+            self._stream = self.enumerate_trees()
+
+        tree = next(self._stream, None)
+        if tree is None:
+            self._stream = self.enumerate_trees()
+            tree = next(self._stream, None)
+            assert tree is not None, "There are no trees to enumerate"
+        return tree
+
+    def repair(self, tree: ProofTree, node: TreeNode, seed: int = 14) -> bool:
+        # NOTE: a randomly regenerated subtree would break the guarantee that each tree is enumerated exactly once
+        return False
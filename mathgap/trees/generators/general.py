@@ -1,21 +1,40 @@
-from typing import Dict, List, Tuple, Generator as GenType, Type
+from typing import Any, Callable, Dict, List, Tuple, Generator as GenType, Type
 import random
 
 from mathgap.trees.generators.generator import Generator
+from mathgap.trees.generators.decisions import Decisions
 from mathgap.trees.generators.stoppingcriteria import Criterion
 from mathgap.trees.generators.policies import RuleSamplingPolicy
 
-from mathgap.trees.prooftree import ProofTree
-from mathgap.trees.rules import InferenceRule, ContContComp, ContCompCompeqCont, ContTransferCont, ContCompCont, ContPartWhole
+from mathgap.trees.prooftree import ProofTree, TreeNode, TraversalOrder
+from mathgap.trees.rules import InferenceRule, Parametrization, ContCompCompeqCont, ContTransferCont, ContCompCont
 from mathgap.logicalforms import LogicalForm, Container, ComparisonType, Comp, PartWhole, ADDITIVE_COMP_TYPES
 from mathgap.properties import PropertyType, PropertyTracker, PropertyKey
 from mathgap.expressions import Variable
 
+# Builds the parametrization of a rule that is applied in reverse to lf
+# (generator, lf, tree, decisions, context) -> parametrization, where context is shared by all builders while generating the same tree
+ParametrizationBuilder = Callable[['GeneralGenerator', LogicalForm, ProofTree, Decisions, Dict[str, Any]], Parametrization]
+PARAMETRIZATION_BUILDERS: Dict[Type[InferenceRule], ParametrizationBuilder] = {}
+
+def register_parametrization_builder(rule_type: Type[InferenceRule]):
+    """ Decorator that registers a parametrization builder for a rule-type (and all its subclasses). Rules without builder require no parametrization. """
+    def register(builder: ParametrizationBuilder) -> ParametrizationBuilder:
+        PARAMETRIZATION_BUILDERS[rule_type] = builder
+        return builder
+    return register
+
+def parametrization_builder(rule: InferenceRule) -> ParametrizationBuilder | None:
+    for rule_type in type(rule).__mro__:
+        if rule_type in PARAMETRIZATION_BUILDERS:
+            return PARAMETRIZATION_BUILDERS[rule_type]
+    return None
+
 class GeneralGenerator(Generator):
     def __init__(self, start_types: List[Type], inference_rules: List[InferenceRule], rule_sampling_policy: RuleSamplingPolicy, stopping_criterion: Criterion, 
                  min_part_whole: int = 2, max_part_whole: int = 4, comp_same_entity_prob: float = 0.5, compeq_same_entity_prob: float = 1.0, 
                  comp_allowed_comparisons: List[ComparisonType] = ADDITIVE_COMP_TYPES,
-                 use_attribute: bool = False, use_unit: bool = False) -> None:
+                 use_attribute: bool = False, use_unit: bool = False, time_ordered_bookkeeping: bool = True) -> None:
         """ 
             - start_types: the types of lf that the inference tree can have at its root?
             - inference_rules: the allowed inference rules which can be applied to generate the tree
@@ -27,6 +46,9 @@ class GeneralGenerator(Generator):
             - comp_allowed_comparisons: what are the list of allowed comparisons for Comp-nodes
             - use_attribute: whether the generated entities will have attributes
             - use_unit: whether the generated entities will have units
+            - time_ordered_bookkeeping: if False, the trees are updated in post-order instead of time-order and expansions are not validated,
+                which avoids rebuilding the time-dag (quadratic in the number of nodes) after every expansion, e.g. for stress-testing very deep trees.
+                NOTE: time-ordered bookkeeping consumes random state, thus the trees differ from the default ones for the same seed
         """
         super().__init__(start_types, inference_rules, stopping_criterion)
         self.rule_sampling_policy = rule_sampling_policy
@@ -40,6 +62,9 @@ class GeneralGenerator(Generator):
         assert not (use_attribute and use_unit), "Having both attributes and units isn't currently supported"
         self.use_attribute = use_attribute
         self.use_unit = use_unit
+        self.time_ordered_bookkeeping = time_ordered_bookkeeping
+
+        self._rules_by_conclusion_type: Dict[Type, List[InferenceRule]] = {}
 
     def _request_var(self, property_tracker: PropertyTracker, use_entity: bool|int=True, use_attribute: bool|None|int=False, use_unit: bool|None|int=False):
         entity = None
@@ -72,121 +97,63 @@ class GeneralGenerator(Generator):
 
     def generate(self, seed: int = 14) -> ProofTree:
         random.seed(seed)
-        use_attribute, use_unit = self.use_attribute, self.use_unit
-
-        question_type = random.choice(self.start_types)
-
-        property_tracker = PropertyTracker()            
-        def var_from_container(cont: Container):
-            return (cont.agent, cont.entity, cont.attribute, cont.unit)
-        
-        def set_parametrization(parametrization: Dict, var_name: str, var):
-            parametrization[f"{var_name}_agent"] = var[0] 
-            parametrization[f"{var_name}_entity"] = var[1] 
-            parametrization[f"{var_name}_attribute"] = var[2] 
-            parametrization[f"{var_name}_unit"] = var[3] 
-
-        root = self.create_start_lf(question_type, property_tracker, use_attribute, use_unit)
-        tree = ProofTree(root=root, property_tracker=property_tracker)
-
-        part_whole_entities = set([])
-        for lf, valid_rules in self.expand_bfs(tree, root, property_tracker):
-            rule = self.rule_sampling_policy.sample(lf, tree, valid_rules, self.stopping_criterion)
-            parametrization = {}
-            if isinstance(rule, ContTransferCont):
-                assert isinstance(lf, Container), "Conclusion is expected to be Container"
-                vars = [lf.agent]
-
-                # if we start with a part-whole then no other agent should have any such entity
-                # e.g. A has 4 apples. B has 3 peaches. C gets 3 peaches from B. How many peaches does everyone combined have? => 7 bc A has 4, B has 0 and C has 3
-                if lf.entity not in part_whole_entities:
-                    vars.append(property_tracker.request_id(PropertyType.AGENT))
-                else:
-                    vars.append(None)
-
-                random.shuffle(vars)
-
-                parametrization["sender_agent"] = vars[0]
-                parametrization["receiver_agent"] = vars[1]
-                parametrization["attribute"] = lf.attribute # TODO: allow introduction of attribute if none and no unit
-                parametrization["unit"] = lf.unit
-            elif isinstance(rule, ContCompCont):
-                assert isinstance(lf, Container), "Conclusion is expected to be Container"
-                comp_same_entity = random.random() <= self.comp_same_entity_prob
-
-                ue,ua,uu = True, use_attribute, use_unit
-                if comp_same_entity:
-                    ue,ua,uu = lf.entity, lf.attribute, lf.unit
-
-                vars = [
-                    var_from_container(lf),
-                    self._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
-                ]
-                random.shuffle(vars)
-
-                set_parametrization(parametrization, "subj", vars[0])
-                set_parametrization(parametrization, "obj", vars[1])
-
-                parametrization["comp_type"] = random.choice(self.comp_allowed_comparisons)
+        return self.generate_with(Decisions())
 
-            elif isinstance(rule, ContCompCompeqCont):
-                assert isinstance(lf, Container), "Conclusion is expected to be Container"
-
-                compeq_same_entity = random.random() <= self.compeq_same_entity_prob
-
-                ue,ua,uu = True, use_attribute, use_unit
-                if compeq_same_entity:
-                    ue,ua,uu = lf.entity, lf.attribute, lf.unit
+    def generate_with(self, decisions: Decisions) -> ProofTree:
+        """ Generates a tree where all choices are taken by decisions """
+        use_attribute, use_unit = self.use_attribute, self.use_unit
 
-                # NOTE: conclusion must match with subj or obj and not other_subj or other_obj 
-                vars = [
-                    var_from_container(lf),
-                    self._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
-                ]
-                random.shuffle(vars)
-                vars += [
-                    self._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
-                    self._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
-                ]
+        question_type = decisions.choice(self.start_types)
 
-                set_parametrization(parametrization, "subj", vars[0])
-                set_parametrization(parametrization, "obj", vars[1])
-                set_parametrization(parametrization, "other_subj", vars[2])
-                set_parametrization(parametrization, "other_obj", vars[3])
+        property_tracker = PropertyTracker()
+        root = self.create_start_lf(question_type, property_tracker, use_attribute, use_unit, decisions)
+        tree = ProofTree(root=root, property_tracker=property_tracker, 
+                         bookkeeping_order=TraversalOrder.TIME if self.time_ordered_bookkeeping else TraversalOrder.POST)
 
-                parametrization["comp_type"] = random.choice([ComparisonType.MORE_THAN]) # , ComparisonType.LESS_THAN
-                parametrization["other_comp_type"] = random.choice([ComparisonType.MORE_THAN]) #, ComparisonType.LESS_THAN
+        self.expand(tree, root, decisions)
+        tree.compute_symbolically()
+        return tree
 
-            elif isinstance(rule, ContContComp):
-                assert isinstance(lf, Comp), "Conclusion is expected to be a Comparison"
-                # NOTE: no parametrization
+    def repair(self, tree: ProofTree, node: TreeNode, seed: int = 14) -> bool:
+        """ 
+            Regenerates the subtree below node (keeping the logical form of node and the rest of the tree)
+            NOTE: if node is a leaf (e.g. its derivation has been removed already), it is only re-derived
+        """
+        random.seed(seed)
+        lf = node.logicalform
+        if not node.is_leaf: tree.remove_derivation(lf)
+        self.expand(tree, lf, Decisions())
+        tree.compute_symbolically()
+        return True
 
-            elif isinstance(rule, ContPartWhole):
-                assert isinstance(lf, PartWhole), "Conclusion is expected to be a PartWhole"
-                # NOTE: no parametrization
+    def expand(self, tree: ProofTree, start: LogicalForm, decisions: Decisions):
+        """ Derives start (a leaf of the tree) until the stopping criterion is met """
+        context = {"part_whole_entities": set([])}
+        for lf, valid_rules in self.expand_bfs(tree, start, tree.property_tracker):
+            rule = decisions.rule(self.rule_sampling_policy, lf, tree, valid_rules, self.stopping_criterion, check_applicability=False)
+            builder = parametrization_builder(rule)
+            parametrization = {} if builder is None else builder(self, lf, tree, decisions, context)
 
             premises = rule.apply_reverse(lf, parametrization)
             tree.add_derivation(premises, lf, rule)
 
-            assert tree.validate(), "Should not be able to generate invalid trees!"
-
-        tree.compute_symbolically()
-        return tree
+            assert not self.time_ordered_bookkeeping or tree.validate(), "Should not be able to generate invalid trees!"
     
-    def create_start_lf(self, typ: Type, property_tracker: PropertyTracker, use_attribute: bool, use_unit: bool) -> LogicalForm:
+    def create_start_lf(self, typ: Type, property_tracker: PropertyTracker, use_attribute: bool, use_unit: bool, decisions: Decisions = None) -> LogicalForm:
+        if decisions is None: decisions = Decisions()
         if typ == Container:
             var = self._request_var(property_tracker, use_entity=True, use_attribute=use_attribute, use_unit=use_unit)
             return Container(agent=var[0], quantity=None, entity=var[1], attribute=var[2], unit=var[3])
         elif typ == Comp:
             var_subj = self._request_var(property_tracker, use_entity=True, use_attribute=use_attribute, use_unit=use_unit)
             
-            comp_same_entity = random.random() <= self.comp_same_entity_prob
+            comp_same_entity = decisions.flip(self.comp_same_entity_prob)
             if comp_same_entity:
                 var_obj = self._request_var(property_tracker, use_entity=var_subj[1], use_attribute=var_subj[2], use_unit=var_subj[3])
             else:
                 var_obj = self._request_var(property_tracker, use_entity=True, use_attribute=use_attribute, use_unit=use_unit)
 
-            comp_type = random.choice(self.comp_allowed_comparisons)
+            comp_type = decisions.choice(self.comp_allowed_comparisons)
             return Comp(subj_agent = var_subj[0], obj_agent = var_obj[0], 
                  comp_type = comp_type, quantity = None, 
                  subj_entity = var_subj[1], subj_attribute = var_subj[2], subj_unit = var_subj[3], 
@@ -195,7 +162,7 @@ class GeneralGenerator(Generator):
             whole_attribute = None if not use_attribute else property_tracker.request_id(PropertyType.ATTRIBUTE)
             whole_unit = None if not use_unit else property_tracker.request_id(PropertyType.UNIT)
 
-            n = random.randint(self.min_part_whole, self.max_part_whole) # NOTE: the current templates only support >1 part
+            n = decisions.randint(self.min_part_whole, self.max_part_whole) # NOTE: the current templates only support >1 part
             part_agents = [
                 property_tracker.request_id(PropertyType.AGENT)
                 for _ in range(n)
@@ -219,6 +186,19 @@ class GeneralGenerator(Generator):
             raise ValueError(f"Starting with {typ.__name__} not supported!")
 
     
+    def candidate_rules(self, lf_type: Type) -> List[InferenceRule]:
+        """ All rules that can conclude a logical form of type lf_type (looked up once per type) """
+        if lf_type not in self._rules_by_conclusion_type:
+            self._rules_by_conclusion_type[lf_type] = [
+                r for r in self.inference_rules 
+                if r.conclusion_type is None or issubclass(lf_type, r.conclusion_type)
+            ]
+        return self._rules_by_conclusion_type[lf_type]
+
+    def applicable_rules(self, lf: LogicalForm, tree: ProofTree) -> List[InferenceRule]:
+        """ All rules that can be applied in reverse to lf, only rules that depend on the tree are checked against it """
+        return [r for r in self.candidate_rules(type(lf)) if not r.requires_tree_check or r.is_reverse_applicable(lf, tree)]
+
     def expand_bfs(self, tree: ProofTree, root: LogicalForm, property_tracker: PropertyTracker) -> GenType[Tuple[LogicalForm, List[InferenceRule]], None, None]:
         """ Gradually tries to expand nodes in a BFS manner """
         leaves_queue = [root]
@@ -226,7 +206,7 @@ class GeneralGenerator(Generator):
             leaf = leaves_queue.pop(0)
             leafnode = tree.nodes_by_lf[leaf]
             if not self.stopping_criterion.satisfied(leafnode, tree):
-                valid_rules = [r for r in self.inference_rules if r.is_reverse_applicable(leaf, tree)]
+                valid_rules = self.applicable_rules(leaf, tree)
                 # try expand the next node
                 if len(valid_rules) > 0: # we can actually extend on this node
                     yield (leaf, valid_rules)
@@ -237,4 +217,89 @@ class GeneralGenerator(Generator):
                     leaf.make_axiom(property_tracker)
             else:
                 # mark the final nodes as axioms
-                leaf.make_axiom(property_tracker)
\ No newline at end of file
+                leaf.make_axiom(property_tracker)
+
+def _var_from_container(cont: Container):
+    return (cont.agent, cont.entity, cont.attribute, cont.unit)
+
+def _set_parametrization(parametrization: Dict, var_name: str, var):
+    parametrization[f"{var_name}_agent"] = var[0] 
+    parametrization[f"{var_name}_entity"] = var[1] 
+    parametrization[f"{var_name}_attribute"] = var[2] 
+    parametrization[f"{var_name}_unit"] = var[3] 
+
+@register_parametrization_builder(ContTransferCont)
+def _parametrize_transfer(generator: GeneralGenerator, lf: LogicalForm, tree: ProofTree, decisions: Decisions, context: Dict[str, Any]) -> Parametrization:
+    assert isinstance(lf, Container), "Conclusion is expected to be Container"
+    parametrization = {}
+    vars = [lf.agent]
+
+    # if we start with a part-whole then no other agent should have any such entity
+    # e.g. A has 4 apples. B has 3 peaches. C gets 3 peaches from B. How many peaches does everyone combined have? => 7 bc A has 4, B has 0 and C has 3
+    if lf.entity not in context["part_whole_entities"]:
+        vars.append(tree.property_tracker.request_id(PropertyType.AGENT))
+    else:
+        vars.append(None)
+
+    decisions.shuffle(vars)
+
+    parametrization["sender_agent"] = vars[0]
+    parametrization["receiver_agent"] = vars[1]
+    parametrization["attribute"] = lf.attribute # TODO: allow introduction of attribute if none and no unit
+    parametrization["unit"] = lf.unit
+    return parametrization
+
+@register_parametrization_builder(ContCompCont)
+def _parametrize_comp(generator: GeneralGenerator, lf: LogicalForm, tree: ProofTree, decisions: Decisions, context: Dict[str, Any]) -> Parametrization:
+    assert isinstance(lf, Container), "Conclusion is expected to be Container"
+    parametrization = {}
+    comp_same_entity = decisions.flip(generator.comp_same_entity_prob)
+
+    ue,ua,uu = True, generator.use_attribute, generator.use_unit
+    if comp_same_entity:
+        ue,ua,uu = lf.entity, lf.attribute, lf.unit
+
+    vars = [
+        _var_from_container(lf),
+        generator._request_var(tree.property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
+    ]
+    decisions.shuffle(vars)
+
+    _set_parametrization(parametrization, "subj", vars[0])
+    _set_parametrization(parametrization, "obj", vars[1])
+
+    parametrization["comp_type"] = decisions.choice(generator.comp_allowed_comparisons)
+    return parametrization
+
+@register_parametrization_builder(ContCompCompeqCont)
+def _parametrize_comp_compeq(generator: GeneralGenerator, lf: LogicalForm, tree: ProofTree, decisions: Decisions, context: Dict[str, Any]) -> Parametrization:
+    assert isinstance(lf, Container), "Conclusion is expected to be Container"
+    parametrization = {}
+    compeq_same_entity = decisions.flip(generator.compeq_same_entity_prob)
+
+    ue,ua,uu = True, generator.use_attribute, generator.use_unit
+    if compeq_same_entity:
+        ue,ua,uu = lf.entity, lf.attribute, lf.unit
+
+    # NOTE: conclusion must match with subj or obj and not other_subj or other_obj 
+    property_tracker = tree.property_tracker
+    vars = [
+        _var_from_container(lf),
+        generator._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
+    ]
+    decisions.shuffle(vars)
+    vars += [
+        generator._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
+        generator._request_var(property_tracker, use_entity=ue, use_attribute=ua, use_unit=uu),
+    ]
+
+    _set_parametrization(parametrization, "subj", vars[0])
+    _set_parametrization(parametrization, "obj", vars[1])
+    _set_parametrization(parametrization, "other_subj", vars[2])
+    _set_parametrization(parametrization, "other_obj", vars[3])
+
+    parametrization["comp_type"] = decisions.choice([ComparisonType.MORE_THAN]) # , ComparisonType.LESS_THAN
+    parametrization["other_comp_type"] = decisions.choice([ComparisonType.MORE_THAN]) #, ComparisonType.LESS_THAN
+    return parametrization
+
+# NOTE: ContContComp and ContPartWhole require no parametrization
@@ -2,7 +2,7 @@ from typing import List, Type
 
 from mathgap.trees.generators.stoppingcriteria import Criterion
 
-from mathgap.trees.prooftree import ProofTree
+from mathgap.trees.prooftree import ProofTree, TreeNode
 from mathgap.trees.rules import InferenceRule
 
 class Generator:
@@ -21,3 +21,14 @@ class Generator:
         """ Generates a proof tree """
         ...
 
+    def feedback(self, tree: ProofTree, accepted: bool):
+        """ Called after a generated tree has either been accepted or discarded (e.g. because it couldn't be instantiated) """
+        pass
+
+    def repair(self, tree: ProofTree, node: TreeNode, seed: int = 14) -> bool:
+        """ 
+            Regenerates the subtree below node of a tree that has been generated by this generator (in-place), 
+            e.g. because the subtree makes the tree impossible to instantiate.
+            Returns false if repairing is not supported.
+        """
+        return False
@@ -1,22 +1,135 @@
-from typing import Dict
+from typing import Callable, Dict, Hashable, List
 import random
 
 from mathgap.trees.generators.generator import Generator
-from mathgap.trees.prooftree import ProofTree
+from mathgap.trees.prooftree import ProofTree, TreeNode
 
 class MultiGenerator(Generator):
     def __init__(self, weights_by_generator: Dict[Generator, float]):
         """ Generator that consists of multiple generators that will be sampled randomly """
         self.generators = list(weights_by_generator.keys())
         self.weights = [weights_by_generator[g] for g in self.generators]
+        self.last_generator: Generator = None
+
+    def sampling_weights(self) -> List[float]:
+        """ Weights with which the sub-generators are sampled """
+        return self.weights
 
     def generate(self, seed: int = 14) -> ProofTree:
         random.seed(seed)
 
-        generator = random.choices(self.generators, weights=self.weights, k=1)[0]
+        generator = random.choices(self.generators, weights=self.sampling_weights(), k=1)[0]
+        self.last_generator = generator
         tree = generator.generate(seed)
 
         if not tree.is_symbolically_computed:
             tree.compute_symbolically()
             
-        return tree
\ No newline at end of file
+        return tree
+
+    def feedback(self, tree: ProofTree, accepted: bool):
+        if self.last_generator is not None:
+            self.last_generator.feedback(tree, accepted)
+
+    def repair(self, tree: ProofTree, node: TreeNode, seed: int = 14) -> bool:
+        if self.last_generator is None: return False
+        return self.last_generator.repair(tree, node, seed)
+
+class AdaptiveMultiGenerator(MultiGenerator):
+    def __init__(self, weights_by_generator: Dict[Generator, float], prior_strength: float = 2.0, min_acceptance_rate: float = 0.01):
+        """ 
+            Generator that consists of multiple generators, where each generator is sampled proportionally to 
+            its weight divided by the rate at which its trees are accepted (i.e. can be instantiated, pass all filters etc).
+            Thereby, the mix of accepted trees matches the specified weights, 
+            even if some of the generators (e.g. deep trees) fail much more often than others.
+
+            - prior_strength: how many (virtual) attempts with a 50% acceptance rate each generator starts with
+            - min_acceptance_rate: lower bound on the estimated acceptance rate (avoids over-sampling generators that never succeed)
+        """
+        super().__init__(weights_by_generator)
+        self.prior_strength = prior_strength
+        self.min_acceptance_rate = min_acceptance_rate
+        self.nr_attempts = [0 for _ in self.generators]
+        self.nr_accepted = [0 for _ in self.generators]
+
+    def acceptance_rate(self, generator: Generator) -> float:
+        """ Estimated (smoothed) rate at which trees of a sub-generator are accepted """
+        i = self.generators.index(generator)
+        rate = (self.nr_accepted[i] + 0.5 * self.prior_strength) / (self.nr_attempts[i] + self.prior_strength)
+        return max(rate, self.min_acceptance_rate)
+
+    def sampling_weights(self) -> List[float]:
+        return [w / self.acceptance_rate(g) for g,w in zip(self.generators, self.weights)]
+
+    def feedback(self, tree: ProofTree, accepted: bool):
+        if self.last_generator is None: return
+        
+        i = self.generators.index(self.last_generator)
+        self.nr_attempts[i] += 1
+        if accepted: self.nr_accepted[i] += 1
+        super().feedback(tree, accepted)
+
+class StratifiedGenerator(MultiGenerator):
+    def __init__(self, generators_by_stratum: Dict[Hashable, Generator], quotas: Dict[Hashable, int], 
+                 stratum_of: Callable[[ProofTree], Hashable] = None):
+        """ 
+            Generator that fills exact quotas per stratum (e.g. per (depth, width, ruleset, attribute/unit)).
+            Strata are sampled proportionally to how many of their mwps are still missing, filled strata are never sampled again.
+            Use generate_stratified_mwps (or a QuotaFilter) to drop mwps of strata that are already filled and stop once all quotas are met.
+
+            - generators_by_stratum: which generator produces the trees of each stratum (the same generator can serve multiple strata)
+            - quotas: how many accepted mwps are required per stratum
+            - stratum_of: if specified, the stratum of a tree is determined from the tree itself (e.g. if the width is only known after generation),
+                otherwise the tree is attributed to the stratum it was generated for
+        """
+        assert set(quotas.keys()) <= set(generators_by_stratum.keys()), "Every stratum with a quota requires a generator"
+        super().__init__({g: 1.0 for g in generators_by_stratum.values()})
+        self.generators_by_stratum = generators_by_stratum
+        self.quotas = quotas
+        self.stratum_of = stratum_of
+        self.fill = {s: 0 for s in quotas.keys()}
+        self.last_stratum: Hashable = None
+
+    def remaining(self, stratum: Hashable) -> int:
+        """ How many more mwps are required for a stratum """
+        return max(self.quotas.get(stratum, 0) - self.fill.get(stratum, 0), 0)
+
+    @property
+    def total_quota(self) -> int:
+        return sum(self.quotas.values())
+
+    @property
+    def is_filled(self) -> bool:
+        return all(self.remaining(s) == 0 for s in self.quotas.keys())
+
+    def tree_stratum(self, tree: ProofTree) -> Hashable:
+        """ The stratum a (just generated) tree counts towards """
+        if self.stratum_of is not None: return self.stratum_of(tree)
+        return self.last_stratum
+
+    def has_room(self, tree: ProofTree) -> bool:
+        """ Whether the stratum of the tree still requires more mwps """
+        return self.remaining(self.tree_stratum(tree)) > 0
+
+    def generate(self, seed: int = 14) -> ProofTree:
+        assert not self.is_filled, "All quotas have been met already"
+        random.seed(seed)
+
+        strata = [s for s in self.quotas.keys() if self.remaining(s) > 0]
+        stratum = random.choices(strata, weights=[self.remaining(s) for s in strata], k=1)[0]
+        generator = self.generators_by_stratum[stratum]
+        self.last_stratum = stratum
+        self.last_generator = generator
+        tree = generator.generate(seed)
+
+        if not tree.is_symbolically_computed:
+            tree.compute_symbolically()
+            
+        return tree
+
+    def feedback(self, tree: ProofTree, accepted: bool):
+        if accepted:
+            stratum = self.tree_stratum(tree)
+            assert self.remaining(stratum) > 0, f"Stratum {stratum} has been filled already, use a QuotaFilter to drop such mwps"
+            self.fill[stratum] += 1
+        super().feedback(tree, accepted)
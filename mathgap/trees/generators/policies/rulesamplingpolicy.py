@@ -11,12 +11,13 @@ class RuleSamplingPolicy:
         """ Returns the probabilities with which each rule should be selected for some logical form of a tree """
         ...
 
-    def sample(self, lf: LogicalForm, tree: ProofTree, rules: List[InferenceRule], stopping_criterion: Criterion) -> InferenceRule | None:
+    def sample(self, lf: LogicalForm, tree: ProofTree, rules: List[InferenceRule], stopping_criterion: Criterion, check_applicability: bool = True) -> InferenceRule | None:
         """ 
             Samples an inference rule by establishing which rules are applicable to extend on lf,
             and then choosing a rule according to its probability.
+            - check_applicability: set to false if all rules are known to be applicable already (e.g. when they have been filtered by the generator)
         """
-        applicable_rules = [r for r in rules if r.is_reverse_applicable(lf, tree)] 
+        applicable_rules = [r for r in rules if r.is_reverse_applicable(lf, tree)] if check_applicability else rules
         
         if len(applicable_rules) == 0: return None
 
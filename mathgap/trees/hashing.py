@@ -0,0 +1,86 @@
+from typing import Dict, List, Tuple
+import hashlib
+
+from mathgap.trees.prooftree import ProofTree, TreeNode, TraversalOrder
+from mathgap.properties import PropertyKey, PropertyType
+from mathgap.expressions import Expr, Variable
+
+def canonical_property_mapping(tree: ProofTree) -> Dict[PropertyKey, PropertyKey]:
+    """
+        Maps every property of the tree onto a canonical property (per property-type numbered by first occurrence in DFS-order).
+        Two trees that only differ in how their agents, entities etc are numbered will have the same canonical properties.
+
+        NOTE: quantities are only mapped for axioms (i.e. the variables), all other quantities are expressions over those.
+    """
+    return canonical_structure(tree)[1]
+
+def structural_signature(tree: ProofTree, mapping: Dict[PropertyKey, PropertyKey] = None) -> Tuple:
+    """
+        Returns a canonical representation of the structure of a tree, which includes
+        the topology, the inference rules, the types of the logical forms, the comparison types
+        and which properties are shared between the logical forms (up to renaming).
+    """
+    if mapping is None: return canonical_structure(tree)[0]
+    return tuple([_signature_entry(node, node.logicalform.get_available_properties(), mapping) for node in tree.traverse(TraversalOrder.DFS)])
+
+def canonical_structure(tree: ProofTree) -> Tuple[Tuple, Dict[PropertyKey, PropertyKey], List[TreeNode]]:
+    """ 
+        Returns the structural signature, the canonical property mapping and the nodes in DFS-order (i.e. the order of the signature)
+        NOTE: a single traversal, where the properties of each logical form are only looked up once
+    """
+    mapping: Dict[PropertyKey, PropertyKey] = {}
+    next_id_by_type = {t: 1 for t in PropertyType}
+
+    def canon(prop_key: PropertyKey) -> PropertyKey:
+        if prop_key not in mapping:
+            mapping[prop_key] = PropertyKey(prop_key.property_type, next_id_by_type[prop_key.property_type])
+            next_id_by_type[prop_key.property_type] += 1
+        return mapping[prop_key]
+
+    signature, nodes = [], []
+    for node in tree.traverse(TraversalOrder.DFS):
+        lf = node.logicalform
+        properties = lf.get_available_properties()
+        for prop_key in properties.values():
+            for pk in (prop_key if isinstance(prop_key, list) else [prop_key]):
+                if pk.property_type in [PropertyType.QUANTITY, PropertyType.COMPARISON]: continue
+                canon(pk)
+        for es in lf.get_entity_specs():
+            for part_entity_id in es.part_entity_ids:
+                canon(PropertyKey(PropertyType.ENTITY, part_entity_id))
+        if node.is_leaf:
+            for quantity in lf.get_quantities():
+                if isinstance(quantity, Variable):
+                    canon(quantity.identifier)
+
+        # NOTE: all properties of the node have been mapped by now
+        signature.append(_signature_entry(node, properties, mapping))
+        nodes.append(node)
+    return tuple(signature), mapping, nodes
+
+def _signature_entry(node: TreeNode, properties: Dict[str, PropertyKey|List[PropertyKey]], mapping: Dict[PropertyKey, PropertyKey]) -> Tuple:
+    def canon_id(prop_key: PropertyKey):
+        if prop_key.property_type == PropertyType.COMPARISON:
+            # NOTE: depending on validation, the comparison-type is stored either as enum or as its value
+            return getattr(prop_key.identifier, "value", prop_key.identifier)
+        return mapping[prop_key].identifier
+
+    lf = node.logicalform
+    props = []
+    for name, prop_key in properties.items():
+        if isinstance(prop_key, list):
+            props.append((name, tuple(canon_id(pk) for pk in prop_key)))
+        elif isinstance(prop_key.identifier, Expr):
+            continue # quantities are fully determined by the structure
+        else:
+            props.append((name, canon_id(prop_key)))
+    for es in lf.get_entity_specs():
+        if es.has_part_entities:
+            props.append(("part_entities", tuple(mapping[PropertyKey(PropertyType.ENTITY, e)].identifier for e in es.part_entity_ids)))
+
+    rule_name = None if node.rule is None else type(node.rule).__name__
+    return (type(lf).__name__, rule_name, len(node.child_nodes), tuple(props))
+
+def structural_hash(tree: ProofTree) -> str:
+    """ Hash of the structural signature of a tree, invariant to renumbering of the properties """
+    return hashlib.blake2b(repr(structural_signature(tree)).encode("utf-8"), digest_size=16).hexdigest()
@@ -1,17 +1,22 @@
 import random
-from typing import Dict, Generator, List, Set, Tuple, Type
+from typing import TYPE_CHECKING, Dict, Generator, List, Set, Tuple, Type
 from enum import Enum
 from copy import deepcopy
 from collections import Counter
 
-import networkx as nx
-
 from mathgap.trees.rules import InferenceRule
 from mathgap.trees.timing import VariableKey, VariableTimes
 
-from mathgap.properties import PropertyTracker
+from mathgap.properties import PropertyTracker, PropertyKey, PropertyType
+from mathgap.expressions import Variable, simplify
 from mathgap.logicalforms import LogicalForm, Container
 
+if TYPE_CHECKING:
+    import networkx as nx
+
+# below this number of nodes, comparing the times of all pairs of nodes is cheaper than computing the structural signature (i.e. the key of the StructureCache)
+STRUCTURE_CACHE_MIN_NODES = 12
+
 class TraversalOrder(Enum):
     DFS = "depth-first-search"
     POST = "post-order-traversal"
@@ -40,7 +45,15 @@ class TreeNode:
 
 class ProofTree:
     """ Represents a proof tree, where the root node can be derived from all the leaves (axioms) by using inference rules. """
-    def __init__(self, root: LogicalForm, property_tracker: PropertyTracker) -> None:
+    def __init__(self, root: LogicalForm, property_tracker: PropertyTracker, bookkeeping_order: TraversalOrder = None) -> None:
+        """
+            - root: the logical form of the root node
+            - property_tracker: keeps track of the properties that are used by the tree
+            - bookkeeping_order: in which order the variable-times and expressions of the nodes are (re-)computed (TIME by default).
+                Any order that visits premises before their conclusion computes the same results, however:
+                TIME consumes the global random state (i.e. it is part of the seeded output of generators) and rebuilds the time-dag every time,
+                POST is much faster for deep trees and only recomputes the ancestors of new derivations.
+        """
         self.root_node = TreeNode(root, depth=0)
         self.leaf_nodes: List[TreeNode] = []
         self.nodes_by_lf: Dict[LogicalForm, TreeNode] = {} # map <lf to tree node>
@@ -50,6 +63,7 @@ class ProofTree:
         self.parent_by_node: Dict[TreeNode, TreeNode] = {} # map <child to parent>
     
         self.times_by_node: Dict[TreeNode, VariableTimes] = {} # only the times involved in the node, map <node to map <descriptor to set <times of descriptor>>>
+        self.assigned_times_by_node: Dict[TreeNode, VariableTimes] = {} # times assigned when the node was added (i.e. as a leaf), map <node to variable-times>
         self.complete_times_by_node: Dict[TreeNode, VariableTimes] = {} # all the times inherited also from parent nodes, map <node to map <descriptor to set <times of descriptor>>>
 
         self.depth = 0
@@ -57,6 +71,10 @@ class ProofTree:
         self.property_tracker = property_tracker
 
         self.is_symbolically_computed = False
+        self.bookkeeping_order = TraversalOrder.TIME if bookkeeping_order is None else bookkeeping_order
+        assert self.bookkeeping_order in [TraversalOrder.TIME, TraversalOrder.POST], "Bookkeeping requires premises to be visited before their conclusion"
+        self._has_complete_times = False # whether the times of all nodes are up-to-date (i.e. only depend on the structure of the tree)
+        self._time_predecessors: Dict[int, List[int]] = None # memoized time_predecessors (only while the times are complete)
         root_vt = VariableTimes({vk: {0} for vk in root.get_variable_keys()})
         self._register_node(self.root_node, root_vt)
         self._refresh_complete_variable_times()
@@ -72,6 +90,8 @@ class ProofTree:
         assert parent_node.is_leaf, "Cannot add multiple derivations for a logical form!"
         
         child_nodes = [TreeNode(p, parent_node.depth + 1) for p in premises]
+        self._has_complete_times = False
+        self._time_predecessors = None
         self.nodes_by_lf[conclusion].set_derivation(child_nodes, rule)
         self.leaf_nodes.remove(parent_node)
 
@@ -80,7 +100,53 @@ class ProofTree:
             self.parent_by_node[child] = parent_node 
             self._register_node(child, variable_times_assigns[child.logicalform])
 
+        self._refresh_complete_variable_times(changed_node=parent_node)
+
+    def remove_derivation(self, conclusion: LogicalForm) -> List[TreeNode]:
+        """ 
+            Removes the derivation of some node (i.e. the whole subtree below it), s.t. the node becomes a leaf again and can be re-derived.
+            Properties that were only used by the removed nodes are released from the property tracker.
+            Returns the removed nodes.
+        """
+        assert conclusion in self.nodes_by_lf, "Can only remove derivations of existing nodes!"
+        parent_node = self.nodes_by_lf[conclusion]
+        assert not parent_node.is_leaf, "Node has no derivation that could be removed!"
+
+        removed_nodes = []
+        stack = list(parent_node.child_nodes)
+        while len(stack) > 0:
+            node = stack.pop(-1)
+            removed_nodes.append(node)
+            stack.extend(node.child_nodes)
+
+        self._has_complete_times = False
+        self._time_predecessors = None
+        for node in removed_nodes:
+            self._unregister_node(node)
+        parent_node.set_derivation([], None)
+        self.leaf_nodes.append(parent_node)
+        self.times_by_node[parent_node] = self.assigned_times_by_node[parent_node]
+
+        # release all properties that are no longer used by any node
+        removed_keys = set([k for n in removed_nodes for k in property_keys(n.logicalform)])
+        remaining_keys = set([k for n in self.nodes for k in property_keys(n.logicalform)])
+        for prop_key in removed_keys.difference(remaining_keys):
+            self.property_tracker.release_id(prop_key.property_type, prop_key.identifier)
+
+        self.depth = max(n.depth for n in self.nodes)
+        self.is_symbolically_computed = False
         self._refresh_complete_variable_times()
+        return removed_nodes
+
+    def _unregister_node(self, node: TreeNode):
+        self.nodes_by_lf.pop(node.logicalform)
+        node_id = self.id_by_node.pop(node)
+        self.node_by_id.pop(node_id)
+        self.nodes_by_type[type(node.logicalform)].remove(node)
+        self.parent_by_node.pop(node)
+        self.times_by_node.pop(node)
+        self.assigned_times_by_node.pop(node)
+        if node in self.leaf_nodes: self.leaf_nodes.remove(node)
 
     def _register_node(self, node: TreeNode, variable_times_assign: VariableTimes):
         self.nodes_by_lf[node.logicalform] = node
@@ -92,6 +158,7 @@ class ProofTree:
         self.nodes_by_type[type(node.logicalform)] = self.nodes_by_type.get(type(node.logicalform), []) + [node]
 
         self.times_by_node[node] = variable_times_assign
+        self.assigned_times_by_node[node] = variable_times_assign
 
         # update stats about the tree
         self.leaf_nodes.append(node)
@@ -117,9 +184,20 @@ class ProofTree:
                 raise ValueError(f"{instruction} not supported in tree query!")
         return node
 
-    def _refresh_complete_variable_times(self):
-        """ Recomputes the complete/full variable-times for each node (e.g. after new nodes have been added to the tree) """
-        for node in self.traverse(TraversalOrder.TIME):
+    def _refresh_complete_variable_times(self, changed_node: TreeNode = None):
+        """ 
+            Recomputes the complete/full variable-times for each node (e.g. after new nodes have been added to the tree) 
+            - changed_node: if specified (and the bookkeeping is done in POST order), only this node and its ancestors are recomputed
+        """
+        if self.bookkeeping_order == TraversalOrder.POST and changed_node is not None:
+            # NOTE: the times of a node only depend on its premises, thus only the ancestors of the changed node can change
+            nodes = [changed_node]
+            while nodes[-1] in self.parent_by_node:
+                nodes.append(self.parent_by_node[nodes[-1]])
+        else:
+            nodes = self.traverse(self.bookkeeping_order)
+
+        for node in nodes:
             if node.is_leaf: continue
 
             self.times_by_node[node] = node.rule.infer_variable_times(
@@ -127,13 +205,24 @@ class ProofTree:
                 node.logicalform, 
                 {lf:self.times_by_node[self.nodes_by_lf[lf]] for lf in node.premises}
             )
+        self._has_complete_times = True
 
     def compute_symbolically(self):
         """ Applies the inference rules in a forward manner to compute an expression for each node """
-        for node in self.traverse(TraversalOrder.TIME):
+        for node in self.traverse(self.bookkeeping_order):
             if node.is_leaf: continue
             node.rule.infer_knowledge(node.premises, node.logicalform)
+        self.simplify()
         self.is_symbolically_computed = True
+
+    def simplify(self):
+        """ 
+            Canonicalizes the quantities of all nodes (see expressions.simplify), s.t. evaluating them and their gradients works on a smaller graph
+            NOTE: the quantities keep their structure (e.g. for rendering them with to_str), only how they are evaluated changes
+        """
+        quantities = [q for node in self.nodes for q in node.logicalform.get_quantities() if q is not None]
+        for quantity, simplified in zip(quantities, simplify(quantities)):
+            quantity.set_simplified(simplified)
     
     def instantiated_quantities(self, questions: List[LogicalForm], instantiation): 
         """ 
@@ -172,21 +261,23 @@ class ProofTree:
 
                     stack.extend(reversed(node.child_nodes))
             elif order == TraversalOrder.POST:
-                def _traverse_post(node: TreeNode) -> List[TreeNode]:
-                    nodes = []
-                    for child in node.child_nodes:
-                        nodes.extend(_traverse_post(child))
-                    nodes.append(node)
-                    return nodes
-
-                for node in _traverse_post(self.root_node):
-                    yield node
+                # NOTE: iterative s.t. deep trees don't exceed the recursion limit
+                stack = [(self.root_node, False)]
+                while len(stack) > 0:
+                    node, children_done = stack.pop(-1)
+                    if children_done:
+                        yield node
+                        continue
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in reversed(node.child_nodes))
             elif order == TraversalOrder.TIME:
-                time_dag = self.build_time_dag()
+                predecessors_by_id = self.time_predecessors()
+                node_ids = [self.id_by_node[n] for n in self.nodes]
                 leaf_node_ids = set([self.id_by_node[n] for n in self.leaf_nodes])
-                potential_next_node_ids = [n_id for n_id in time_dag.nodes if time_dag.in_degree(n_id) == 0 and n_id in leaf_node_ids]
+                potential_next_node_ids = [n_id for n_id in node_ids if len(predecessors_by_id[n_id]) == 0 and n_id in leaf_node_ids]
                 visited_node_ids = [] # nodes that have been sampled so far (in order)
-                blocked_node_ids = [n_id for n_id in time_dag.nodes if n_id not in potential_next_node_ids] # nodes currently blocked
+                visited_node_id_set = set([]) # NOTE: for fast lookups in deep trees
+                blocked_node_ids = [n_id for n_id in node_ids if n_id not in potential_next_node_ids] # nodes currently blocked
 
                 while len(potential_next_node_ids) > 0:
                     # pop random next node
@@ -196,17 +287,18 @@ class ProofTree:
 
                     potential_next_node_ids.remove(node_id)
                     visited_node_ids.append(node_id)
+                    visited_node_id_set.add(node_id)
 
                     # check which nodes are now no longer blocked
                     for next_node_id in blocked_node_ids:
                         next_node = self.node_by_id[next_node_id]
-                        if not all([self.id_by_node[c] in visited_node_ids for c in next_node.child_nodes]): continue # not all premises have been sampled yet
-                        if not all([p_id in visited_node_ids for p_id in time_dag.predecessors(next_node_id)]): continue # not all timedag parents (need to happen before) have been sampled yet
+                        if not all(self.id_by_node[c] in visited_node_id_set for c in next_node.child_nodes): continue # not all premises have been sampled yet
+                        if not all(p_id in visited_node_id_set for p_id in predecessors_by_id[next_node_id]): continue # not all timedag parents (need to happen before) have been sampled yet
                         
                         potential_next_node_ids.append(next_node_id)
                         blocked_node_ids.remove(next_node_id)
                 
-                forgotten_node_ids = set(self.node_by_id.keys()).difference(set(visited_node_ids))
+                forgotten_node_ids = set(self.node_by_id.keys()).difference(visited_node_id_set)
                 assert len(forgotten_node_ids) == 0, f"Need to have sampled all nodes by the end of the traversal. Forgot nodes: {forgotten_node_ids}"
             elif order == TraversalOrder.BFS:
                 raise NotImplementedError("TODO: Implement BFS")
@@ -220,28 +312,25 @@ class ProofTree:
         """
         # NOTE: due to the tree structure, there can never be 2 nodes that we're able to visit next simultaneously
         rest_of_leaves = leaves_order.copy()
-        known_facts: List[TreeNode] = []
+        known_facts: Set[TreeNode] = set([])
         while len(known_facts) < len(self.nodes_by_lf.values()):
             # add leaf as new fact
             leaf_id = rest_of_leaves.pop(0)
             leaf_node = self.node_by_id[leaf_id]
-            known_facts.append(leaf_node)
+            known_facts.add(leaf_node)
             yield leaf_node
             
             # while we can conclude new facts:
-            new_fact_inferred = True
-            while new_fact_inferred:
-                new_fact_inferred = False
-                for node in self.traverse(TraversalOrder.POST):
-                    if node in known_facts: continue # skip known facts
-                    if node.is_leaf: continue # leaves should be consumed from the provided order
-                    
-                    # if all premises are known to derive the node
-                    if all(node in known_facts for node in node.child_nodes):
-                        # add the conclusion as a new fact
-                        known_facts.append(node)
-                        yield node
-                        new_fact_inferred = True
+            # NOTE: all other facts that could be concluded already have been, thus only the ancestors of the new leaf can be concluded (bottom-up)
+            node = self.parent_by_node.get(leaf_node)
+            while node is not None and node not in known_facts:
+                # if all premises are known to derive the node
+                if not all(child in known_facts for child in node.child_nodes): break
+                
+                # add the conclusion as a new fact
+                known_facts.add(node)
+                yield node
+                node = self.parent_by_node.get(node)
 
     def traverse_writes(self) -> Generator[Tuple[VariableKey, int], None, None]:
         """ Traverses all (write to variable at time) of the tree in no specific order """
@@ -284,28 +373,57 @@ class ProofTree:
                 return False
             
         # check post order
-        time_dag = self.build_time_dag()
-        visited_node_ids = []
+        predecessors_by_id = self.time_predecessors()
+        visited_node_ids = set([])
         for node in self.traverse(TraversalOrder.POST):
             node_id = self.id_by_node[node]
             # NOTE: we already know all premises have been visited by definition of POST order
             # make sure all time-dag parents (need to happen before) have been visited before
-            if not all([p_id in visited_node_ids for p_id in time_dag.predecessors(node_id)]): return False 
-            visited_node_ids.append(node_id)
+            if not all(p_id in visited_node_ids for p_id in predecessors_by_id[node_id]): return False 
+            visited_node_ids.add(node_id)
             
         return True
     
-    def build_time_dag(self) -> nx.DiGraph:
+    def build_time_dag(self) -> 'nx.DiGraph':
         """ 
             Creates a DAG that respects the variable-times (i.e. each node points to nodes that can only happen after itself), 
             thus by following edges you advance in time.
         """
+        import networkx as nx # NOTE: imported lazily, only needed for sampling orders based on time
         graph = nx.DiGraph()
 
         # each tree-node gets its own node in the time DAG
         for node in self.nodes:
             graph.add_node(self.id_by_node[node])
 
+        for node_id, predecessor_ids in self.time_predecessors().items():
+            for predecessor_id in predecessor_ids:
+                graph.add_edge(predecessor_id, node_id)
+        
+        assert nx.is_directed_acyclic_graph(graph), "Timegraph is expected to be a DAG"
+        return graph
+
+    def time_predecessors(self) -> Dict[int, List[int]]:
+        """ 
+            For each node-id, the ids of the nodes that need to happen before it according to the variable-times (i.e. its parents in the time-dag)
+            NOTE: memoized until the tree changes (do not modify the result in-place), 
+                if a StructureCache is active, it is shared with all other (large enough) trees of the same structure
+        """
+        # NOTE: while the times are being refreshed, they also depend on the previous state of the tree
+        if not self._has_complete_times: return self._compute_time_predecessors()
+
+        if self._time_predecessors is None:
+            from mathgap.trees.structurecache import active_structure_cache
+            cache = active_structure_cache()
+            if cache is not None and len(self.node_by_id) >= STRUCTURE_CACHE_MIN_NODES:
+                self._time_predecessors = cache.time_predecessors(self)
+            else:
+                self._time_predecessors = self._compute_time_predecessors()
+        return self._time_predecessors
+
+    def _compute_time_predecessors(self) -> Dict[int, List[int]]:
+        predecessors_by_id = {self.id_by_node[node]: [] for node in self.nodes}
+
         # compare each pair of nodes of the tree to establish a timeline
         for node in self.nodes:
             node_id = self.id_by_node[node]
@@ -318,15 +436,37 @@ class ProofTree:
 
                 if not node_vts.can_happen_after(other_node_vts):
                     # node must happen before other_node
-                    graph.add_edge(node_id, other_node_id)
+                    predecessors_by_id[other_node_id].append(node_id)
+        return predecessors_by_id
 
-        
-        assert nx.is_directed_acyclic_graph(graph), "Timegraph is expected to be a DAG"
-        return graph
+    def canonical_structure(self) -> Tuple[Tuple, Dict[PropertyKey, PropertyKey], List[TreeNode]]:
+        """ 
+            The structural signature, the canonical property mapping (see hashing) and the nodes in DFS-order (i.e. the order of the signature)
+            NOTE: not memoized, since generators modify the logical forms of the tree in-place (e.g. when turning leaves into axioms)
+        """
+        from mathgap.trees.hashing import canonical_structure
+        return canonical_structure(self)
+
+    def structural_hash(self) -> str:
+        """ Hash of the structure of this tree (rules, logical forms and shared properties), invariant to renumbering of properties """
+        from mathgap.trees.hashing import structural_hash
+        return structural_hash(self)
 
     def copy(self) -> 'ProofTree':
         return deepcopy(self)
     
     def __repr__(self):
         from mathgap.renderers import TEXT_RENDERER
-        return TEXT_RENDERER(self)
\ No newline at end of file
+        return TEXT_RENDERER(self)
+
+def property_keys(lf: LogicalForm) -> List[PropertyKey]:
+    """ All (non-expression) properties of a logical form, including the variables of its quantities """
+    keys = []
+    for prop_key in lf.get_available_properties().values():
+        for pk in (prop_key if isinstance(prop_key, list) else [prop_key]):
+            if pk.property_type in [PropertyType.QUANTITY, PropertyType.COMPARISON]: continue
+            keys.append(pk)
+    for quantity in lf.get_quantities():
+        if isinstance(quantity, Variable):
+            keys.append(quantity.identifier)
+    return keys
@@ -23,6 +23,9 @@ class ContContComp(InferenceRule):
             
             Note: This does not allow us to say anything about the total of either agent, except if it directly involves the total.
     """
+    conclusion_type = Comp
+    requires_tree_check = True
+
     def is_reverse_applicable(self, conclusion: LogicalForm, tree) -> bool:
         if not isinstance(conclusion, Comp): return False
         # the tree must no contain a write (e.g. container) to either one of the two agent.entities involved in the comp
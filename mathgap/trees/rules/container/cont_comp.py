@@ -23,6 +23,9 @@ class ContCompCont(InferenceRule):
             We know how many entities one agent has, and we know how many entities that agent has compared to the other, 
             thus we know how many entities the other has.            
     """
+    conclusion_type = Container
+    requires_tree_check = False
+
     def is_reverse_applicable(self, conclusion: LogicalForm, tree) -> bool:
         if isinstance(conclusion, Container): return True
         # NOTE: we don't do sanity checks on the tree because the rule is expected to introduce a new agent.entity
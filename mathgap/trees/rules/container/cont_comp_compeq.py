@@ -29,6 +29,9 @@ class ContCompCompeqCont(InferenceRule):
             and we know this is equal to how the first agent compares to a fourth agent,
             then we know how many entities the fourth agent has.
     """
+    conclusion_type = Container
+    requires_tree_check = False
+
     def is_reverse_applicable(self, conclusion: LogicalForm, tree) -> bool:
         if isinstance(conclusion, Container): return True        
         # NOTE: we don't do sanity checks on the tree because the rule is expected to introduce a new agent.entity
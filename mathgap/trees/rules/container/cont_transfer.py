@@ -30,6 +30,9 @@ class ContTransferCont(InferenceRule):
 
         NOTE: If the container and conclusion are without attribute, this permits the transfer to have one.
     """
+    conclusion_type = Container
+    requires_tree_check = False
+
     def is_reverse_applicable(self, conclusion: LogicalForm, tree) -> bool:
         if isinstance(conclusion, Container): return True
         # NOTE: we don't do sanity checks on the tree because transfer always decreases the time on the affected variable
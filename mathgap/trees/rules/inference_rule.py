@@ -1,10 +1,15 @@
-from typing import Any, Dict, List, TypeAlias
+from typing import Any, Dict, List, Type, TypeAlias
 from mathgap.logicalforms import LogicalForm
 from mathgap.trees.timing import VariableTimes
 
 Parametrization: TypeAlias = Dict[str, Any]
 
 class InferenceRule:
+    # the type of logical form this rule concludes (None if it can conclude any type)
+    conclusion_type: Type[LogicalForm] = None
+    # whether is_reverse_applicable depends on the tree (otherwise, the rule is applicable to every lf of conclusion_type)
+    requires_tree_check: bool = True
+
     def __init__(self) -> None:
         pass
 
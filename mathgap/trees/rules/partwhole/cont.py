@@ -19,6 +19,9 @@ class ContPartWhole(InferenceRule):
             We know how many entities one agent has, and we know how many entities that agent has compared to the other, 
             thus we know how many entities the other has.            
     """
+    conclusion_type = PartWhole
+    requires_tree_check = False
+
     def is_reverse_applicable(self, conclusion: LogicalForm, tree) -> bool:
         if isinstance(conclusion, PartWhole): return True
         # NOTE: we don't do sanity checks on the tree because agent.entity is already known from the partwhole
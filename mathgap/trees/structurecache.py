@@ -0,0 +1,95 @@
+from typing import TYPE_CHECKING, Any, Dict, List
+from contextlib import contextmanager
+
+from mathgap.util import LRUCache
+
+if TYPE_CHECKING:
+    from mathgap.trees.prooftree import ProofTree
+    from mathgap.exprprogram import ExprProgram
+
+class StructureCache:
+    """
+        Memoizes what only depends on the structure of a tree (see structural_signature) across trees,
+        e.g. datasets with many trees of the same shape that only differ in how their properties are numbered:
+        - time-order constraints: which nodes have to come before each node (i.e. the edges of the time-dag),
+            stored per DFS-position of the nodes
+        - compiled programs: ExprPrograms over the quantities of all inner nodes, stored over the canonical properties
+
+        Lookups return views that are remapped onto the node-ids and properties of the concrete tree.
+
+        Activate it (process-wide) for a block of code with use_structure_cache:
+            with use_structure_cache(StructureCache(max_size=1024)) as cache:
+                generate_mwps(...)
+            print(cache.stats())
+
+        NOTE: computing the structural signature of a tree takes time linear in its size, comparing the times of all pairs of nodes quadratic,
+            thus the cache only pays off if the same (large enough, see STRUCTURE_CACHE_MIN_NODES) structures occur repeatedly
+    """
+    def __init__(self, max_size: int = 1024) -> None:
+        self.time_orders = LRUCache(max_size)
+        self.programs = LRUCache(max_size)
+
+    def time_predecessors(self, tree: 'ProofTree') -> Dict[int, List[int]]:
+        """ 
+            For each node-id of the tree, the ids of the nodes that have to happen before it (see ProofTree.time_predecessors)
+            NOTE: requires that the times of all nodes are up-to-date (i.e. not while they are being refreshed)
+        """
+        signature, _, dfs_nodes = tree.canonical_structure()
+        predecessor_positions = self.time_orders.get(signature)
+        if predecessor_positions is None:
+            predecessors_by_id = tree._compute_time_predecessors()
+            position_by_id = {tree.id_by_node[n]: i for i,n in enumerate(dfs_nodes)}
+            predecessor_positions = tuple([
+                tuple([position_by_id[p_id] for p_id in predecessors_by_id[tree.id_by_node[n]]]) for n in dfs_nodes
+            ])
+            self.time_orders.put(signature, predecessor_positions)
+            return predecessors_by_id
+
+        node_ids = [tree.id_by_node[n] for n in dfs_nodes]
+        return {node_ids[i]: [node_ids[p] for p in positions] for i, positions in enumerate(predecessor_positions)}
+
+    def program(self, tree: 'ProofTree', parameters: List[Any]) -> 'ExprProgram':
+        """
+            ExprProgram over the (simplified) quantities of all inner nodes of the tree (in DFS-order) with respect to parameters
+            NOTE: requires that the tree has been computed symbolically
+        """
+        from mathgap.exprprogram import ExprProgram
+        signature, mapping, dfs_nodes = tree.canonical_structure()
+        # NOTE: the structure doesn't capture if axioms share their quantity, which changes the simplified expressions
+        leaf_quantities = tuple([mapping.get(getattr(q, "identifier", None)) for n in dfs_nodes if n.is_leaf for q in n.logicalform.get_quantities()])
+        key = (signature, leaf_quantities, tuple([mapping.get(p) for p in parameters]))
+        canonical_program = self.programs.get(key)
+        if canonical_program is not None:
+            inverse_mapping = {canonical: prop_key for prop_key, canonical in mapping.items()}
+            return canonical_program.remapped(parameters, inverse_mapping)
+
+        roots = [q.simplified for n in dfs_nodes if not n.is_leaf for q in n.logicalform.get_quantities()]
+        program = ExprProgram(roots, parameters)
+        # NOTE: only programs whose variables are all properties of the tree can be stored canonically
+        if all([p in mapping for p in parameters]) and all([identifier in mapping for _, identifier in program.inputs]):
+            self.programs.put(key, program.remapped([mapping[p] for p in parameters], mapping))
+        return program
+
+    def clear(self):
+        self.time_orders.clear()
+        self.programs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"time_orders": self.time_orders.stats(), "programs": self.programs.stats()}
+
+_ACTIVE_CACHE: StructureCache = None
+
+def active_structure_cache() -> StructureCache | None:
+    """ The cache that trees currently consult (None if caching is off) """
+    return _ACTIVE_CACHE
+
+@contextmanager
+def use_structure_cache(cache: StructureCache | None):
+    """ Makes all trees consult cache within the block (None disables caching), restores the previous cache afterwards """
+    global _ACTIVE_CACHE
+    previous = _ACTIVE_CACHE
+    _ACTIVE_CACHE = cache
+    try:
+        yield cache
+    finally:
+        _ACTIVE_CACHE = previous
@@ -5,6 +5,7 @@ from mathgap.properties import PropertyKey
 class VariableKey:
     def __init__(self, key: List[PropertyKey]) -> None:
         self.variable_key = key
+        self._hash = hash(tuple(key)) # NOTE: keys are immutable and looked up very often (e.g. when building the time-dag)
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, VariableKey): return False
@@ -12,7 +13,14 @@ class VariableKey:
         return all([a == b for a,b in zip(self.variable_key, other.variable_key)])
 
     def __hash__(self) -> int:
-        return hash(tuple(self.variable_key))
+        return self._hash
+
+    def __getstate__(self):
+        # NOTE: hashes of strings differ between processes, thus the hash is recomputed after unpickling
+        return {"variable_key": self.variable_key}
+
+    def __setstate__(self, state):
+        self.__init__(state["variable_key"])
     
     def __repr__(self):
         from mathgap.renderers import TEXT_RENDERER
@@ -34,9 +42,9 @@ class VariableTimes:
             
             # only if it contains an entry for the same variable-key
             other_v_j_times = other.times_by_var[v_i]
-            for v_i_time in v_i_times:
-                for other_v_j_time in other_v_j_times:
-                    if v_i_time < other_v_j_time: return False # self has a variable-key that implies it happens before other
+            if len(v_i_times) == 0 or len(other_v_j_times) == 0: continue
+            # NOTE: some time of self is smaller than some time of other iff the earliest time of self is smaller than the latest of other
+            if min(v_i_times) < max(other_v_j_times): return False # self has a variable-key that implies it happens before other
         return True
     
     def __getitem__(self, key: VariableKey):
@@ -57,17 +65,20 @@ class VariableTimes:
     
     def merge(self, other: 'VariableTimes') -> List[VariableKey]:
         """ Merges the other into self, returns the keys that were present in both """
-        intersection_of_keys = []
-        for v_i, v_i_times in self.times_by_var.items():
-            if not v_i in other.times_by_var: continue # no information to merge
-            
-            intersection_of_keys.append(v_i)
-            self.times_by_var[v_i] = v_i_times.union(other.times_by_var[v_i])
+        if len(self.times_by_var) == 0:
+            # NOTE: fast-path for merging into empty variable-times (e.g. when inferring the times of a conclusion)
+            self.times_by_var.update(other.times_by_var)
+            return []
 
+        intersection_of_keys = []
         for other_v_j, other_v_j_times in other.times_by_var.items():
-            if not other_v_j in self.times_by_var:
+            v_i_times = self.times_by_var.get(other_v_j)
+            if v_i_times is None:
                 # other used variables that aren't present in self
                 self.times_by_var[other_v_j] = other_v_j_times
+            else:
+                intersection_of_keys.append(other_v_j)
+                self.times_by_var[other_v_j] = v_i_times.union(other_v_j_times)
         return intersection_of_keys
     
     def merge_all(self, others: List['VariableTimes']) -> List[VariableKey]:
@@ -1,4 +1,8 @@
 from typing import Dict, List, Tuple, TypeVar, Generic
+from collections import OrderedDict
+import hashlib
+import math
+
 from pydantic import BaseModel, Field
 
 def merge_dicts_with_larger_values(dict1: Dict, dict2: Dict) -> Dict:
@@ -17,6 +21,14 @@ def pretty_print_dict(dict1: Dict, separator=", ") -> str:
     kvs_as_str = [f"{str(k)}: {str(v)}" for k,v in dict1.items()]
     return f"{separator.join(kvs_as_str)}"
 
+def derive_seed(base_seed: int, *indices: int) -> int:
+    """ 
+        Derives a seed in [0, 2**32) from a base seed and a tuple of indices (e.g. problem index and attempt), 
+        s.t. each seed can be computed directly (without replaying all previous ones) 
+    """
+    key = ":".join(str(i) for i in (base_seed,) + indices)
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=4).digest(), "big")
+
 K = TypeVar('K')
 V = TypeVar('V')
 class BaseModelDict(BaseModel, Generic[K, V]):
@@ -45,3 +57,109 @@ class BaseModelDict(BaseModel, Generic[K, V]):
     
     def items(self):
         return self.data_as_dict.items()
+
+class BoundedHashSet:
+    """ 
+        Set of hashes that holds at most max_size elements. 
+        If full, the oldest elements are forgotten first (i.e. duplicates further apart than max_size can no longer be detected).
+    """
+    def __init__(self, max_size: int = 1_000_000) -> None:
+        self.max_size = max_size
+        self._elements: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, element: str):
+        if element in self._elements:
+            self._elements.move_to_end(element)
+            return
+        self._elements[element] = None
+        if len(self._elements) > self.max_size:
+            self._elements.popitem(last=False)
+
+    def __contains__(self, element: str) -> bool:
+        return element in self._elements
+    
+    def __len__(self) -> int:
+        return len(self._elements)
+
+class BloomFilter:
+    """ 
+        Probabilistic set with a fixed memory footprint. 
+        Can have false positives (with probability ~error_rate once capacity elements were added) but never false negatives.
+    """
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 1e-4) -> None:
+        assert capacity > 0 and 0.0 < error_rate < 1.0, "Requires capacity > 0 and error_rate in (0,1)"
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nr_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.nr_hashes = max(1, int(round(self.nr_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.nr_bits + 7) // 8)
+        self._nr_added = 0
+
+    def _bit_positions(self, element: str) -> List[int]:
+        # double hashing: derive all positions from two 64-bit hashes
+        digest = hashlib.blake2b(element.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.nr_bits for i in range(self.nr_hashes)]
+
+    def add(self, element: str):
+        for pos in self._bit_positions(element):
+            self._bits[pos >> 3] |= (1 << (pos & 7))
+        self._nr_added += 1
+
+    def __contains__(self, element: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._bit_positions(element))
+    
+    def __len__(self) -> int:
+        # NOTE: counts all additions (incl. duplicates)
+        return self._nr_added
+
+_MISSING = object()
+
+class LRUCache:
+    """ 
+        Memoizes at most max_size values, if full, the least recently used value is forgotten first.
+        Keeps statistics about hits, misses and evictions.
+    """
+    def __init__(self, max_size: int = 100_000) -> None:
+        assert max_size > 0, "Requires max_size > 0"
+        self.max_size = max_size
+        self._values: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        value = self._values.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._values[key] = value
+        self._values.move_to_end(key)
+        if len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._values.clear()
+
+    def __contains__(self, key) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def stats(self) -> Dict[str, int|float]:
+        nr_lookups = self.hits + self.misses
+        return {
+            "size": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / nr_lookups if nr_lookups > 0 else None
+        }
@@ -0,0 +1,144 @@
+from typing import Any, Dict, Tuple
+from multiprocessing.pool import AsyncResult, Pool
+import multiprocessing
+import random
+import threading
+
+import numpy as np
+
+from mathgap.mathwordproblems import MathWordProblem
+from mathgap.trees.generators import Generator
+from mathgap.instantiate import Instantiator
+from mathgap.trees.sampling.order import OrderSampler
+from mathgap.natlang.templates import ProblemStructureSampler, ProblemStructureAnswersSampler, ProblemStructureRenderer, ReasoningTraceSampler, ReasoningTraceRenderer
+from mathgap.filters import MWPFilter
+from mathgap.util import LRUCache
+
+class VirtualDataset:
+    """
+        Dataset of nr_problems mwps that only stores how to generate them: each problem is materialized on demand from (config, index)
+        through generate_mwp_at (i.e. problem i is identical to the i-th problem of generate_mwps(..., seed_mode="counter")).
+
+        - generator, instantiator, order_sampler: used to generate each problem
+        - templates_and_samplers: as returned by default_templates_and_samplers
+        - seed: base seed from which the seed of each problem is derived
+        - mwp_filter, instantiation_retries, max_repairs: see generate_mwps_iter
+        - cache_size: how many recently materialized mwps are kept in memory
+        - prefetch: how many of the following problems are materialized in a background process after each access (0 = no prefetching).
+            If prefetching a problem fails, the error is raised when the problem is accessed (and the next access materializes it again).
+
+        NOTE: generation reseeds and draws from the process-global random (and numpy.random) state. Problems materialized on access restore 
+            the caller's random state afterwards, prefetched problems are generated in a separate process (with its own random state), 
+            i.e. the random streams of the caller (e.g. shuffling in a training loop) are never affected.
+        NOTE: problems only depend on their index if the generator, instantiator and filter don't carry state across problems
+            (e.g. not for AdaptiveMultiGenerator, StratifiedGenerator or a DedupFilter)
+    """
+    def __init__(self, nr_problems: int, generator: Generator, instantiator: Instantiator, order_sampler: OrderSampler,
+                 templates_and_samplers: Tuple[ProblemStructureSampler, ProblemStructureAnswersSampler, ProblemStructureRenderer, ReasoningTraceSampler, ReasoningTraceRenderer],
+                 seed: int = 14, mwp_filter: MWPFilter = None, instantiation_retries: int = 0, max_repairs: int = 0,
+                 cache_size: int = 1024, prefetch: int = 0) -> None:
+        self.nr_problems = nr_problems
+        self.generator = generator
+        self.instantiator = instantiator
+        self.order_sampler = order_sampler
+        self.templates_and_samplers = templates_and_samplers
+        self.seed = seed
+        self.mwp_filter = mwp_filter
+        self.instantiation_retries = instantiation_retries
+        self.max_repairs = max_repairs
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self._init_runtime_state()
+
+    def _init_runtime_state(self):
+        self._cache = LRUCache(self.cache_size)
+        self._cache_lock = threading.Lock()
+        self._generation_lock = threading.Lock()
+        self._prefetch_pool: Pool = None
+        self._prefetched: Dict[int, AsyncResult] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # NOTE: only the config is pickled (e.g. when sending the dataset to dataloader workers), not the cache or threads
+        state = self.__dict__.copy()
+        for key in ["_cache", "_cache_lock", "_generation_lock", "_prefetch_pool", "_prefetched"]:
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._init_runtime_state()
+
+    def __len__(self) -> int:
+        return self.nr_problems
+
+    def __getitem__(self, index: int) -> MathWordProblem:
+        if index < 0: index += self.nr_problems
+        if not (0 <= index < self.nr_problems): raise IndexError(f"Index {index} out of range for dataset of size {self.nr_problems}")
+
+        mwp = self._cached(index)
+        if mwp is None:
+            with self._cache_lock:
+                prefetched = self._prefetched.pop(index, None)
+            if prefetched is not None:
+                mwp = prefetched.get() # NOTE: raises the error if prefetching failed
+                with self._cache_lock:
+                    self._cache.put(index, mwp)
+        if mwp is None:
+            random_state, np_random_state = random.getstate(), np.random.get_state()
+            try:
+                mwp = self._materialize(index)
+            finally:
+                random.setstate(random_state)
+                np.random.set_state(np_random_state)
+        self._schedule_prefetch(index)
+        return mwp
+
+    def __iter__(self):
+        for i in range(self.nr_problems):
+            yield self[i]
+
+    def _cached(self, index: int) -> MathWordProblem | None:
+        with self._cache_lock:
+            return self._cache.get(index)
+
+    def _materialize(self, index: int) -> MathWordProblem:
+        from mathgap.generation_util import generate_mwp_at # NOTE: avoid circular imports
+
+        with self._generation_lock:
+            mwp = generate_mwp_at(index, self.generator, self.instantiator, self.order_sampler, *self.templates_and_samplers,
+                                  seed=self.seed, mwp_filter=self.mwp_filter,
+                                  instantiation_retries=self.instantiation_retries, max_repairs=self.max_repairs)
+        with self._cache_lock:
+            self._cache.put(index, mwp)
+        return mwp
+
+    def _schedule_prefetch(self, index: int):
+        if self.prefetch <= 0: return
+        with self._cache_lock:
+            if self._prefetch_pool is None:
+                self._prefetch_pool = multiprocessing.Pool(1, initializer=_init_prefetch_worker, initargs=(self,))
+
+            for next_index in range(index + 1, min(index + 1 + self.prefetch, self.nr_problems)):
+                if next_index in self._prefetched or next_index in self._cache: continue
+                self._prefetched[next_index] = self._prefetch_pool.apply_async(_prefetch, (next_index,))
+
+    def close(self):
+        """ Stops the prefetch process (after it has materialized all scheduled problems) """
+        if self._prefetch_pool is not None:
+            self._prefetch_pool.close()
+            self._prefetch_pool.join()
+            self._prefetch_pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            return self._cache.stats()
+
+_PREFETCH_DATASET: VirtualDataset = None
+
+def _init_prefetch_worker(dataset: VirtualDataset):
+    global _PREFETCH_DATASET
+    dataset._init_runtime_state() # NOTE: a forked copy carries the locks of the parent (which might be held at the time of forking)
+    _PREFETCH_DATASET = dataset
+
+def _prefetch(index: int) -> MathWordProblem:
+    return _PREFETCH_DATASET._materialize(index)
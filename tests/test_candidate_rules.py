@@ -0,0 +1,47 @@
+from typing import List
+
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.logicalforms import LogicalForm
+from mathgap.trees.generators import GeneralGenerator
+
+RULESETS = {
+    "nonlinear": NONLINEAR_RULESET,
+    "full_nonlinear": FULL_NONLINEAR_RULESET,
+    "transfer_partwhole": TRANSFER_PARTWHOLE_RULESET,
+    "comp": COMP_RULESET,
+    "transfer": TRANSFER_RULESET,
+    "partwhole": PARTWHOLE_RULESET,
+    "comp_partwhole": COMP_PARTWHOLE_RULESET,
+    "compeq_partwhole": COMPEQ_PARTWHOLE_RULESET,
+}
+
+class FullScanCheckingGenerator(GeneralGenerator):
+    """ Checks every lookup of the applicable rules against checking every rule of the ruleset on the tree """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.nr_checks = 0
+        self.mismatches = []
+
+    def full_scan(self, lf: LogicalForm, tree: ProofTree) -> List[InferenceRule]:
+        return [r for r in self.inference_rules if r.is_reverse_applicable(lf, tree)]
+
+    def applicable_rules(self, lf: LogicalForm, tree: ProofTree) -> List[InferenceRule]:
+        rules = super().applicable_rules(lf, tree)
+        expected = self.full_scan(lf, tree)
+        self.nr_checks += 1
+        if rules != expected: self.mismatches.append((lf, rules, expected))
+        return rules
+
+@pytest.mark.parametrize("ruleset_name", RULESETS.keys())
+def test_candidate_rules_match_full_scan(ruleset_name: str):
+    generator = FullScanCheckingGenerator(start_types=FULL_START_TYPES, inference_rules=RULESETS[ruleset_name], rule_sampling_policy=UNIFORM_POLICY,
+                                          stopping_criterion=BranchDepthCriterion(3))
+    for seed in range(20):
+        tree = generator.generate(seed=seed)
+        # NOTE: also on the finished tree, for every node (not just the ones that were expanded)
+        for node in tree.nodes:
+            generator.applicable_rules(node.logicalform, tree)
+    assert generator.nr_checks > 0
+    assert generator.mismatches == []
@@ -0,0 +1,41 @@
+import time
+
+from mathgap.generation_util import *
+from mathgap.mathwordproblems import MathWordProblem
+from mathgap.natlang.templates.template import WHITESPACE
+from mathgap.trees.generators import GeneralGenerator
+from mathgap.trees.prooftree import TraversalOrder
+
+DEPTH = 1000
+BUDGET = 60.0 # seconds for all stages together
+
+def test_linear_tree_of_depth_1000_within_budget():
+    start = time.perf_counter()
+
+    # NOTE: see benchmarks/deep_trees.py for the choice of generator and instantiator
+    generator = GeneralGenerator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, rule_sampling_policy=UNIFORM_POLICY,
+                                 stopping_criterion=BranchDepthCriterion(DEPTH), comp_same_entity_prob=1.0, time_ordered_bookkeeping=False)
+    instantiator = default_instantiator(leaf_min_value=2, leaf_max_value=10, inner_min_value=2, inner_max_value=10**9, strategy="constructive",
+                                        agents=[f"Person{i}" for i in range(DEPTH + 1)])
+    ps_template_sampler, ps_answers_template_sampler, ps_renderer, rt_template_sampler, rt_renderer = default_templates_and_samplers(end_of_deduction_step_separator=WHITESPACE)
+
+    tree = generator.generate(seed=140499)
+    assert tree.depth == DEPTH
+    assert len(list(tree.traverse(TraversalOrder.POST))) == len(tree.node_by_id)
+
+    instantiation = instantiator.instantiate(tree, seed=140499)
+    answer = tree.root_node.logicalform.get_quantities()[0]
+    parameters = list(answer.free_variables)
+    assert 2 <= answer.eval(instantiation.copy()) <= 10**9
+    assert len(answer.grad(parameters, instantiation.copy())) == len(parameters)
+    assert len(answer.to_str(instantiation.copy(), depth=DEPTH)) > 0
+
+    mwp = MathWordProblem(tree=tree, instantiation=instantiation, ps_template_sampler=ps_template_sampler, answers_template_sampler=ps_answers_template_sampler,
+                          ps_renderer=ps_renderer, rt_template_sampler=rt_template_sampler, rt_renderer=rt_renderer)
+    mwp.sample_problem_order(CANONICAL_ORDER_SAMPLER)
+    mwp.problem_as_nl()
+    mwp.answers_as_nl()
+    mwp.reasoning_trace_as_nl()
+    assert len(mwp.ps_nl) > 0 and len(mwp.answers_nl) > 0 and len(mwp.rt_nl) > 0
+
+    assert time.perf_counter() - start < BUDGET
@@ -0,0 +1,55 @@
+import itertools
+import random
+
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.trees.generators import EnumeratingGenerator
+from mathgap.trees.generators.decisions import ScriptedDecisions
+
+def enumerator(shard_index: int = 0, shard_count: int = 1) -> EnumeratingGenerator:
+    return EnumeratingGenerator(CONT_START_TYPE, COMP_RULESET, UNIFORM_POLICY, BranchDepthCriterion(3), shard_index=shard_index, shard_count=shard_count)
+
+def test_enumerates_distinct_trees():
+    hashes = [tree.structural_hash() for tree in enumerator().enumerate_trees()]
+    assert len(hashes) == len(set(hashes)) > 1
+
+@pytest.mark.parametrize("shard_count", [2, 3])
+def test_shards_partition_the_enumeration(shard_count: int):
+    hashes = set(tree.structural_hash() for tree in enumerator().enumerate_trees())
+    shard_hashes = [[tree.structural_hash() for tree in enumerator(i, shard_count).enumerate_trees()] for i in range(shard_count)]
+    assert sum(len(h) for h in shard_hashes) == len(hashes)
+    assert set().union(*shard_hashes) == hashes
+    assert all(len(h) > 0 for h in shard_hashes)
+
+def test_shards_only_replay_their_own_subtrees():
+    class CountingEnumerator(EnumeratingGenerator):
+        nr_replays = 0
+        def replay(self, prefix):
+            self.nr_replays += 1
+            return super().replay(prefix)
+
+    def nr_replays(shard_index: int, shard_count: int) -> int:
+        generator = CountingEnumerator(CONT_START_TYPE, COMP_RULESET, UNIFORM_POLICY, BranchDepthCriterion(3), shard_index=shard_index, shard_count=shard_count)
+        for _ in generator.enumerate_trees(): pass
+        return generator.nr_replays
+
+    nr_unsharded = nr_replays(0, 1)
+    # NOTE: every shard replays the trees of the split (shared by all shards) and its own subtrees
+    assert all(nr_replays(i, 4) < 0.5 * nr_unsharded for i in range(4))
+
+def test_scripted_shuffle_follows_lexicographic_permutations():
+    for nr_items in range(5):
+        permutations = list(itertools.permutations(range(nr_items)))
+        for idx, permutation in enumerate(permutations):
+            items = list(range(nr_items))
+            decisions = ScriptedDecisions([idx])
+            decisions.shuffle(items)
+            assert tuple(items) == permutation
+            assert decisions.nr_options == [len(permutations)]
+
+def test_scripted_decisions_complete_randomly_beyond_the_script():
+    decisions = ScriptedDecisions([2], rng=random.Random(0))
+    assert decisions.choice(["a", "b", "c"]) == "c"
+    for _ in range(20): decisions.choice(["a", "b", "c"])
+    assert decisions.taken[0] == 2 and len(set(decisions.taken[1:])) > 1
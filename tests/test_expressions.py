@@ -0,0 +1,150 @@
+from typing import Any, List, Tuple
+import numpy as np
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.expressions import Expr, Variable, Const, Addition, Subtraction, Product, Fraction, SignedSum, simplify, topological_order, weighted_grad, weighted_sparse_grad
+from mathgap.exprprogram import ExprProgram
+from mathgap.instantiate.quantities import PositiveRandIntInstantiator
+from mathgap.properties import PropertyKey, PropertyType
+
+def quantity(i: int) -> Variable:
+    return Variable(PropertyKey(PropertyType.QUANTITY, i))
+
+def instantiate(values: List[int]) -> Instantiation:
+    return Instantiation({PropertyKey(PropertyType.QUANTITY, i): v for i, v in enumerate(values)})
+
+def hand_written_roots() -> List[Expr]:
+    """ Expressions with shared subexpressions, chains of additions and subtractions, constants and non-additive operations """
+    a, b, c, d = quantity(0), quantity(1), quantity(2), quantity(3)
+    shared = Subtraction(a, b)
+    chain = Addition(Subtraction(Addition(shared, c), a), d) # NOTE: a cancels out
+    cancelled = Subtraction(Addition(a, b), Addition(b, a))
+    nonlinear = Fraction(Product(Addition(a, Const(2)), shared), Subtraction(Addition(c, d), Const(1)))
+    signed = SignedSum([shared, c, shared], [2, -1, 1], constant=3)
+    return [shared, chain, cancelled, nonlinear, signed]
+
+def tree_roots() -> List[Tuple[List[Expr], Instantiation]]:
+    """ The quantities of generated trees, instantiated s.t. all of them are positive (i.e. no division by zero) """
+    generator = default_generator(start_types=FULL_START_TYPES, inference_rules=FULL_NONLINEAR_RULESET, stopping_criterion=BranchDepthCriterion(3))
+    instantiator = PositiveRandIntInstantiator(inner_max_value=10_000, strategy="constructive")
+    cases = []
+    for seed in range(10):
+        tree = generator.generate(seed=seed)
+        try:
+            instantiation = instantiator.instantiate(tree, seed=seed)
+        except ValueError:
+            continue
+        cases.append(([q for node in tree.nodes for q in node.logicalform.get_quantities()], instantiation))
+    return cases
+
+def all_cases() -> List[Tuple[List[Expr], Instantiation]]:
+    return [(hand_written_roots(), instantiate([7, 3, 5, 11]))] + tree_roots()
+
+def parameters_of(roots: List[Expr]) -> List[Any]:
+    return sorted(set().union(*[r.free_variables for r in roots]), key=lambda p: p.identifier)
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_simplify_matches_eval_and_grad(sparse: bool):
+    for roots, instantiation in all_cases():
+        parameters = parameters_of(roots)
+        expected_values = [r.eval(instantiation.copy()) for r in roots]
+        expected_grads = [r.grad(parameters, instantiation.copy(), sparse=sparse) for r in roots]
+
+        simplified = simplify(roots)
+        assert len(simplified) == len(roots)
+        evaluated = instantiation.copy()
+        for root, s, value, grad in zip(roots, simplified, expected_values, expected_grads):
+            assert s.eval(evaluated) == pytest.approx(value)
+            assert s.grad(parameters, evaluated, sparse=sparse) == pytest.approx(grad)
+            # NOTE: the original expression is evaluated through its simplified expression from now on
+            root.set_simplified(s)
+        for root, value, grad in zip(roots, expected_values, expected_grads):
+            assert root.eval(instantiation.copy()) == pytest.approx(value)
+            assert root.grad(parameters, instantiation.copy(), sparse=sparse) == pytest.approx(grad)
+
+def test_simplify_shrinks_expressions():
+    a, b = quantity(0), quantity(1)
+    cancelled, chain = simplify([Subtraction(Addition(a, b), Addition(b, a)), Addition(Subtraction(a, b), Subtraction(b, a))])
+    assert isinstance(cancelled, Const) and cancelled.value == 0
+    assert isinstance(chain, Const) and chain.value == 0
+
+    shared = Subtraction(a, b)
+    first, second = simplify([Product(Subtraction(a, b), a), Product(shared, a)])
+    assert first.factor1 is second.factor1 # NOTE: identical subexpressions are shared
+
+@pytest.mark.parametrize("simplified", [False, True])
+def test_expr_program_matches_eval_and_grad(simplified: bool):
+    for roots, instantiation in all_cases():
+        parameters = parameters_of(roots)
+        compiled_roots = simplify(roots) if simplified else roots
+        program = ExprProgram(compiled_roots, parameters)
+
+        # a batch of the instantiation and a modified copy of it
+        modified = instantiation.copy()
+        modified.set_even_if_present(parameters[0], modified[parameters[0]] + 1)
+        batch = [instantiation, modified]
+        params = np.array([[inst[p] for inst in batch] for p in parameters], dtype=float)
+        values = program.evaluate(params, instantiation)
+        root_values = program.roots(values)
+        for i, root in enumerate(roots):
+            for j, inst in enumerate(batch):
+                assert root_values[i, j] == pytest.approx(root.eval(inst.copy()))
+
+        # the vector-jacobian product with one-hot weights is the gradient of a single root
+        for i, root in enumerate(roots):
+            root_weights = np.zeros(shape=(len(roots), len(batch)))
+            root_weights[i] = 1.0
+            grads = program.vjp(values, root_weights)
+            for j, inst in enumerate(batch):
+                assert grads[:, j] == pytest.approx(root.grad(parameters, inst.copy()))
+
+def test_expr_program_inputs_are_fixed_variables():
+    a, b = quantity(0), quantity(1)
+    program = ExprProgram([Product(a, b)], [a.identifier])
+    values = program.evaluate(np.array([[2.0, 3.0]]), instantiate([0, 5]))
+    assert program.roots(values)[0] == pytest.approx([10.0, 15.0])
+    assert program.vjp(values, np.ones(shape=(1, 2)))[0] == pytest.approx([5.0, 5.0])
+
+def test_eval_names_missing_variable():
+    with pytest.raises(KeyError, match="not instantiated"):
+        Addition(quantity(0), quantity(5)).eval(instantiate([1, 2]))
+
+def test_grad_memo_respects_wrt_vars():
+    a, b = quantity(0), quantity(1)
+    expr = Product(a, b)
+    instantiation = instantiate([3, 5])
+    wrt_vars = [a.identifier, b.identifier]
+    assert expr.grad(wrt_vars, instantiation) == pytest.approx([5.0, 3.0])
+    # NOTE: modifying the list in-place must not return the gradient memoized for its previous content
+    wrt_vars.reverse()
+    assert expr.grad(wrt_vars, instantiation) == pytest.approx([3.0, 5.0])
+    # equal lists hit the memo
+    assert expr.grad([b.identifier, a.identifier], instantiation) is expr.grad(wrt_vars, instantiation)
+
+def root_weights(nr_roots: int, kind: str) -> List[float]:
+    rng = np.random.default_rng(nr_roots)
+    if kind == "random": return list(rng.uniform(-2.0, 2.0, size=nr_roots))
+    if kind == "with_zeros": return [0.0 if i % 2 == 0 else w for i, w in enumerate(rng.uniform(-2.0, 2.0, size=nr_roots))]
+    if kind == "one_hot": return [1.0 if i == nr_roots - 1 else 0.0 for i in range(nr_roots)]
+    if kind == "zero": return [0.0 for _ in range(nr_roots)]
+    raise ValueError(kind)
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("weights_kind", ["random", "with_zeros", "one_hot", "zero"])
+def test_weighted_grad_matches_weighted_sum_of_grads(sparse: bool, weights_kind: str):
+    for roots, instantiation in all_cases():
+        # NOTE: the same root twice shares all of its subexpressions with itself (its weights add up)
+        roots = roots + [roots[0]]
+        parameters = parameters_of(roots)
+        weights = root_weights(len(roots), weights_kind)
+        expected = sum([w * r.grad(parameters, instantiation.copy()) for r, w in zip(roots, weights)], np.zeros(len(parameters)))
+
+        for order in [None, topological_order(roots)]:
+            if sparse:
+                coefficients = weighted_sparse_grad(roots, weights, instantiation.copy(), order=order)
+                assert set(coefficients.keys()).issubset(parameters)
+                assert [coefficients.get(p, 0.0) for p in parameters] == pytest.approx(expected)
+            else:
+                assert weighted_grad(roots, weights, parameters, instantiation.copy(), order=order) == pytest.approx(expected)
+
@@ -0,0 +1,44 @@
+from mathgap.generation_util import *
+from mathgap.filters import DedupFilter
+from mathgap.util import BloomFilter
+
+def generate_comparisons(nr_problems: int, seed: int = 14) -> List[MathWordProblem]:
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(2))
+    instantiator = default_instantiator()
+    return generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers(), seed=seed)
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=1e-3)
+    elements = [f"element{i}" for i in range(1000)]
+    for element in elements: bloom.add(element)
+    assert all(element in bloom for element in elements)
+    assert len(bloom) == 1000
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=1e-2)
+    for i in range(1000): bloom.add(f"element{i}")
+    nr_false_positives = sum(f"other{i}" in bloom for i in range(10_000))
+    assert nr_false_positives < 10_000 * 1e-2 * 3
+
+def test_dedup_filter_drops_repeated_mwps():
+    mwps = generate_comparisons(10)
+    for dedup in [DedupFilter(), DedupFilter(max_size=100)]:
+        accepted = [dedup.accept(mwp) for mwp in mwps]
+        assert not any(dedup.accept(mwp) for mwp in mwps)
+        assert dedup.nr_accepted == sum(accepted)
+        assert dedup.nr_dropped == dedup.nr_seen - dedup.nr_accepted
+
+def test_dedup_filter_by_structure():
+    mwps = generate_comparisons(20)
+    dedup = DedupFilter(by_structure=True, by_surface=False)
+    accepted = [mwp for mwp in mwps if dedup.accept(mwp)]
+    assert len(set(mwp.tree.structural_hash() for mwp in accepted)) == len(accepted)
+    assert len(accepted) == len(set(mwp.tree.structural_hash() for mwp in mwps))
+    assert 0 < dedup.nr_structure_duplicates == len(mwps) - len(accepted)
+
+def test_dedup_filter_by_surface():
+    mwps = generate_comparisons(10)
+    dedup = DedupFilter(by_structure=False, by_surface=True, max_size=100)
+    assert all(dedup.accept(mwp) for mwp in mwps)
+    assert not any(dedup.accept(mwp) for mwp in mwps)
+    assert dedup.nr_surface_duplicates == len(mwps)
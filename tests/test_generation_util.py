@@ -0,0 +1,50 @@
+from typing import Dict
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.util import derive_seed
+
+def pipeline():
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=NONLINEAR_RULESET, stopping_criterion=BranchDepthCriterion(2),
+                                  comp_same_entity_prob=1.0, compeq_same_entity_prob=1.0)
+    return generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers()
+
+def as_record(mwp: MathWordProblem):
+    return mwp.ps_nl, mwp.rt_nl, mwp.answers_nl, mwp.numerical_answers, mwp.tree.structural_hash()
+
+def test_derive_seed():
+    assert derive_seed(14, 3, 0) == derive_seed(14, 3, 0)
+    assert 0 <= derive_seed(14, 3, 0) < 2**32
+    seeds = set(derive_seed(base_seed, index, attempt) for base_seed in [14, 15] for index in range(100) for attempt in range(10))
+    assert len(seeds) == 2 * 100 * 10
+    # NOTE: the indices are separated, i.e. (1, 23) and (12, 3) don't collide
+    assert derive_seed(14, 1, 23) != derive_seed(14, 12, 3)
+
+def test_generate_mwp_at_matches_counter_stream():
+    mwps = generate_mwps(8, *pipeline(), seed=140499, seed_mode="counter")
+    for index in [0, 3, 7]:
+        assert as_record(generate_mwp_at(index, *pipeline(), seed=140499)) == as_record(mwps[index])
+
+def test_counter_stream_resumes_at_start_index():
+    mwps = generate_mwps(8, *pipeline(), seed=140499, seed_mode="counter")
+    later = generate_mwps(3, *pipeline(), seed=140499, seed_mode="counter", start_index=5)
+    assert [as_record(mwp) for mwp in later] == [as_record(mwp) for mwp in mwps[5:]]
+
+def stratified_generator(quotas: Dict[int, int]) -> StratifiedGenerator:
+    """ Linear comparisons stratified by their depth """
+    generators_by_stratum = {
+        depth: default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(min(depth, 2)))
+        for depth in quotas.keys()
+    }
+    return StratifiedGenerator(generators_by_stratum, quotas, stratum_of=lambda tree: tree.depth)
+
+def test_generate_stratified_mwps_fills_quotas():
+    generator = stratified_generator({1: 2, 2: 3})
+    mwps = generate_stratified_mwps(generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers())
+    assert sorted(mwp.tree.depth for mwp in mwps) == [1, 1, 2, 2, 2]
+
+def test_generate_stratified_mwps_reports_unmet_quotas():
+    # NOTE: no generator produces trees of depth 3
+    generator = stratified_generator({1: 1, 3: 2})
+    with pytest.raises(GenerationStalledError, match=r"\{3: 2\}"):
+        generate_stratified_mwps(generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers(), max_attempts=50)
@@ -0,0 +1,49 @@
+from mathgap.generation_util import *
+from mathgap.properties import PropertyType
+from mathgap.trees.prooftree import ProofTree
+
+def generate_trees(nr_trees: int = 20):
+    generator = default_generator(start_types=FULL_START_TYPES, inference_rules=FULL_NONLINEAR_RULESET, stopping_criterion=BranchDepthCriterion(2))
+    return [generator.generate(seed=seed) for seed in range(nr_trees)]
+
+def renumber_agents(tree: ProofTree) -> ProofTree:
+    """ Copy of the tree where the agents are numbered in reverse """
+    renumbered = tree.copy()
+    agent_ids = sorted(set(
+        pk.identifier
+        for node in renumbered.traverse()
+        for prop_key in node.logicalform.get_available_properties().values()
+        for pk in (prop_key if isinstance(prop_key, list) else [prop_key])
+        if pk.property_type == PropertyType.AGENT
+    ))
+    new_id = dict(zip(agent_ids, reversed(agent_ids)))
+    for node in renumbered.traverse():
+        lf = node.logicalform
+        for name, prop_key in lf.get_available_properties().items():
+            if isinstance(prop_key, list):
+                if all(pk.property_type == PropertyType.AGENT for pk in prop_key):
+                    lf[name] = [new_id[pk.identifier] for pk in prop_key]
+            elif prop_key.property_type == PropertyType.AGENT:
+                lf[name] = new_id[prop_key.identifier]
+    return renumbered
+
+def test_structural_hash_invariant_under_copy():
+    for tree in generate_trees():
+        assert tree.copy().structural_hash() == tree.structural_hash()
+
+def test_structural_hash_invariant_under_renumbering():
+    nr_renumbered = 0
+    for tree in generate_trees():
+        renumbered = renumber_agents(tree)
+        assert renumbered.structural_hash() == tree.structural_hash()
+        nr_renumbered += any(
+            a.logicalform.get_available_properties() != b.logicalform.get_available_properties()
+            for a, b in zip(tree.traverse(), renumbered.traverse())
+        )
+    assert nr_renumbered > 0 # NOTE: otherwise the test didn't change any tree
+
+def test_structural_hash_differs_between_structures():
+    trees = generate_trees(50)
+    signatures = set(repr(tree.canonical_structure()[0]) for tree in trees)
+    hashes = set(tree.structural_hash() for tree in trees)
+    assert len(hashes) == len(signatures) > 1
@@ -0,0 +1,48 @@
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.instantiate import InstantiationError
+from mathgap.instantiate.quantities import PositiveRandIntInstantiator
+from mathgap.trees.prooftree import ProofTree
+
+STRATEGIES = ["random", "cpga", "cpga_multistart", "constructive", "local_search"]
+
+def generate_trees() -> List[ProofTree]:
+    trees = []
+    for start_types, inference_rules, depth in [(CONT_START_TYPE, COMP_RULESET, 3), (CONT_START_TYPE, TRANSFER_RULESET, 3),
+                                                (PARTWHOLE_START_TYPE, TRANSFER_PARTWHOLE_RULESET, 2), (FULL_START_TYPES, FULL_NONLINEAR_RULESET, 2)]:
+        generator = default_generator(start_types=start_types, inference_rules=inference_rules, stopping_criterion=BranchDepthCriterion(depth))
+        trees.extend(generator.generate(seed=seed) for seed in range(5))
+    return trees
+
+def is_within_bounds(tree: ProofTree, instantiation: Instantiation, leaf_bounds: Tuple[int, int], inner_bounds: Tuple[int, int]) -> bool:
+    """ Checks the bounds of all quantities independently of the instantiator """
+    for node in tree.traverse():
+        lo, hi = leaf_bounds if node.is_leaf else inner_bounds
+        for quantity in node.logicalform.get_quantities():
+            value = quantity.eval(instantiation)
+            if not (lo <= value <= hi and float(value).is_integer()): return False
+    return True
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_strategy_yields_valid_instantiations(strategy: str):
+    instantiator = PositiveRandIntInstantiator(leaf_min_value=2, leaf_max_value=20, inner_min_value=2, inner_max_value=1000,
+                                               strategy=strategy, max_attempts=10_000, nr_starts=32)
+    nr_instantiated = 0
+    trees = generate_trees()
+    for seed, tree in enumerate(trees):
+        try:
+            instantiation = instantiator.instantiate(tree, seed=seed)
+        except InstantiationError:
+            continue
+        nr_instantiated += 1
+        assert instantiator.is_valid_instantiation(tree, instantiation)
+        assert is_within_bounds(tree, instantiation, (2, 20), (2, 1000))
+    assert nr_instantiated == len(trees)
+
+def test_constructive_strategy_raises_instantiation_error_if_infeasible():
+    # NOTE: the tree adds a leaf (>= 50) to an inner node, which can never stay within the bounds of the inner nodes (<= 10)
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(3))
+    instantiator = PositiveRandIntInstantiator(leaf_min_value=50, leaf_max_value=60, inner_min_value=2, inner_max_value=10, strategy="constructive")
+    with pytest.raises(InstantiationError):
+        instantiator.instantiate(generator.generate(seed=0), seed=0)
@@ -0,0 +1,67 @@
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.leakage import LeakageIndex, LeakageFilter
+
+def test_leakage_index_round_trip(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    index = LeakageIndex(path)
+    index.add("eval", "Alice has 5 apples.  How many apples does Alice have?", structure_hash="a" * 32)
+    index.add_records("train", [
+        {"problem": "Bob has 3 pears. How many pears does Bob have?", "structure_hash": "b" * 32},
+        {"problem": "Carol has 7 plums. How many plums does Carol have?"}, # NOTE: structure_hash is optional
+    ])
+    index.close()
+
+    # reopening the index (e.g. in another run) returns everything that has been added
+    index = LeakageIndex(path)
+    assert index.datasets() == ["eval", "train"]
+    assert index.structure_hashes() == set(["a" * 32, "b" * 32])
+    assert index.structure_hashes(["train"]) == set(["b" * 32])
+    assert len(index.problem_hashes()) == 3
+    assert len(index.problem_hashes(["eval"])) == 1
+
+    # problems are matched after normalizing casing and whitespace
+    assert index.contains_problem("alice has 5 apples. how many apples does alice have?")
+    assert index.contains_problem("Alice has 5 apples. How many apples does Alice have?", ["eval"])
+    assert not index.contains_problem("Alice has 5 apples. How many apples does Alice have?", ["train"])
+    assert not index.contains_problem("Alice has 6 apples. How many apples does Alice have?")
+    assert index.contains_structure("b" * 32)
+    assert not index.contains_structure("b" * 32, ["eval"])
+    index.close()
+
+def test_leakage_index_ignores_duplicates(tmp_path):
+    index = LeakageIndex(str(tmp_path / "index.sqlite"))
+    for _ in range(3):
+        index.add("eval", "Alice has 5 apples.", structure_hash="a" * 32)
+    assert len(index.problem_hashes()) == 1
+    assert len(index.structure_hashes()) == 1
+    index.close()
+
+def test_leakage_filter_drops_indexed_mwps(tmp_path):
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(2))
+    mwps = generate_mwps(10, generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers())
+    index = LeakageIndex(str(tmp_path / "index.sqlite"))
+    index.add_mwps("eval", mwps[:5])
+
+    for preload in [True, False]:
+        by_surface = LeakageFilter(index, by_structure=False, by_surface=True, preload=preload)
+        assert not any(by_surface.accept(mwp) for mwp in mwps[:5])
+        assert all(by_surface.accept(mwp) for mwp in mwps[5:])
+
+        by_structure = LeakageFilter(index, by_structure=True, by_surface=False, preload=preload)
+        indexed_structures = set(mwp.tree.structural_hash() for mwp in mwps[:5])
+        assert [by_structure.accept(mwp) for mwp in mwps] == [mwp.tree.structural_hash() not in indexed_structures for mwp in mwps]
+    index.close()
+
+def test_generation_stalls_if_every_structure_is_indexed(tmp_path):
+    # NOTE: there's only few linear trees of depth 1, all of them end up in the index
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(1))
+    index = LeakageIndex(str(tmp_path / "index.sqlite"))
+    index.add_records("eval", ({"structure_hash": generator.generate(seed=seed).structural_hash()} for seed in range(200)))
+    leakage_filter = LeakageFilter(index, by_structure=True, by_surface=False)
+
+    with pytest.raises(GenerationStalledError, match="LeakageFilter rejected 50 mwps in a row"):
+        generate_mwps(1, generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers(), 
+                      mwp_filter=leakage_filter, max_consecutive_rejections=50)
+    index.close()
@@ -0,0 +1,144 @@
+import io
+import json
+import random
+
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.filters import MWPFilter
+from mathgap.metrics import GenerationMetrics, InMemoryMetrics, JsonlMetricsSink, PeriodicSummarySink, FailureAnalytics
+from mathgap.trees.generators import MultiGenerator, AdaptiveMultiGenerator
+
+class RejectEveryOtherFilter(MWPFilter):
+    def __init__(self) -> None:
+        self.nr_seen = 0
+
+    def accept(self, mwp: MathWordProblem) -> bool:
+        self.nr_seen += 1
+        return self.nr_seen % 2 == 0
+
+def generate_with_failures(metrics: GenerationMetrics, nr_problems: int = 5):
+    """ Generates linear comparisons where some trees can't be instantiated (the inner nodes are barely larger than the leaves) and every other mwp is filtered """
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(3))
+    instantiator = default_instantiator(inner_max_value=14, max_attempts=50)
+    generate_mwps(nr_problems, generator, instantiator, CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers(),
+                  mwp_filter=RejectEveryOtherFilter(), metrics=metrics)
+
+def test_in_memory_metrics_attribute_failures_to_stages():
+    in_memory = InMemoryMetrics()
+    generate_with_failures(GenerationMetrics([in_memory]))
+    summary = in_memory.summary()
+
+    assert summary["accepted"] == 5
+    assert summary["attempts"] == summary["accepted"] + summary["failed"]
+    nr_instantiation_failures = sum(count for reason, count in summary["failures"].items() if reason.startswith("instantiate: "))
+    nr_filter_failures = sum(count for reason, count in summary["failures"].items() if reason.startswith("filter: "))
+    assert nr_instantiation_failures > 0 and nr_filter_failures > 0
+    assert nr_instantiation_failures + nr_filter_failures == summary["failed"]
+
+    # every attempt generates and instantiates, only the instantiated ones are rendered and filtered
+    stages = summary["stages"]
+    assert stages["generate"]["count"] == stages["instantiate"]["count"] == summary["attempts"]
+    assert stages["render"]["count"] == stages["filter"]["count"] == summary["attempts"] - nr_instantiation_failures
+    assert all(s["total_s"] >= s["max_s"] > 0 for s in stages.values())
+    assert summary["instantiation"]["attempts"] >= summary["attempts"]
+
+def test_jsonl_metrics_sink_writes_one_event_per_attempt(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    in_memory = InMemoryMetrics()
+    metrics = GenerationMetrics([in_memory, JsonlMetricsSink(path, flush_every=1)])
+    generate_with_failures(metrics)
+    metrics.close()
+
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f]
+    assert len(events) == in_memory.nr_attempts
+    assert sum(e["accepted"] for e in events) == 5
+    for event in events:
+        if event["accepted"]:
+            assert event["failure_stage"] is None
+            assert set(event["stage_times"].keys()) == set(["generate", "instantiate", "sample_problem_order", "compute_answers", "render", "filter"])
+        elif event["failure_stage"] == "instantiate":
+            assert set(event["stage_times"].keys()) == set(["generate", "instantiate"])
+            assert event["failure_details"]["violations_by_depth"]
+        else:
+            assert event["failure_stage"] == "filter"
+            assert event["failure_reason"] == "rejected by RejectEveryOtherFilter"
+
+def test_periodic_summary_sink_prints_every_n_accepted():
+    out = io.StringIO()
+    metrics = GenerationMetrics([PeriodicSummarySink(every_n=2, out=out)])
+    generate_with_failures(metrics)
+    metrics.close()
+
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3 # NOTE: after 2 and 4 accepted mwps and once more when closing
+    assert "accepted 2/" in lines[0] and "accepted 4/" in lines[1] and "accepted 5/" in lines[2]
+    assert "generate=" in lines[-1] and "render=" in lines[-1]
+
+def test_generation_metrics_outside_of_an_attempt():
+    metrics = GenerationMetrics([InMemoryMetrics()])
+    assert metrics._current_stage is None
+    # NOTE: e.g. instantiate_with_retries called directly, none of these must fail
+    metrics.set_instantiation_stats({"attempts": 3})
+    metrics.set_failure_details({"violations_by_depth": {}})
+    with metrics.stage("instantiate"): pass
+    assert metrics._current_stage == "instantiate"
+
+def test_failure_analytics_groups_violations_by_depth():
+    # NOTE: the leaves are larger than the inner nodes are allowed to be, i.e. instantiation is bound to fail
+    generator = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(3))
+    instantiator = PositiveRandIntInstantiator(leaf_min_value=50, leaf_max_value=60, inner_min_value=2, inner_max_value=10, strategy="random", max_attempts=10)
+    tree = generator.generate(seed=0)
+    with pytest.raises(InstantiationError) as error:
+        instantiator.instantiate(tree, seed=0)
+
+    analytics = FailureAnalytics()
+    metrics = GenerationMetrics([analytics])
+    metrics.start_attempt(seed=0)
+    with metrics.stage("generate"): pass
+    metrics.set_tree_stats(tree)
+    with metrics.stage("instantiate"): pass
+    metrics.set_failure_details(error.value.details())
+    metrics.end_attempt(accepted=False, failure_reason=str(error.value))
+    report = analytics.report()
+
+    expected = {}
+    for node, kind in error.value.violations:
+        expected.setdefault(node.depth, {}).setdefault(kind, 0)
+        expected[node.depth][kind] += 1
+    assert len(expected) > 1 # NOTE: violations at multiple depths
+    assert report["violations_by_depth"] == dict(sorted(expected.items()))
+    assert report["acceptance_rate_by_depth"] == {3: 0.0}
+    assert report["failures_by_stage"] == {"instantiate": 1}
+    assert report["violated_rules"] == {"ContCompCont": sum(1 for node, _ in error.value.violations if node.rule is not None)}
+    assert report["wasted_time_share"] == 1.0
+
+def test_adaptive_multi_generator_keeps_the_accepted_mix():
+    """
+        Trees of the easy generator are accepted 90% of the time, those of the hard generator only 20% of the time.
+        The adaptive generator estimates both acceptance rates and samples the hard generator more often (weight / acceptance rate),
+        s.t. both contribute about equally many accepted trees (as requested by their weights), unlike the plain MultiGenerator.
+    """
+    easy = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(1))
+    hard = default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(2))
+    acceptance_probability = {easy: 0.9, hard: 0.2}
+
+    def accepted_share_of_hard(multi: MultiGenerator) -> float:
+        rng = random.Random(0)
+        nr_accepted = {easy: 0, hard: 0}
+        for seed in range(1000):
+            tree = multi.generate(seed=seed)
+            accepted = rng.random() < acceptance_probability[multi.last_generator]
+            if accepted: nr_accepted[multi.last_generator] += 1
+            multi.feedback(tree, accepted)
+        return nr_accepted[hard] / (nr_accepted[easy] + nr_accepted[hard])
+
+    adaptive = AdaptiveMultiGenerator({easy: 1.0, hard: 1.0})
+    assert 0.4 < accepted_share_of_hard(adaptive) < 0.6
+    assert adaptive.acceptance_rate(easy) == pytest.approx(0.9, abs=0.1)
+    assert adaptive.acceptance_rate(hard) == pytest.approx(0.2, abs=0.1)
+    easy_weight, hard_weight = adaptive.sampling_weights()
+    assert hard_weight > 3 * easy_weight
+
+    assert accepted_share_of_hard(MultiGenerator({easy: 1.0, hard: 1.0})) < 0.3
@@ -0,0 +1,59 @@
+import csv
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPERIMENT_FOLDER = os.path.join(REPO_ROOT, "experiments", "opedal24_ood_eval")
+sys.path.insert(0, EXPERIMENT_FOLDER)
+from plan import compile_plan, run_plan # NOTE: the experiment is a script, not part of the package
+from datasets import RECORD_FIELDS, generate_linear_comparison, generate_linear_transfer
+
+DATA_FOLDER = os.path.join(EXPERIMENT_FOLDER, "data")
+
+def two_dataset_plan(out_folder: str):
+    return {
+        "seed": 140499,
+        "chunk_size": 2,
+        "datasets": [
+            {"name": "comparison", "kind": "linear_comparison", "out_path": os.path.join(out_folder, "comparison.csv"), "nr_problems": 5,
+             "params": {"min_depth": 1, "max_depth": 2}},
+            {"name": "transfer", "kind": "linear_transfer", "out_path": os.path.join(out_folder, "transfer.csv"), "nr_problems": 3, "seed": 7,
+             "params": {"min_depth": 1, "max_depth": 2}},
+            {"name": "empty", "kind": "linear_transfer", "out_path": os.path.join(out_folder, "empty.csv"), "nr_problems": 0,
+             "params": {"min_depth": 1, "max_depth": 2}},
+        ]
+    }
+
+def read_rows(path: str):
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames, list(reader)
+
+def as_rows(records):
+    return [{k: str(v) for k, v in r.items()} for r in records]
+
+@pytest.mark.parametrize("nr_workers", [1, 2])
+def test_plan_matches_single_runs(tmp_path, nr_workers: int):
+    compiled = compile_plan(two_dataset_plan(str(tmp_path)), default_data_folder=DATA_FOLDER)
+    assert compiled.resources() == {"generators": 2, "instantiators": 1, "templates": 1}
+    run_plan(compiled, nr_workers=nr_workers)
+
+    comparison = generate_linear_comparison(5, 1, 2, seed=140499, data_folder=DATA_FOLDER, seed_mode="counter")
+    transfer = generate_linear_transfer(3, 1, 2, seed=7, data_folder=DATA_FOLDER, seed_mode="counter")
+    assert read_rows(str(tmp_path / "comparison.csv")) == (RECORD_FIELDS, as_rows(comparison))
+    assert read_rows(str(tmp_path / "transfer.csv")) == (RECORD_FIELDS, as_rows(transfer))
+    assert read_rows(str(tmp_path / "empty.csv")) == (RECORD_FIELDS, [])
+
+@pytest.mark.parametrize("modify,message", [
+    (lambda plan: plan["datasets"][0].update(kind="unknown"), "Unknown kind"),
+    (lambda plan: plan["datasets"][0]["params"].pop("max_depth"), "requires the params"),
+    (lambda plan: plan["datasets"][1].update(name="comparison"), "own name"),
+    (lambda plan: plan["datasets"][1].update(out_path=plan["datasets"][0]["out_path"]), "own out_path"),
+])
+def test_bad_plans_are_rejected(tmp_path, modify, message: str):
+    plan = two_dataset_plan(str(tmp_path))
+    modify(plan)
+    with pytest.raises(AssertionError, match=message):
+        compile_plan(plan, default_data_folder=DATA_FOLDER)
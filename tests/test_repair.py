@@ -0,0 +1,103 @@
+from typing import Set
+
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.generation_util import instantiate_with_repairs
+from mathgap.instantiate.quantities import InstantiationError
+from mathgap.trees.generators import EnumeratingGenerator, GeneralGenerator
+from mathgap.trees.prooftree import TreeNode, property_keys
+
+def nonlinear_generator() -> GeneralGenerator:
+    return default_generator(start_types=CONT_START_TYPE, inference_rules=NONLINEAR_RULESET, stopping_criterion=BranchDepthCriterion(3))
+
+def deepest_inner_node(tree: ProofTree) -> TreeNode:
+    return max([n for n in tree.nodes if not n.is_leaf], key=lambda n: n.depth)
+
+def subtree_of(node: TreeNode) -> Set[TreeNode]:
+    """ All nodes below node """
+    nodes = set([])
+    stack = list(node.child_nodes)
+    while len(stack) > 0:
+        n = stack.pop(-1)
+        nodes.add(n)
+        stack.extend(n.child_nodes)
+    return nodes
+
+def assert_consistent(tree: ProofTree):
+    """ The tree is valid, its incrementally maintained times match a full recomputation and exactly the used property ids are tracked """
+    assert tree.validate()
+    assert set(tree.times_by_node.keys()) == set(tree.nodes)
+    times = {node: dict(vts.times_by_var) for node, vts in tree.times_by_node.items()}
+    tree._refresh_complete_variable_times()
+    assert times == {node: vts.times_by_var for node, vts in tree.times_by_node.items()}
+
+    used_keys = set([k for n in tree.nodes for k in property_keys(n.logicalform)])
+    for property_type, ids in tree.property_tracker.used_ids.items():
+        assert sorted(ids) == sorted(k.identifier for k in used_keys if k.property_type == property_type)
+
+def test_remove_derivation_and_repair_keep_the_tree_consistent():
+    generator = nonlinear_generator()
+    for seed in range(10):
+        tree = generator.generate(seed=seed)
+        node = deepest_inner_node(tree)
+        removed_nodes = tree.remove_derivation(node.logicalform)
+        assert len(removed_nodes) > 0 and node.is_leaf
+        assert_consistent(tree)
+
+        assert generator.repair(tree, node, seed=seed)
+        assert not node.is_leaf
+        assert_consistent(tree)
+
+class FailingOnceInstantiator(Instantiator):
+    """ Instantiates like the wrapped instantiator, but the first instantiation is reported as violating the bounds of some node """
+    def __init__(self, instantiator: Instantiator, violating_node: TreeNode) -> None:
+        self.instantiator = instantiator
+        self.violating_node = violating_node
+        self.failed_instantiation = None
+
+    def instantiate(self, tree: ProofTree, instantiation: Instantiation = None, skip_existing: bool = False, seed: int = 14) -> Instantiation:
+        instantiation = self.instantiator.instantiate(tree, instantiation, skip_existing, seed)
+        if self.failed_instantiation is None:
+            self.failed_instantiation = instantiation
+            raise InstantiationError("forced failure", tree, instantiation, [(self.violating_node, "too_large")], elapsed=0.0)
+        return instantiation
+
+def test_forced_failure_is_repaired():
+    generator = nonlinear_generator()
+    # NOTE: a single repair (without retries), i.e. only the forced failure is repaired.
+    #   For seed 0 the kept quantities outside of the subtree are infeasible for any regenerated subtree (which would require a second repair)
+    for seed in range(1, 6):
+        tree = generator.generate(seed=seed)
+        tree.compute_symbolically()
+        node = deepest_inner_node(tree)
+        old_subtree = subtree_of(node)
+        outside_nodes = set(tree.nodes).difference(old_subtree)
+        instantiator = FailingOnceInstantiator(default_instantiator(inner_max_value=10**6, max_attempts=1000), node)
+
+        instantiation = instantiate_with_repairs(tree, generator, instantiator, nr_retries=0, max_repairs=1, seed=seed, metrics=GenerationMetrics())
+        assert instantiator.failed_instantiation is not None
+        assert subtree_of(node).isdisjoint(old_subtree) # NOTE: the subtree has been regenerated
+        assert_consistent(tree)
+
+        # the non-quantity properties outside of the regenerated subtree are kept
+        kept_keys = set([k for n in outside_nodes for k in property_keys(n.logicalform) if k.property_type != PropertyType.QUANTITY])
+        assert len(kept_keys) > 0
+        for key in kept_keys:
+            assert instantiation[key] == instantiator.failed_instantiation[key]
+
+        # all nodes are within their bounds
+        for n in tree.nodes:
+            for q in n.logicalform.get_quantities():
+                value = q.eval(instantiation.copy())
+                if n.is_leaf: assert 2 <= value <= 10
+                else: assert 2 <= value <= 10**6
+
+def test_failure_is_reraised_if_the_generator_cannot_repair():
+    generator = EnumeratingGenerator(CONT_START_TYPE, COMP_RULESET, UNIFORM_POLICY, BranchDepthCriterion(2))
+    tree = generator.generate()
+    tree.compute_symbolically()
+    instantiator = FailingOnceInstantiator(default_instantiator(), deepest_inner_node(tree))
+    with pytest.raises(InstantiationError, match="forced failure") as error:
+        instantiate_with_repairs(tree, generator, instantiator, nr_retries=0, max_repairs=2, seed=14, metrics=GenerationMetrics())
+    assert error.value.instantiation is instantiator.failed_instantiation
@@ -0,0 +1,45 @@
+import os
+import sys
+
+from click.testing import CliRunner
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "experiments", "opedal24_ood_eval"))
+import generate # NOTE: the experiment cli is a script, not part of the package
+
+def run(*args: str):
+    result = CliRunner().invoke(generate.cli, list(args))
+    assert result.exit_code == 0, result.output
+    return result
+
+def test_merged_shards_equal_single_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT) # NOTE: the cli locates its data relative to the working directory
+    options = ["-n", "7", "--max-depth", "2", "-s", "140499", "--seed-mode", "counter"]
+
+    single_path = str(tmp_path / "single.csv")
+    run("linear-transfer", "-o", single_path, *options)
+
+    shard_paths = [str(tmp_path / f"shard{i}.csv") for i in range(3)]
+    for i, shard_path in enumerate(shard_paths):
+        run("linear-transfer", "-o", shard_path, *options, "--shard-index", str(i), "--shard-count", "3")
+    merged_path = str(tmp_path / "merged.csv")
+    run("merge", "-o", merged_path, *reversed(shard_paths)) # NOTE: the shards are ordered by their manifests
+
+    with open(single_path) as single, open(merged_path) as merged:
+        assert merged.read() == single.read()
+
+def test_merge_rejects_missing_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    options = ["-n", "4", "--max-depth", "2", "--seed-mode", "counter", "--shard-count", "2"]
+    shard_path = str(tmp_path / "shard0.csv")
+    run("linear-transfer", "-o", shard_path, *options, "--shard-index", "0")
+
+    result = CliRunner().invoke(generate.cli, ["merge", "-o", str(tmp_path / "merged.csv"), shard_path])
+    assert result.exit_code != 0
+    assert "exactly once" in result.output
+
+def test_sharding_requires_counter_seeds(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    result = CliRunner().invoke(generate.cli, ["linear-transfer", "-o", str(tmp_path / "shard.csv"), "-n", "4", "--shard-count", "2"])
+    assert result.exit_code != 0
+    assert "--seed-mode counter" in result.output
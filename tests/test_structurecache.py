@@ -0,0 +1,111 @@
+from typing import Any, List, Tuple
+
+import numpy as np
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.expressions import Expr
+from mathgap.logicalforms import ComparisonType
+from mathgap.properties import PropertyTracker
+from mathgap.trees.generators import Generator
+from mathgap.trees.prooftree import STRUCTURE_CACHE_MIN_NODES
+from mathgap.trees.structurecache import StructureCache, use_structure_cache
+import mathgap.trees.generators.general as general
+
+SHIFT = 100
+
+class ShiftedPropertyTracker(PropertyTracker):
+    """ Numbers the properties starting at SHIFT + 1 (instead of 1) """
+    def request_id(self, property_type: PropertyType) -> int:
+        next_free_id = max(SHIFT, SHIFT, *self.used_ids[property_type]) + 1
+        self.used_ids[property_type].append(next_free_id)
+        return next_free_id
+
+def comparison_generator() -> Generator:
+    # NOTE: a single type of comparison, s.t. there are only a few structures of trees
+    return default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(6),
+                             comp_same_entity_prob=1.0, comp_allowed_comparisons=[ComparisonType.MORE_THAN])
+
+def inner_quantities(tree: ProofTree) -> List[Expr]:
+    """ The quantities of all inner nodes in the order of StructureCache.program """
+    _, _, dfs_nodes = tree.canonical_structure()
+    return [q.simplified for n in dfs_nodes if not n.is_leaf for q in n.logicalform.get_quantities()]
+
+def parameters_of(tree: ProofTree) -> List[Any]:
+    """ All variables but the first one (which remains an input of the program) """
+    return sorted(set().union(*[q.free_variables for q in inner_quantities(tree)]), key=lambda p: p.identifier)[1:]
+
+@pytest.fixture
+def identical_trees(monkeypatch):
+    """ Two trees of the same structure, whose properties are numbered differently """
+    tree = comparison_generator().generate(seed=3)
+    monkeypatch.setattr(general, "PropertyTracker", ShiftedPropertyTracker)
+    other_tree = comparison_generator().generate(seed=3)
+    assert len(tree.node_by_id) >= STRUCTURE_CACHE_MIN_NODES
+    assert tree.structural_hash() == other_tree.structural_hash()
+    assert set(parameters_of(tree)).isdisjoint(parameters_of(other_tree))
+    return tree, other_tree
+
+def test_remapped_program_matches_eval_and_grad(identical_trees):
+    tree, other_tree = identical_trees
+    cache = StructureCache()
+    cache.program(tree, parameters_of(tree))
+    parameters = parameters_of(other_tree)
+    program = cache.program(other_tree, parameters)
+    assert cache.stats()["programs"]["hits"] == 1
+
+    instantiation = default_instantiator(strategy="cpga_multistart").instantiate(other_tree, seed=3)
+    modified = instantiation.copy()
+    modified.set_even_if_present(parameters[0], modified[parameters[0]] + 1)
+    batch = [instantiation, modified]
+    params = np.array([[inst[p] for inst in batch] for p in parameters], dtype=float)
+    values = program.evaluate(params, instantiation)
+    quantities = inner_quantities(other_tree)
+    for j, inst in enumerate(batch):
+        assert program.roots(values)[:, j] == pytest.approx([q.eval(inst.copy()) for q in quantities])
+        for i, q in enumerate(quantities):
+            root_weights = np.zeros(shape=(len(quantities), len(batch)))
+            root_weights[i] = 1.0
+            assert program.vjp(values, root_weights)[:, j] == pytest.approx(q.grad(parameters, inst.copy()))
+
+def test_cached_time_predecessors_are_remapped(identical_trees):
+    tree, other_tree = identical_trees
+    cache = StructureCache()
+    assert cache.time_predecessors(tree) == tree._compute_time_predecessors()
+    assert cache.time_predecessors(other_tree) == other_tree._compute_time_predecessors()
+    assert cache.stats()["time_orders"]["hits"] == 1
+
+class AlternatingGenerator(Generator):
+    """ Alternates between the trees of two seeds of the wrapped generator (i.e. the same structures occur repeatedly) """
+    def __init__(self, generator: Generator) -> None:
+        super().__init__(generator.start_types, generator.inference_rules, generator.stopping_criterion)
+        self.generator = generator
+
+    def generate(self, seed: int = 14) -> ProofTree:
+        return self.generator.generate(seed=seed % 2)
+
+def test_structure_cache_doesnt_change_the_output():
+    def generate(cache: StructureCache | None) -> List[Tuple]:
+        with use_structure_cache(cache):
+            mwps = generate_mwps(6, AlternatingGenerator(comparison_generator()), default_instantiator(strategy="cpga_multistart", inner_max_value=1000),
+                                 CANONICAL_ORDER_SAMPLER, *default_templates_and_samplers(), seed=3)
+        return [(mwp.ps_nl, mwp.rt_nl, mwp.numerical_answers) for mwp in mwps]
+
+    cache = StructureCache()
+    assert generate(cache) == generate(None)
+    assert cache.stats()["programs"]["hits"] >= 4
+
+def test_structure_cache_evicts_least_recently_used(identical_trees):
+    tree, other_tree = identical_trees
+    different_tree = comparison_generator().generate(seed=4)
+    assert different_tree.structural_hash() != tree.structural_hash()
+
+    cache = StructureCache(max_size=1)
+    cache.time_predecessors(tree)
+    cache.time_predecessors(different_tree) # NOTE: evicts the structure of tree
+    cache.time_predecessors(other_tree)
+    cache.time_predecessors(other_tree)
+    assert cache.stats()["time_orders"] == {"size": 1, "hits": 1, "misses": 3, "evictions": 2, "hit_rate": 0.25}
+
+    cache.clear()
+    assert cache.stats()["time_orders"]["size"] == cache.stats()["programs"]["size"] == 0
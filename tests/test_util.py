@@ -0,0 +1,33 @@
+from mathgap.util import LRUCache
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1 # NOTE: "a" is now more recently used than "b"
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_lru_cache_put_refreshes_existing_keys():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert cache.get("a") == 10
+    assert "b" not in cache
+    assert cache.evictions == 1
+
+def test_lru_cache_stats():
+    cache = LRUCache(max_size=1)
+    assert cache.stats()["hit_rate"] is None
+    assert cache.get("a", default="missing") == "missing"
+    cache.put("a", None) # NOTE: None is a valid value, not a miss
+    assert cache.get("a", default="missing") is None
+    cache.put("b", 2)
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 1, "hit_rate": 0.5}
+
+    cache.clear()
+    assert len(cache) == 0 and "b" not in cache
@@ -0,0 +1,83 @@
+import os
+import random
+import time
+
+import numpy as np
+import pytest
+
+from mathgap.generation_util import *
+from mathgap.trees.generators import Generator
+from mathgap.virtualdataset import VirtualDataset
+
+class FailingInBackgroundGenerator(Generator):
+    """ Generates like the wrapped generator, except in other processes (i.e. when prefetching) """
+    def __init__(self, generator: Generator) -> None:
+        super().__init__(generator.start_types, generator.inference_rules, generator.stopping_criterion)
+        self.generator = generator
+        self.pid = os.getpid()
+
+    def generate(self, seed: int = 14) -> ProofTree:
+        if os.getpid() != self.pid:
+            raise RuntimeError("failing in the background")
+        return self.generator.generate(seed=seed)
+
+def comparison_generator() -> Generator:
+    return default_generator(start_types=CONT_START_TYPE, inference_rules=COMP_RULESET, stopping_criterion=BranchDepthCriterion(2))
+
+def test_virtual_dataset_matches_counter_stream():
+    templates_and_samplers = default_templates_and_samplers()
+    mwps = generate_mwps(5, comparison_generator(), default_instantiator(), CANONICAL_ORDER_SAMPLER, *templates_and_samplers, seed=7, seed_mode="counter")
+    dataset = VirtualDataset(5, comparison_generator(), default_instantiator(), CANONICAL_ORDER_SAMPLER, templates_and_samplers, seed=7)
+    assert [mwp.ps_nl for mwp in dataset] == [mwp.ps_nl for mwp in mwps]
+    assert dataset[-1].ps_nl == mwps[-1].ps_nl
+
+def test_virtual_dataset_restores_random_state():
+    dataset = VirtualDataset(3, comparison_generator(), default_instantiator(), CANONICAL_ORDER_SAMPLER, default_templates_and_samplers())
+    random.seed(123)
+    np.random.seed(123)
+    expected = (random.random(), np.random.rand())
+
+    random.seed(123)
+    np.random.seed(123)
+    dataset[1]
+    assert (random.random(), np.random.rand()) == expected
+
+def test_prefetching_keeps_the_callers_random_state():
+    templates_and_samplers = default_templates_and_samplers()
+    mwps = generate_mwps(6, comparison_generator(), default_instantiator(), CANONICAL_ORDER_SAMPLER, *templates_and_samplers, seed=7, seed_mode="counter")
+    dataset = VirtualDataset(6, comparison_generator(), default_instantiator(), CANONICAL_ORDER_SAMPLER, templates_and_samplers, seed=7, prefetch=5)
+
+    random.seed(123)
+    np.random.seed(123)
+    dataset[0]
+    # NOTE: the caller keeps drawing from its random streams while the remaining problems are prefetched
+    nr_draws = 0
+    deadline = time.perf_counter() + 1.0
+    while time.perf_counter() < deadline:
+        random.random()
+        np.random.rand()
+        nr_draws += 1
+    state = (random.getstate(), np.random.get_state()[1].tolist())
+
+    random.seed(123)
+    np.random.seed(123)
+    for _ in range(nr_draws):
+        random.random()
+        np.random.rand()
+    assert state == (random.getstate(), np.random.get_state()[1].tolist())
+
+    assert [mwp.ps_nl for mwp in dataset] == [mwp.ps_nl for mwp in mwps]
+    assert len(dataset._prefetched) == 0 # NOTE: all prefetched problems have been accessed
+    dataset.close()
+
+def test_prefetch_errors_are_raised_on_access():
+    generator = FailingInBackgroundGenerator(comparison_generator())
+    dataset = VirtualDataset(5, generator, default_instantiator(), CANONICAL_ORDER_SAMPLER, default_templates_and_samplers(), prefetch=2)
+    dataset[0]
+    dataset.close() # NOTE: waits until the prefetch process has tried to materialize problems 1 and 2
+
+    with pytest.raises(RuntimeError, match="failing in the background"):
+        dataset[1]
+    # the next access materializes the problem again
+    assert dataset[1].ps_nl is not None
+    dataset.close()
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+from mathgap.data import util
+from mathgap.data.util import DATA_FOLDER, clear_vocabulary_cache, load_agents, load_attributes, load_entities, read_word_list
+
+@pytest.fixture
+def nr_reads(monkeypatch):
+    """ Counts how often a word list is read from disk (starting with an empty cache) """
+    reads = []
+    def counting_read_word_list(path: str):
+        reads.append(path)
+        return read_word_list(path)
+    monkeypatch.setattr(util, "read_word_list", counting_read_word_list)
+    clear_vocabulary_cache()
+    yield lambda: len(reads)
+    clear_vocabulary_cache()
+
+def test_vocabulary_is_read_once(nr_reads):
+    agents = load_agents()
+    assert nr_reads() == 1
+    assert load_agents() == agents
+    assert nr_reads() == 1
+    load_entities()
+    load_entities()
+    assert nr_reads() == 2
+
+def test_cached_vocabulary_returns_copies(nr_reads):
+    agents = load_agents()
+    agents.append("Nobody")
+    entities = load_entities()
+    entities["entities_without_units"].clear()
+    entities["parts_by_whole"].clear()
+
+    assert "Nobody" not in load_agents()
+    assert len(load_entities()["entities_without_units"]) > 0
+    assert len(load_entities()["parts_by_whole"]) > 0
+    assert nr_reads() == 2
+
+def test_modified_file_invalidates_cache(nr_reads, tmp_path):
+    data_folder = str(tmp_path)
+    shutil.copytree(os.path.join(DATA_FOLDER, "agents"), os.path.join(data_folder, "agents"))
+    path = os.path.join(data_folder, "agents", "v1", "agents.csv")
+    agents = load_agents(data_folder=data_folder)
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("Nobody\n")
+    mtime = os.path.getmtime(path) + 10 # NOTE: the mtime might not change otherwise if the filesystem's resolution is coarse
+    os.utime(path, (mtime, mtime))
+
+    assert load_agents(data_folder=data_folder) == agents + ["Nobody"]
+    assert nr_reads() == 2
+
+@pytest.mark.parametrize("path,loader", [
+    (os.path.join(DATA_FOLDER, "agents", "v1", "agents.csv"), lambda: load_agents()),
+    (os.path.join(DATA_FOLDER, "attributes", "v1", "attributes.csv"), lambda: load_attributes()),
+    (os.path.join(DATA_FOLDER, "entities", "v1", "entities.csv"), lambda: load_entities()["entities_without_units"]),
+])
+def test_read_word_list_matches_pandas(path, loader):
+    pd = pytest.importorskip("pandas")
+    expected = list(pd.read_csv(path, index_col=False, names=["word"])["word"])
+    assert read_word_list(path) == expected
+    assert loader() == expected